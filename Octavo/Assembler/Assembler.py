@@ -8,17 +8,73 @@ from Resolver       import Resolver
 from Configuration  import Configuration
 from Generator      import Generator
 from Operators      import Operators
+from Profile        import Branch_Profile, Branch_Prediction
+from Estimate       import Cycle_Estimate
 
-from sys import argv
+from argparse import ArgumentParser
+from sys      import exit
 
 if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Assemble an Octavo program into memory images.")
+    arguments.add_argument("source")
+    arguments.add_argument("--profile", default = None, help = "Simulator counters (JSON) to choose auto branch predictions")
+    arguments.add_argument("--preload-state", dest = "preload_state", action = "store_true",
+                           help = "write the startup init loads into initial Programmed Offset and branch memory images instead of code")
+    arguments.add_argument("--hoist-init", dest = "hoist_init", action = "store_true",
+                           help = "move loop-invariant init load writes to the start of the program")
+    arguments.add_argument("--allocate-liveness", dest = "allocate_liveness", action = "store_true",
+                           help = "share branch detector entries and pointer slots between users which are never live at once")
+    arguments.add_argument("--schedule-opcodes", dest = "schedule_opcodes", action = "store_true",
+                           help = "choose opcode decoder slots and place runtime opcode loads, instead of the source loads")
+    arguments.add_argument("--assign-banks", dest = "assign_banks", action = "store_true",
+                           help = "place variables in A or B memory to fit all their reads, instead of by first read")
+    arguments.add_argument("--place-data", dest = "place_data", action = "store_true",
+                           help = "as --assign-banks, also balancing the A and B memories and fitting the literal pool")
+    arguments.add_argument("--schedule-ports", dest = "schedule_ports", action = "store_true",
+                           help = "space port reads after port writes by the port latencies, moving instructions or adding nops")
+    arguments.add_argument("--peephole", action = "store_true",
+                           help = "fold copies and branch-only instructions into their neighbours, and remove zero register writes")
+    arguments.add_argument("--strip-dead", dest = "strip_dead", action = "store_true",
+                           help = "remove unreachable code, dead branches, unaccessed pointers, and unreferenced data")
+    arguments.add_argument("--pack-offsets", dest = "pack_offsets", action = "store_true",
+                           help = "size each thread's default offset to its private data, instead of an equal share")
+    arguments.add_argument("--dedup-private", dest = "dedup_private", action = "store_true",
+                           help = "move private variables never written and identical in all threads to shared memory")
+    arguments.add_argument("--shared-count", dest = "shared_count", type = int, default = None,
+                           help = "words of shared memory at the start of data memory, which must match the hardware (default 32)")
+    arguments.add_argument("--lanes", type = int, default = 1,
+                           help = "SIMD lanes: also write the A and B memories of each lane past lane 0, and check control flow is shared")
+    arguments.add_argument("--estimate", action = "store_true",
+                           help = "report static cycle estimates per loop iteration, per element, and per run")
+    arguments.add_argument("--element-loop", dest = "element_loop", default = None,
+                           help = "label inside the loop which processes elements (default: the innermost loop)")
+    arguments.add_argument("--elements-per-iteration", dest = "elements_per_iteration", type = int, default = 1,
+                           help = "elements processed by each iteration of the element loop")
+    arguments.add_argument("--cycle-budget", dest = "cycle_budget", type = float, default = None,
+                           help = "fail if the estimated cycles per element exceed this (implies --estimate)")
+    options = arguments.parse_args()
+
     operators       = Operators()
     configuration   = Configuration()
+    if options.shared_count is not None:
+        configuration.set_shared_count(options.shared_count)
+    configuration.preload_reset_state = options.preload_state
+    configuration.hoist_init_loads    = options.hoist_init
+    configuration.allocate_by_liveness = options.allocate_liveness
+    configuration.schedule_opcodes     = options.schedule_opcodes
+    configuration.assign_banks         = options.assign_banks
+    configuration.place_data           = options.place_data
+    configuration.schedule_ports       = options.schedule_ports
+    configuration.peephole             = options.peephole
+    configuration.strip_dead           = options.strip_dead
+    configuration.pack_offsets         = options.pack_offsets
+    configuration.dedup_private        = options.dedup_private
+    configuration.lane_count           = options.lanes
     data            = Data(configuration)
     code            = Code(data, configuration, operators)
     commands        = Commands(data, code)
     parser          = Parser(commands)
-    parser.parse_file(argv[1])
+    parser.parse_file(options.source)
     # Won't need these after Parsing and Allocation.
     # So let's enforce that for our own discipline.
     # State is carried in Code and Data.
@@ -26,6 +82,12 @@ if __name__ == "__main__":
     del commands
     print("Parsing and Allocation Done")
 
+    profile = None
+    if options.profile is not None:
+        profile = Branch_Profile(options.profile)
+    prediction = Branch_Prediction(code, configuration, profile)
+    prediction.assign()
+
     # Dump initial state of code and data
     # immediately after Allocation
     configuration.filedump("LOG.allocate")
@@ -52,5 +114,16 @@ if __name__ == "__main__":
     data.filedump("LOG.generate", append = True)
     code.filedump("LOG.generate", append = True)
 
+    if options.estimate is True or options.cycle_budget is not None:
+        estimate = Cycle_Estimate(data, code, configuration, operators, profile)
+        cycles   = estimate.report(options.element_loop, options.elements_per_iteration)
+        if options.cycle_budget is not None:
+            if cycles is None:
+                print("Cycle budget: no element loop to estimate")
+                exit(1)
+            if cycles > options.cycle_budget:
+                print("Cycle budget exceeded: {0:.3f} cycles/element, budget {1}".format(cycles, options.cycle_budget))
+                exit(1)
+
     print("OK")
 
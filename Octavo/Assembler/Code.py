@@ -4,6 +4,7 @@ from sys            import exit
 from Debug          import Debug
 from Utility        import Utility
 from Opcode_Manager import Opcode_Manager
+from Data           import Pointer_Variable
 from bitstring      import BitArray
 
 
@@ -20,7 +21,7 @@ class Condition (Debug):
 class Instruction (Debug):
     """Contains symbolic information to assemble the bit representation of an instruction""" 
 
-    def __init__ (self, label = None, address = None, opcode = None, D = None, DA = None, DB = None, A = None, B = None):
+    def __init__ (self, label = None, address = None, opcode = None, D = None, DA = None, DB = None, A = None, B = None, source = None):
         Debug.__init__(self)
         self.label      = label
         self.address    = address
@@ -30,14 +31,26 @@ class Instruction (Debug):
         self.DB         = DB
         self.A          = A
         self.B          = B
+        # (filename, line number, line) of the source line which created this instruction
+        self.source     = source
+
+    def describe (self):
+        """The source file, line and code (without comment) which created this instruction, for reports. Else its label."""
+        if self.source is None:
+            return str(self.label)
+        (filename, line, text) = self.source
+        return "{0}:{1} {2}".format(filename, line, text.split("#")[0].strip())
 
 class Initialization_Load (Debug, Utility):
     """Contains info necessary to generate an initialization load instructions and data.
        The instruction is always an 'Add to Zero', so must exist in the system.
-       The destination is a code or data label identifying the pointer or branch."""
+       The destination is a code or data label identifying the pointer or branch.
+       Each config word needs its own instruction: only Rb reaches the write-only
+       H memory, and a dual (split) write's DA can only reach A memory."""
 
     # variable locations are resolved based on which instruction operand reads them first.
     # keep a toggle here to evenly distribute init data between A and B memories.
+    # An init load can instead set its own memory. See Optimizer.Data_Placement
     memory = "A"
 
     def toggle_memory (self):
@@ -58,6 +71,8 @@ class Initialization_Load (Debug, Utility):
         self.init_data      = []
         self.data           = data
         self.code           = code
+        # The init instructions come from the init line, not from wherever they get added
+        self.source         = code.source
         # keep any init instructions added later in order,
         # so add list of init instructions to global list
         self.code.instructions.append(self.instructions)
@@ -81,7 +96,7 @@ class Initialization_Load (Debug, Utility):
         # Check if we gave a literal number or BitArray, which becomes an unnnamed shared variable
         label = self.try_int(label)
         if type(label) == int or type(label) == BitArray:
-            new_init_data = self.data.resolve_shared_value(label, Initialization_Load.memory)
+            new_init_data = self.data.resolve_shared_value(label, self.memory)
             self.init_data.append(new_init_data)
             return new_init_data
         if type(label) == str:
@@ -96,16 +111,16 @@ class Initialization_Load (Debug, Utility):
     def add_instruction (self, label, branch_destination, data_label):
         """Adds an instruction to initialization load. Remains in sequence added."""
         self.code.check_duplicate_instruction_label(label)
-        if Initialization_Load.memory == "A":
+        if self.memory == "A":
             A = data_label
             B = 0
-        elif Initialization_Load.memory == "B":
+        elif self.memory == "B":
             A = 0
             B = data_label
         else:
-            print("Invalid memory {0} as branch init data {1} location".format(Initialization_Load.memory, data_label))
+            print("Invalid memory {0} as branch init data {1} location".format(self.memory, data_label))
         add_opcode = self.code.opcodes.resolve_opcode("add")
-        new_instruction = Instruction(label = label, opcode = add_opcode, D = branch_destination, A = A, B = B)
+        new_instruction = Instruction(label = label, opcode = add_opcode, D = branch_destination, A = A, B = B, source = self.source)
         self.instructions.append(new_instruction)
         return new_instruction
 
@@ -146,6 +161,8 @@ class Branch (Debug):
             self.counter    = branch_parameters.pop(0)
 
         self.destination = branch_parameters.pop(0)
+        # The destination gets resolved to an address, but the label still names the branch
+        self.destination_label = self.destination
         if len(branch_parameters) > 0:
             print("Unparsed branch parameters {0} for branch {1}".format(branch_parameters, condition_label))
             self.ask_for_debugger()
@@ -154,6 +171,17 @@ class Branch (Debug):
         # so we need to know which instruction so we know the branch origin, which will be
         # resolved after all the instructions are resolved and given addresses.
         self.instruction = code.instructions[-1]
+        self.source      = code.source
+        # Set when allocated a Branch Detector entry
+        self.bd_index    = None
+        # Added to the destination address. See Profile.Branch_Prediction.
+        self.destination_offset = 0
+        # The init load write to the Branch Detector entry
+        self.init_instruction   = None
+        # All the init load writes for this branch: detector, sentinels, masks, counter
+        self.init_instructions  = []
+        # Set by drop_branch, after which the entries can be reused
+        self.dropped            = False
 
 class Usage (Debug):
     """Keeps track of used reconfigurable resources, such as opcodes, branch detectors, their counters, etc...
@@ -182,6 +210,13 @@ class Usage (Debug):
         
     def allocate_next (self, label, resource, usage_flags, index = None):
         """Return the first free allocation index and resource address, or do so at provided index if available."""
+        if self.configuration.allocate_by_liveness is True:
+            # Virtual entries past the end of the resource, which get a real
+            # entry later. See Optimizer.Liveness_Allocation
+            if index is None and None not in usage_flags:
+                usage_flags.append(None)
+            while index is not None and index >= len(usage_flags):
+                usage_flags.append(None)
         if index is None:
             try:
                 index = usage_flags.index(None)
@@ -193,17 +228,34 @@ class Usage (Debug):
                 print("Label {0}: Allocation conflict for {1} at index {2}.".format(label, usage_flags, index))
                 self.ask_for_debugger()
         usage_flags[index] = label
-        address = resource[index]
+        address = resource[index % len(resource)]
         return address, index
 
+    def free (self, label, usage_flags, index):
+        """Mark the entry at index free again, for reuse by a later allocation."""
+        if usage_flags[index] != label:
+            print("Label {0}: cannot free index {1} of {2}, which it does not hold.".format(label, index, usage_flags))
+            self.ask_for_debugger()
+        usage_flags[index] = None
+
     def allocate_bd (self, label):
         address, index = self.allocate_next(label, self.configuration.memory_map.bd, self.bd_in_use)
         return address, index
 
-    def allocate_po (self, label, operand):
-        address, index = self.allocate_next(label, self.configuration.memory_map.po[operand], self.po_in_use[operand])
+    def free_branch (self, label, index):
+        """Free a Branch Detector entry, and the counter, sentinel and mask entries allocated with it."""
+        self.free(label, self.bd_in_use, index)
+        for usage_flags in [self.bc_in_use] + list(self.sentinel_in_use.values()) + list(self.mask_in_use.values()):
+            if usage_flags[index] is not None:
+                self.free(label, usage_flags, index)
+
+    def allocate_po (self, label, operand, index = None):
+        address, index = self.allocate_next(label, self.configuration.memory_map.po[operand], self.po_in_use[operand], index)
         return address
 
+    def free_po (self, label, operand, index):
+        self.free(label, self.po_in_use[operand], index)
+
     def allocate_sentinel_mask (self, label, operand, index):
         # Allocate together to make sure the allocate_next() internal indexes always match
         sentinel_addr, dummy_index = self.allocate_next(label, self.configuration.memory_map.sentinel[operand], self.sentinel_in_use[operand], index)
@@ -233,6 +285,12 @@ class Code (Debug, Utility):
         self.conditions     = []
         self.branches       = []
         self.initial_pc     = []
+        # Init loads replaced by initial memory contents. See Resolver.resolve_reset_loads()
+        self.reset_loads    = []
+        # (pointer label, code entry after which it is dropped, or None if before any code)
+        self.pointer_drops  = []
+        # Source line currently being parsed
+        self.source         = None
 
     def __str__ (self):
         output = "\nCode:\n"
@@ -250,6 +308,9 @@ class Code (Debug, Utility):
         output += "Initial PC: " + str(self.initial_pc) + "\n"
         return output
 
+    def set_source (self, filename, line_number, line):
+        self.source = (filename, line_number, line)
+
     def allocate_init_load (self, label, destination):
         new_init_load = Initialization_Load(self.data, self, label = label, destination = destination)
         self.init_loads.append(new_init_load)
@@ -291,6 +352,13 @@ class Code (Debug, Utility):
                 return instruction
         return None
 
+    # Why an instruction cannot get another in front of it, or lose its label, if lands_past_label()
+    landed_past_label = "a branch lands past its label"
+
+    def lands_past_label (self, label):
+        """Does a branch land at an offset past this label? It must then stay on the same instruction."""
+        return label is not None and any(branch.destination_label == label and branch.destination_offset != 0 for branch in self.branches)
+
     def check_duplicate_instruction_label (self, label):
         if label is not None:
             instruction = self.lookup_instruction(label)
@@ -301,19 +369,19 @@ class Code (Debug, Utility):
     def allocate_instruction_simple (self, opcode_label, instruction_label, D, A, B):
         self.check_duplicate_instruction_label(instruction_label)
         resolved_opcode = self.opcodes.resolve_opcode(opcode_label)
-        new_instruction = Instruction(label = instruction_label, opcode = resolved_opcode, D = D, A = A, B = B)
+        new_instruction = Instruction(label = instruction_label, opcode = resolved_opcode, D = D, A = A, B = B, source = self.source)
         self.instructions.append(new_instruction)
 
     def allocate_instruction_dual (self, opcode_label, instruction_label, DA, DB, A, B):
         self.check_duplicate_instruction_label(instruction_label)
         resolved_opcode = self.opcodes.resolve_opcode(opcode_label)
-        new_instruction = Instruction(label = instruction_label, opcode = resolved_opcode, DA = DA, DB = DB, A = A, B = B)
+        new_instruction = Instruction(label = instruction_label, opcode = resolved_opcode, DA = DA, DB = DB, A = A, B = B, source = self.source)
         self.instructions.append(new_instruction)
 
     def allocate_instruction (self, opcode_label, operands):
         opcode_number = self.opcodes.resolve_opcode(opcode_label)
         opcode        = self.opcodes.lookup_opcode(opcode_number)
-        if opcode.is_dual is True:
+        if opcode.is_dual() is True:
             self.allocate_instruction_dual(opcode_label, *operands)
         else:
             self.allocate_instruction_simple(opcode_label, *operands)
@@ -331,6 +399,9 @@ class Code (Debug, Utility):
         # branch in question later.
 
         branch = Branch(self, condition_label, branch_parameters)
+        if any(dropped.dropped is True and dropped.destination_label == branch.destination for dropped in self.branches):
+            print("Branch {0} to {1}: the branch to {1} was already dropped.".format(condition_label, branch.destination))
+            self.ask_for_debugger()
         branch.init_load = self.lookup_init_load(branch.destination)
         self.branches.append(branch)
 
@@ -338,32 +409,57 @@ class Code (Debug, Utility):
         data_label = branch.destination + "_init"
         branch.init_load.add_shared(data_label)
         bd_addr, bd_index = self.usage.allocate_bd(condition_label)
-        branch.init_load.add_instruction(branch.init_load.label, bd_addr, data_label)
+        branch.bd_index   = bd_index
+        branch.init_instruction = branch.init_load.add_instruction(branch.init_load.label, bd_addr, data_label)
+        branch.init_instructions.append(branch.init_instruction)
 
         # Then add any instr/data to init other hardware if necessary
 
         if branch.sentinel_a is not None:
             (sentinel_addr, mask_addr) = self.usage.allocate_sentinel_mask(condition_label, "A", bd_index)
             branch.init_load.add_shared(branch.sentinel_a)
-            branch.init_load.add_instruction(None, sentinel_addr, branch.sentinel_a)
+            branch.init_instructions.append(branch.init_load.add_instruction(None, sentinel_addr, branch.sentinel_a))
             branch.init_load.add_shared(branch.mask_a)
-            branch.init_load.add_instruction(None, mask_addr, branch.mask_a)
+            branch.init_instructions.append(branch.init_load.add_instruction(None, mask_addr, branch.mask_a))
 
         if branch.sentinel_b is not None:
             (sentinel_addr, mask_addr) = self.usage.allocate_sentinel_mask(condition_label, "B", bd_index)
             branch.init_load.add_shared(branch.sentinel_b)
-            branch.init_load.add_instruction(None, sentinel_addr, branch.sentinel_b)
+            branch.init_instructions.append(branch.init_load.add_instruction(None, sentinel_addr, branch.sentinel_b))
             branch.init_load.add_shared(branch.mask_b)
-            branch.init_load.add_instruction(None, mask_addr, branch.mask_b)
+            branch.init_instructions.append(branch.init_load.add_instruction(None, mask_addr, branch.mask_b))
 
         if branch.counter is not None:
             bc_addr = self.usage.allocate_bc(condition_label, bd_index)
             branch.init_load.add_shared(branch.counter)
-            branch.init_load.add_instruction(None, bc_addr, branch.counter)
+            branch.init_instructions.append(branch.init_load.add_instruction(None, bc_addr, branch.counter))
 
         # Next init code/data will use the other data memory to even out their use
         branch.init_load.toggle_memory()
 
+    def drop_branch (self, destination):
+        """Free the Branch Detector entries of the branches to destination, so later branches can reuse them.
+           The hardware entries keep their old contents until the init load of the next branch overwrites them."""
+        branches = [branch for branch in self.branches if branch.destination_label == destination and branch.dropped is False]
+        if len(branches) == 0:
+            print("No branch to {0} to drop.".format(destination))
+            self.ask_for_debugger()
+        for branch in branches:
+            self.usage.free_branch(branch.condition.label, branch.bd_index)
+            branch.dropped = True
+
+    def drop_pointer (self, label):
+        """Record where a pointer is dropped. Its slot is freed at Resolution, as slots are only allocated then."""
+        pointer = self.data.lookup_variable_name(label)
+        if type(pointer) is not Pointer_Variable:
+            print("Cannot drop {0}: not a pointer ({1}).".format(label, pointer))
+            self.ask_for_debugger()
+        if label in [dropped for dropped, entry in self.pointer_drops]:
+            print("Pointer {0} is already dropped.".format(label))
+            self.ask_for_debugger()
+        entry = self.instructions[-1] if len(self.instructions) > 0 else None
+        self.pointer_drops.append((label, entry))
+
     def set_pc (self, label, pc_list):
         pc_count = len(pc_list)
         if pc_count != self.configuration.thread_count:
@@ -375,3 +471,7 @@ class Code (Debug, Utility):
         opcode = self.opcodes.lookup_opcode(instruction.opcode)
         return opcode.is_dual()
 
+    def is_instruction_commutative (self, instruction):
+        opcode = self.opcodes.lookup_opcode(instruction.opcode)
+        return opcode.is_commutative()
+
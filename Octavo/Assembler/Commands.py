@@ -11,6 +11,9 @@ class Commands (Debug):
         self.data = data
         self.code = code
 
+    def set_source (self, filename, line_number, line):
+        self.code.set_source(filename, line_number, line)
+
     def search_command(self, command):
         """Look for the command in the built-ins, and previously-defined opcodes and branch conditions."""
         assembler   = getattr(self, command, None) is not None
@@ -95,7 +98,7 @@ class Commands (Debug):
         if label is None:
             print("No label found. Private variables MUST be named. Variable value(s) in declaration: {0}".format(values))
             self.ask_for_debugger()
-        self.data.allocate_private(label, values)
+        self.data.allocate_private(label, values, lanes = self.data.current_lanes)
 
     def shared (self, arguments):
         """Declare a shared variable. One or more space-delimited integers as arguments. May or may not have a name (label)."""
@@ -112,6 +115,34 @@ class Commands (Debug):
             self.ask_for_debugger()
         self.data.allocate_pointer(label, *values)
 
+    def parallel_for (self, arguments):
+        """Spread an array over the current threads. Must be named. Takes the name of the per-thread counter, any pointers,
+           then "=" and either the values or the name of a file of whitespace-delimited values (# comments allowed).
+           Use the counter in a counter branch (e.g. ctz), which must end each thread's pass over its slice."""
+        label      = arguments[0]
+        parameters = arguments[1:]
+        if label is None:
+            print("No label found. parallel_for arrays MUST be named. Parameters: {0}".format(parameters))
+            self.ask_for_debugger()
+        if "=" not in parameters or parameters.index("=") < 1:
+            print("parallel_for {0} takes a counter name, any pointer names, then = and the values or a file name: {1}".format(label, parameters))
+            self.ask_for_debugger()
+        separator = parameters.index("=")
+        counter   = parameters[0]
+        pointers  = parameters[1:separator]
+        values    = parameters[separator+1:]
+        if len(values) == 1 and type(self.data.try_int(values[0])) is str:
+            values = self.read_values(values[0])
+        self.data.allocate_parallel_for(label, counter, pointers, values)
+
+    def read_values (self, filename):
+        """Whitespace-delimited values from a data file, relative to the working directory like include."""
+        values = []
+        with open(filename) as f:
+            for line in f.readlines():
+                values.extend(line.split("#")[0].split())
+        return values
+
     def port (self, arguments):
         """Declare an I/O port. Must be named."""
         label   = arguments[0]
@@ -130,10 +161,44 @@ class Commands (Debug):
             self.ask_for_debugger()
         self.data.set_current_threads(thread_list)
 
+    def lanes (self, arguments):
+        """Space-delimited list of the SIMD lanes which the private variables declared afterwards give values for. Cannot be named.
+           A variable must first be declared in lane 0, which other lanes copy unless given their own values."""
+        label       = arguments[0]
+        lane_list   = arguments[1:]
+        if label is not None:
+            print("No label ({0}) allowed for command lanes".format(label))
+            self.ask_for_debugger()
+        self.data.set_current_lanes(lane_list)
+
     def init (self, arguments):
         """Declare a placeholder for the initialization code of a branch or a pointer. Filled-in later."""
         self.code.allocate_init_load(*arguments)
 
+    def drop_branch (self, arguments):
+        """Free the Branch Detector (and counter, sentinel, mask) entries of the branch(es) to a destination label. Cannot be named."""
+        label        = arguments[0]
+        destinations = arguments[1:]
+        if label is not None:
+            print("No label ({0}) allowed for command drop_branch".format(label))
+            self.ask_for_debugger()
+        if len(destinations) != 1:
+            print("drop_branch takes one branch destination label: {0}".format(destinations))
+            self.ask_for_debugger()
+        self.code.drop_branch(*destinations)
+
+    def drop_pointer (self, arguments):
+        """Free the indirect memory slot of a pointer after this point in the code. Cannot be named."""
+        label    = arguments[0]
+        pointers = arguments[1:]
+        if label is not None:
+            print("No label ({0}) allowed for command drop_pointer".format(label))
+            self.ask_for_debugger()
+        if len(pointers) != 1:
+            print("drop_pointer takes one pointer label: {0}".format(pointers))
+            self.ask_for_debugger()
+        self.code.drop_pointer(*pointers)
+
     def program_counter (self, arguments):
         """Set the initial value of each thread program counter. Cannot be named. Must be given code labels."""
         label       = arguments[0]
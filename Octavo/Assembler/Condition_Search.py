@@ -0,0 +1,319 @@
+#! /usr/bin/python3
+
+"""Search the Branch Detector condition space for conditions which compute a
+   given predicate of the flags left by the previous instruction. A condition
+   selects one of four A flags and one of four B flags, and a dyadic operator
+   combines them, as in Simulator.flow_control(). Both sentinel flags compare
+   the previous result (x) against a sentinel and mask, so candidate
+   sentinel/mask pairs come from the constants in the predicate.
+   Checking is over samples (edge cases, pattern matches and near misses,
+   random words), so a match is strong evidence of equivalence, not a proof.
+
+   Given a program, also reports branches which fire at the same origin to the
+   same destination, and the single condition which could replace them, so
+   they take only one Branch Detector entry."""
+
+import ast
+import os
+import itertools
+import numpy
+from argparse       import ArgumentParser
+from Debug          import Debug
+from Utility        import Utility
+from Configuration  import Configuration
+from Operators      import Operators
+from Parser         import Parser
+from Commands       import Commands
+from Data           import Data
+from Code           import Code
+
+# ---------------------------------------------------------------------------
+
+class Condition_Search (Debug):
+    """Finds the (a, b, operator) conditions, and their sentinels/masks, which match a target predicate."""
+
+    # In flag selector order, as in Operators.Branch_Detector_Operators
+    a_sources   = ["a_negative", "a_carryout", "a_sentinel", "a_external"]
+    b_sources   = ["b_lessthan", "b_counter",  "b_sentinel", "b_external"]
+    # Flags a predicate can use, besides the previous result x
+    flags       = ["carry", "overflow", "running", "external_a", "external_b"]
+
+    def __init__ (self, configuration, operators, samples = 1024, seed = 0):
+        Debug.__init__(self)
+        self.configuration  = configuration
+        self.word_width     = configuration.memory_width_bits
+        self.word_mask      = (1 << self.word_width) - 1
+        self.msb            = 1 << (self.word_width - 1)
+        self.samples        = samples
+        self.random         = numpy.random.default_rng(seed)
+        self.operators      = {bits.uint:name for name, bits in vars(operators.dyadic).items() if name != "operator_width"}
+
+    def wrap (self, value):
+        return value & self.word_mask
+
+    def constants (self, expression):
+        """Integer constants in a predicate, as words."""
+        return set(self.wrap(node.value) for node in ast.walk(ast.parse(expression, mode = "eval"))
+                   if isinstance(node, ast.Constant) and type(node.value) is int)
+
+    def patterns (self, constants):
+        """Candidate (sentinel, mask) pairs. A set mask bit ignores that bit of x."""
+        sentinels = set(constants) | {0}
+        cares     = set(constants) | {self.word_mask, self.msb, 1}
+        return sorted(set((sentinel & care, self.word_mask ^ care) for sentinel in sentinels for care in cares if care != 0))
+
+    def match (self, x, pattern):
+        (sentinel, mask) = pattern
+        care = numpy.uint64(self.word_mask ^ mask)
+        return (x & care) == (numpy.uint64(sentinel) & care)
+
+    def random_words (self, count):
+        return self.random.integers(0, 1 << self.word_width, size = count, dtype = numpy.uint64)
+
+    def words (self, constants, patterns):
+        """Sample values of x: edge cases, the constants and their neighbours,
+           matches of each pattern, and near misses which differ in one cared-for bit."""
+        words = [0, 1, 2, 3, self.word_mask, self.word_mask - 1, self.msb, self.msb - 1, self.msb + 1] + list(range(64))
+        for constant in constants:
+            words += [constant, self.wrap(constant + 1), self.wrap(constant - 1), self.word_mask ^ constant]
+        words = [numpy.array(words, dtype = numpy.uint64), self.random_words(self.samples)]
+        for (sentinel, mask) in patterns:
+            matches = (self.random_words(16) & numpy.uint64(mask)) | numpy.uint64(sentinel)
+            care    = self.word_mask ^ mask
+            misses  = [int(matches[0]) ^ (1 << bit) for bit in range(self.word_width) if (care >> bit) & 1]
+            words  += [matches, numpy.array(misses, dtype = numpy.uint64)]
+        return numpy.concatenate(words)
+
+    def state (self, constants, patterns, used_flags):
+        """Sample previous instruction states: {name:array}. Every combination of the
+           flags the predicate uses goes with each x, the other flags are random."""
+        x     = self.words(constants, patterns)
+        used  = [flag for flag in self.flags if flag in used_flags]
+        count = len(x)
+        state = {"x":numpy.tile(x, 1 << len(used))}
+        for index, flag in enumerate(used):
+            state[flag] = numpy.repeat(numpy.arange(1 << len(used)) >> index & 1, count).astype(bool)
+        for flag in self.flags:
+            if flag not in used:
+                state[flag] = self.random.integers(0, 2, size = len(state["x"])).astype(bool)
+        state["negative"] = ((state["x"] >> numpy.uint64(self.word_width - 1)) & numpy.uint64(1)).astype(bool)
+        state["less"]     = state["overflow"] ^ state["negative"]
+        return state
+
+    def evaluate (self, expression, state):
+        """Evaluate a predicate over the sample state, as a boolean array."""
+        names = dict(state)
+        names.update({"wrap":self.wrap, "__builtins__":{}})
+        value = eval(expression, names)
+        return numpy.asarray(value).astype(bool) | numpy.zeros(len(state["x"]), dtype = bool)
+
+    def flag (self, source, state, pattern):
+        """Value of the flag a selector picks, as in Simulator.flow_control()."""
+        if source in ["a_sentinel", "b_sentinel"]:
+            return self.match(state["x"], pattern)
+        return state[{"a_negative":"negative", "a_carryout":"carry", "a_external":"external_a",
+                      "b_lessthan":"less", "b_counter":"running", "b_external":"external_b"}[source]]
+
+    def predicate (self, condition, state):
+        """Value of a (a, b, operator, pattern A, pattern B) condition over the samples."""
+        (a, b, operator, pattern_a, pattern_b) = condition
+        index = (self.flag(a, state, pattern_a).astype(numpy.uint8) << 1) | self.flag(b, state, pattern_b).astype(numpy.uint8)
+        return ((operator >> index) & 1).astype(bool)
+
+    def operators_for (self, index, target):
+        """All operators which give the target at every selector index, or none. Indices
+           which never occur are free, so there can be several."""
+        fixed = 0
+        free  = []
+        for bit in range(4):
+            values = set(target[index == bit].tolist())
+            if len(values) > 1:
+                return []
+            if len(values) == 0:
+                free.append(bit)
+            elif values.pop() is True:
+                fixed |= 1 << bit
+        return [fixed | sum(1 << bit for bit, on in zip(free, choice) if on) for choice in itertools.product([0, 1], repeat = len(free))]
+
+    def uses_a (self, operator):
+        return (operator & 0b0011) != (operator >> 2)
+
+    def uses_b (self, operator):
+        return (operator & 0b0101) != ((operator >> 1) & 0b0101)
+
+    def cost (self, condition):
+        """Sentinels used (each needs two init writes), then counters and external
+           flags, which tie up other resources, then the fewest operator inputs."""
+        (a, b, operator, pattern_a, pattern_b) = condition
+        a_used    = self.uses_a(operator)
+        b_used    = self.uses_b(operator)
+        sentinels = int(a_used and a == "a_sentinel") + int(b_used and b == "b_sentinel")
+        others    = int(b_used and b == "b_counter") + int(a_used and a == "a_external") + int(b_used and b == "b_external")
+        return (sentinels, others, int(a_used) + int(b_used), self.a_sources.index(a), self.b_sources.index(b), operator)
+
+    def search (self, target, patterns, state):
+        """Returns the matching conditions, cheapest first. Unused selectors are
+           left at their all-zero value, as in benchmarks/common/conditions.asm."""
+        found = []
+        for a in self.a_sources:
+            for pattern_a in (patterns if a == "a_sentinel" else [None]):
+                a_value = self.flag(a, state, pattern_a).astype(numpy.uint8) << 1
+                for b in self.b_sources:
+                    for pattern_b in (patterns if b == "b_sentinel" else [None]):
+                        index = a_value | self.flag(b, state, pattern_b).astype(numpy.uint8)
+                        for operator in self.operators_for(index, target):
+                            if self.uses_a(operator) is False and (a != self.a_sources[0]):
+                                continue
+                            if self.uses_b(operator) is False and (b != self.b_sources[0]):
+                                continue
+                            found.append((a, b, operator, pattern_a, pattern_b))
+        return sorted(found, key = self.cost)
+
+    def search_expression (self, expression):
+        constants   = self.constants(expression)
+        patterns    = self.patterns(constants)
+        names       = set(node.id for node in ast.walk(ast.parse(expression, mode = "eval")) if isinstance(node, ast.Name))
+        state       = self.state(constants, patterns, names | ({"overflow"} if "less" in names else set()))
+        return self.search(self.evaluate(expression, state), patterns, state)
+
+    def definition (self, label, condition):
+        """A condition definition line, as in benchmarks/common/conditions.asm,
+           and the sentinel/mask parameters its branches need."""
+        (a, b, operator, pattern_a, pattern_b) = condition
+        line       = "{0:8}condition   {1:11} {2:11} {3}".format(label, a, b, self.operators[operator])
+        parameters = []
+        if a == "a_sentinel":
+            parameters.append("sentinel/mask A {0:#x} {1:#x}".format(*pattern_a))
+        if b == "b_sentinel":
+            parameters.append("sentinel/mask B {0:#x} {1:#x}".format(*pattern_b))
+        if len(parameters) > 0:
+            line += "  # " + ", ".join(parameters)
+        return line
+
+# ---------------------------------------------------------------------------
+
+class Branch_Merge (Debug, Utility):
+    """Finds branches with the same origin and destination, whose conditions one
+       Branch Detector entry could evaluate together: the first to fire wins, so
+       together they jump when any of them would."""
+
+    def __init__ (self, data, code, configuration, operators, search):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.operators      = operators
+        self.search         = search
+
+    def value (self, operand):
+        """Literal or shared variable value of a sentinel or mask, or None."""
+        value = self.try_int(operand)
+        if type(value) is int:
+            return self.search.wrap(value)
+        variable = self.data.lookup_variable_name(operand)
+        value    = getattr(variable, "value", None)
+        if type(value) is list and len(value) == 1:
+            value = value[0]
+        return self.search.wrap(value) if type(value) is int else None
+
+    def condition (self, branch):
+        """Branch as a (a, b, operator, pattern A, pattern B) condition, or None if a sentinel or mask is not a constant."""
+        operator  = getattr(self.operators.dyadic, branch.condition.ab_operator).uint
+        pattern_a = None
+        pattern_b = None
+        if branch.condition.a == "a_sentinel":
+            pattern_a = (self.value(branch.sentinel_a), self.value(branch.mask_a))
+            if None in pattern_a:
+                return None
+        if branch.condition.b == "b_sentinel":
+            pattern_b = (self.value(branch.sentinel_b), self.value(branch.mask_b))
+            if None in pattern_b:
+                return None
+        return (branch.condition.a, branch.condition.b, operator, pattern_a, pattern_b)
+
+    def origin (self, branch):
+        if branch.prediction in [self.configuration.branch_label_anywhere, self.configuration.branch_label_anywhere_cancel]:
+            return "anywhere"
+        return id(branch.instruction)
+
+    def groups (self):
+        """Runs of branches, consecutive among those at the same origin, which share a destination."""
+        origins = dict()
+        for branch in self.code.branches:
+            origins.setdefault(self.origin(branch), []).append(branch)
+        groups = []
+        for branches in origins.values():
+            for destination, run in itertools.groupby(branches, key = lambda branch: branch.destination_label):
+                run = list(run)
+                if len(run) > 1:
+                    groups.append(run)
+        return groups
+
+    def merge (self, branches):
+        """Returns (conditions, reason): the conditions which could replace the branches, cheapest first, or why none can."""
+        if len(set(branch.prediction for branch in branches)) > 1:
+            return ([], "different predictions")
+        if sum(1 for branch in branches if branch.condition.b == "b_counter") > 1:
+            return ([], "more than one counter")
+        conditions = [self.condition(branch) for branch in branches]
+        if None in conditions:
+            return ([], "sentinel or mask is not a constant")
+        patterns  = sorted(set(pattern for condition in conditions for pattern in condition[3:] if pattern is not None))
+        constants = set(value for pattern in patterns for value in pattern)
+        patterns  = sorted(set(patterns) | set(self.search.patterns(constants)))
+        state     = self.search.state(constants, patterns, set(self.search.flags))
+        target    = numpy.zeros(len(state["x"]), dtype = bool)
+        for condition in conditions:
+            target |= self.search.predicate(condition, state)
+        found = self.search.search(target, patterns, state)
+        return (found, None if len(found) > 0 else "no single condition")
+
+    def report (self):
+        lines = []
+        for branches in self.groups():
+            (found, reason) = self.merge(branches)
+            sources = ", ".join("{0}:{1}".format(*branch.source[0:2]) if branch.source is not None else branch.condition.label for branch in branches)
+            lines.append("# {0} branches to {1} ({2})".format(len(branches), branches[0].destination_label, sources))
+            if len(found) == 0:
+                lines.append("#   cannot merge: {0}".format(reason))
+                continue
+            lines.append(self.search.definition("merged", found[0]))
+        if len(lines) == 0:
+            lines.append("# No branches share an origin and destination")
+        return "\n".join(lines)
+
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Find branch conditions computing a predicate of the previous result x and the flags " +
+                                             "carry, overflow, negative, less, running, external_a and external_b, e.g. \"(x & 1) == 0\" or \"(x == 0) | ~running\". " +
+                                             "With --program, report branches which could share a Branch Detector entry instead.")
+    arguments.add_argument("predicate", nargs = "?", default = None)
+    arguments.add_argument("--program", default = None, help = "assembly source to report mergeable branches of")
+    arguments.add_argument("--label",   default = "new")
+    arguments.add_argument("--limit",   type = int, default = 10, help = "condition definitions to print")
+    arguments.add_argument("--samples", type = int, default = 1024)
+    arguments.add_argument("--seed",    type = int, default = 0)
+    options = arguments.parse_args()
+
+    configuration = Configuration()
+    operators     = Operators()
+    search        = Condition_Search(configuration, operators, options.samples, options.seed)
+
+    if options.program is not None:
+        # Only parsed, never resolved, so let programs short of Branch Detector entries parse
+        configuration.allocate_by_liveness = True
+        data     = Data(configuration)
+        code     = Code(data, configuration, operators)
+        parser   = Parser(Commands(data, code))
+        # Includes are relative to the program
+        os.chdir(os.path.dirname(os.path.abspath(options.program)))
+        parser.parse_file(os.path.basename(options.program))
+        print(Branch_Merge(data, code, configuration, operators, search).report())
+    elif options.predicate is not None:
+        conditions = search.search_expression(options.predicate)
+        print("# {0}: {1} matching condition(s)".format(options.predicate, len(conditions)))
+        for condition in conditions[:options.limit]:
+            print(search.definition(options.label, condition))
+    else:
+        arguments.print_usage()
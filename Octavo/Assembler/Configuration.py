@@ -1,7 +1,7 @@
 #! /usr/bin/python3
 
 # To concatenate range() iterators
-from itertools  import chain
+from itertools  import chain, accumulate
 from math       import ceil
 from Debug      import Debug
 
@@ -14,9 +14,14 @@ class DefaultOffset (Debug):
     def __init__ (self, data_mem_depth, start_of_private_mem, thread_count):
         Debug.__init__(self)
         # Divide between threads the remaining data memory after the shared memory range.
-        self.private_mem_depth  = ceil((data_mem_depth - start_of_private_mem) / thread_count)
+        self.available          = data_mem_depth - start_of_private_mem
+        self.private_mem_depth  = ceil(self.available / thread_count)
         self.offsets            = [(self.private_mem_depth * thread) for thread in range(thread_count)]
 
+    def pack (self, footprints):
+        """Place the private memory of each thread right after that of the previous thread, given their sizes in words."""
+        self.offsets            = list(accumulate([0] + footprints[:-1]))
+
 class MemoryMap (Debug):
     """Describes the static properties of the data address space: shared, private, and high,
        all zero-based, as the CPU applies default offsets to private mem accesses at runtime."""
@@ -29,6 +34,8 @@ class MemoryMap (Debug):
         self.pool       = range(1, memory_indirect_base)
         self.indirect   = range(memory_indirect_base, memory_indirect_base + memory_indirect_count)
         self.io         = range(memory_io_base, memory_io_base + memory_io_count)
+        # Shared data past the I/O ports, if shared memory extends further. See Optimizer.Private_Deduplication
+        self.shared_data = range(memory_io_base + memory_io_count, memory_shared_count)
 
         # Private memory range for one thread, no offset applied.
         self.private    = range(memory_shared_count, memory_shared_count + default_offset_obj.private_mem_depth)
@@ -86,11 +93,55 @@ class Configuration (Debug):
         self.filename_data_B        = "B.mem"
         self.data_B_label           = "B"
         self.filename_I             = "I.mem"
+        self.filename_symbols       = "symbols.json"
+        # A and B memories of the SIMD lanes past lane 0, by memory and lane
+        self.filename_lane_data     = "SIMD_{0}_{1}.mem"
+        # Optional initial contents of the Programmed Offset and branch memories,
+        # one file per memory, so the init loads done once at startup can be
+        # dropped from the code. See Resolver.resolve_reset_loads().
+        self.preload_reset_state    = False
+        self.filename_po            = "PO_{0}.mem"
+        self.filename_bd            = "BD_{0}.mem"
+        self.filename_bc            = "BC_{0}.mem"
+        self.filename_sentinel      = "BS_{0}_sentinel_{1}.mem"
+        self.filename_mask          = "BS_{0}_mask_{1}.mem"
+        self.bd_width               = 31
+        # Move loop-invariant init load writes to the start of the program.
+        # See Optimizer.Init_Hoisting
+        self.hoist_init_loads       = False
+        # Assign Branch Detector entries and pointer slots by liveness, allowing
+        # more of them than the hardware has. See Optimizer.Liveness_Allocation
+        self.allocate_by_liveness   = False
+        # Choose opcode slots and runtime opcode loads. See Optimizer.Opcode_Scheduler
+        self.schedule_opcodes       = False
+        # Place variables in the A and B memories together, swapping commutative
+        # operands, replicating or copying as needed. See Optimizer.Bank_Assignment
+        self.assign_banks           = False
+        # Also balance the A and B memories and give all data addresses,
+        # implies assign_banks. See Optimizer.Data_Placement
+        self.place_data             = False
+        # Pad port reads to the latency of the ports written before them, moving
+        # later independent instructions up before adding nops. See Optimizer.Port_Scheduler
+        self.schedule_ports         = False
+        # Fold copies into their reader, and branches of zero register writes into
+        # the instruction before, and remove zero register writes. See Optimizer.Peephole
+        self.peephole               = False
+        # Remove unreachable code, dead branches, unaccessed pointers, and the
+        # data only they referenced, before giving out addresses. See Optimizer.Dead_Code
+        self.strip_dead             = False
+        # Size the default offsets to the private words each thread holds, instead
+        # of an equal share of private memory. See Optimizer.Offset_Packing
+        self.pack_offsets           = False
+        # Move the private variables never written and identical in all their
+        # threads to shared memory. See Optimizer.Private_Deduplication
+        self.dedup_private          = False
         self.branch_label_not_taken = "not_taken"
         self.branch_label_taken     = "taken"
         self.branch_label_none      = "unpredicted"
         self.branch_label_anywhere  = "anywhere"
         self.branch_label_anywhere_cancel  = "anywhere_cancel"
+        # Chosen by Profile.Branch_Prediction
+        self.branch_label_auto      = "auto"
         self.pc_width               = 10
         self.instr_OP_width         = 4
         self.instr_D_width          = 12
@@ -100,6 +151,9 @@ class Configuration (Debug):
         self.instr_B_width          = 10
         self.opcode_count           = 16
         self.thread_count           = 8
+        # SIMD lanes: datapaths with their own A and B memories, sharing the
+        # instructions, opcodes, and program counters of lane 0. See Lanes.Lane_Check
+        self.lane_count             = 1
         self.memory_depth_words     = 1024
         self.memory_depth_words_write = self.memory_depth_words * 4 # ECL FIXME this needs a cleaner definition
         self.memory_width_bits      = 36
@@ -121,6 +175,16 @@ class Configuration (Debug):
         self.default_offset         = DefaultOffset (self.memory_depth_words, self.memory_shared_count, self.thread_count)
         self.memory_map             = MemoryMap (self.memory_shared_count, self.memory_indirect_base, self.memory_indirect_count, self.memory_io_base, self.memory_io_count, self.default_offset)
 
+    def set_shared_count (self, memory_shared_count):
+        """Change the number of shared words at the start of data memory, which must match the hardware.
+           Private memory then starts after them."""
+        if memory_shared_count < self.memory_io_base + self.memory_io_count or memory_shared_count >= self.memory_depth_words:
+            print("Shared memory of {0} words must hold the I/O ports (up to {1}) and leave private memory.".format(memory_shared_count, self.memory_io_base + self.memory_io_count))
+            self.ask_for_debugger()
+        self.memory_shared_count    = memory_shared_count
+        self.default_offset         = DefaultOffset (self.memory_depth_words, self.memory_shared_count, self.thread_count)
+        self.memory_map             = MemoryMap (self.memory_shared_count, self.memory_indirect_base, self.memory_indirect_count, self.memory_io_base, self.memory_io_count, self.default_offset)
+
     def __str__ (self):
         output = ""
         output += super().__str__() + "\n"
@@ -0,0 +1,237 @@
+#! /usr/bin/python3
+
+"""Hardware-style event counters for the Simulator, per thread and per PC,
+   mapped back to the source through the symbols file written by the Generator.
+   An issue slot is either executed, cancelled by a branch prediction, or
+   annulled because an I/O port was not ready, which stalls the thread
+   until the instruction re-issues."""
+
+from os             import path
+from csv            import writer
+from json           import load, dump
+from Debug          import Debug
+from Simulator      import Issue, branch_fields
+
+class Counters (Debug):
+    """Simulator observer counting issue slot outcomes, Branch Detector activity,
+       opcode use, and A/B memory reads and writes."""
+
+    events = ["issued", "executed", "cancelled", "annulled"]
+
+    def __init__ (self, configuration, symbols_filename = None):
+        Debug.__init__(self)
+        self.configuration  = configuration
+        self.thread_count   = configuration.thread_count
+        self.depth          = configuration.memory_depth_words
+        self.threads        = {event:[0] * self.thread_count for event in self.events}
+        self.pcs            = {event:[0] * self.depth        for event in self.events}
+        # {control word:[executed count per thread]}
+        self.opcodes        = dict()
+        self.reads          = {"A":[0] * self.depth, "B":[0] * self.depth}
+        self.writes         = {"A":[0] * self.depth, "B":[0] * self.depth}
+        # {(Branch Detector index, configuration):{count name:[count per thread]}}
+        self.branches       = dict()
+        self.symbols        = None
+        if symbols_filename is not None and path.exists(symbols_filename):
+            with open(symbols_filename, 'r') as f:
+                self.symbols = load(f)
+
+    def observe (self, simulator, issue):
+        thread = issue.thread
+        pc     = issue.pc
+        if issue.flags & Issue.annulled:
+            event = "annulled"
+        elif issue.flags & Issue.cancelled:
+            event = "cancelled"
+        else:
+            event = "executed"
+        for name in ["issued", event]:
+            self.threads[name][thread] += 1
+            self.pcs[name][pc]         += 1
+        if event == "executed":
+            if issue.control not in self.opcodes:
+                self.opcodes[issue.control] = [0] * self.thread_count
+            self.opcodes[issue.control][thread] += 1
+            for (address, value) in issue.writes:
+                if address < self.depth:
+                    self.writes["A"][address] += 1
+                elif address < 2 * self.depth:
+                    self.writes["B"][address - self.depth] += 1
+        if event != "annulled":
+            if issue.read_A is not None:
+                self.reads["A"][issue.read_A] += 1
+            if issue.read_B is not None:
+                self.reads["B"][issue.read_B] += 1
+        for module, config in enumerate(issue.bd):
+            # Unused entries match everywhere, but never jump or cancel
+            if config == 0 or not (issue.reached >> module) & 1:
+                continue
+            key = (module, config)
+            if key not in self.branches:
+                self.branches[key] = {name:[0] * self.thread_count for name in ["reached", "predicate", "taken", "cancelled"]}
+            counts = self.branches[key]
+            counts["reached"][thread] += 1
+            if (issue.predicate >> module) & 1:
+                counts["predicate"][thread] += 1
+            if issue.branch == module:
+                counts["taken"][thread] += 1
+            if (issue.cancels >> module) & 1:
+                counts["cancelled"][thread] += 1
+
+    # -----------------------------------------------------------------------
+    # Mapping back to source
+
+    def source (self, pc):
+        """Return (label, file, line, source) for an instruction address.
+           Unlabeled instructions are named relative to the previous label."""
+        if self.symbols is None or pc >= len(self.symbols["instructions"]):
+            return (None, None, None, None)
+        entry = self.symbols["instructions"][pc]
+        label = None
+        for previous in range(pc, -1, -1):
+            previous_label = self.symbols["instructions"][previous]["label"]
+            if previous_label is not None:
+                label = previous_label
+                if previous != pc:
+                    label += "+{0}".format(pc - previous)
+                break
+        return (label, entry["file"], entry["line"], entry["source"])
+
+    def variable (self, memory, address):
+        """Return (label, index, thread) of the variable at a physical A or B address."""
+        if self.symbols is None:
+            return (None, None, None)
+        for variable in self.symbols["variables"]:
+            if variable["memory"] != memory or variable["kind"] not in ["shared", "private"]:
+                continue
+            if variable["kind"] == "shared":
+                bases = [(variable["address"], None)]
+            else:
+                bases = [(variable["address"] + self.symbols["default_offsets"][thread], thread) for thread in variable["threads"]]
+            for base, thread in bases:
+                if base <= address < base + variable["length"]:
+                    label = variable["label"]
+                    if label is None:
+                        label = "literal"
+                    return (label, address - base, thread)
+        return (None, None, None)
+
+    def opcode_name (self, control):
+        if self.symbols is not None:
+            for label, binary in self.symbols["opcodes"].items():
+                if binary == control:
+                    return label
+        return None
+
+    def branch_symbol (self, module, origin, destination):
+        if self.symbols is not None:
+            for branch in self.symbols["branches"]:
+                if branch["bd_index"] == module and branch["origin"] == origin and branch["destination"] == destination:
+                    return branch
+        return None
+
+    def prediction (self, origin_enable, predict_taken, predict_enable):
+        """The branch label which generates these Branch Detector bits."""
+        configuration = self.configuration
+        if origin_enable == 0:
+            if predict_enable == 1:
+                return configuration.branch_label_anywhere_cancel
+            return configuration.branch_label_anywhere
+        if predict_enable == 0:
+            return configuration.branch_label_none
+        if predict_taken == 1:
+            return configuration.branch_label_taken
+        return configuration.branch_label_not_taken
+
+    # -----------------------------------------------------------------------
+    # Reports
+
+    def thread_rows (self):
+        rows = []
+        for thread in range(self.thread_count):
+            row = {"thread":thread}
+            for event in self.events:
+                row[event] = self.threads[event][thread]
+            issued = row["issued"]
+            row["efficiency"] = round(row["executed"] / issued, 4) if issued > 0 else None
+            rows.append(row)
+        return rows
+
+    def pc_rows (self):
+        rows = []
+        for pc in range(self.depth):
+            if self.pcs["issued"][pc] == 0:
+                continue
+            (label, filename, line, source) = self.source(pc)
+            row = {"pc":pc, "label":label, "file":filename, "line":line}
+            for event in self.events:
+                row[event] = self.pcs[event][pc]
+            row["source"] = source
+            rows.append(row)
+        return rows
+
+    def branch_rows (self):
+        rows = []
+        for (module, config), counts in sorted(self.branches.items()):
+            (origin, origin_enable, destination, predict_taken, predict_enable, a, b, op) = branch_fields(config)
+            reached   = sum(counts["reached"])
+            predicate = sum(counts["predicate"])
+            cancelled = sum(counts["cancelled"])
+            symbol    = self.branch_symbol(module, origin, destination)
+            row = {"bd_index":module, "origin":origin if origin_enable else None, "destination":destination,
+                   "label":symbol["label"] if symbol is not None else None,
+                   "condition":symbol["condition"] if symbol is not None else None,
+                   "prediction":self.prediction(origin_enable, predict_taken, predict_enable),
+                   "file":symbol["file"] if symbol is not None else None,
+                   "line":symbol["line"] if symbol is not None else None,
+                   "reached":reached, "predicate":predicate, "not_predicate":reached - predicate,
+                   "taken":sum(counts["taken"]), "cancelled":cancelled,
+                   "accuracy":round((reached - cancelled) / reached, 4) if reached > 0 else None,
+                   "reached_per_thread":counts["reached"], "taken_per_thread":counts["taken"]}
+            rows.append(row)
+        return rows
+
+    def opcode_rows (self):
+        rows = []
+        for control, counts in sorted(self.opcodes.items(), key = lambda item: -sum(item[1])):
+            rows.append({"opcode":self.opcode_name(control), "control":"{0:05x}".format(control), "executed":sum(counts), "per_thread":counts})
+        return rows
+
+    def memory_rows (self):
+        rows = []
+        for memory in ["A", "B"]:
+            for address in range(self.depth):
+                reads  = self.reads[memory][address]
+                writes = self.writes[memory][address]
+                if reads == 0 and writes == 0:
+                    continue
+                (label, index, thread) = self.variable(memory, address)
+                rows.append({"memory":memory, "address":address, "label":label, "index":index, "thread":thread, "reads":reads, "writes":writes})
+        return rows
+
+    def report (self):
+        return {"threads":self.thread_rows(), "pcs":self.pc_rows(), "branches":self.branch_rows(),
+                "opcodes":self.opcode_rows(), "memory":self.memory_rows()}
+
+    def write_json (self, filename):
+        with open(filename, 'w') as f:
+            dump(self.report(), f, indent = 1)
+            f.write("\n")
+
+    def write_csv (self, prefix):
+        """One CSV file per report table, named prefix_table.csv."""
+        for table, rows in self.report().items():
+            if len(rows) == 0:
+                continue
+            with open("{0}_{1}.csv".format(prefix, table), 'w', newline = '') as f:
+                output = writer(f)
+                output.writerow(rows[0].keys())
+                for row in rows:
+                    output.writerow(row.values())
+
+    def write (self, filename):
+        """JSON if the filename ends in .json, else CSV files using the filename as prefix."""
+        if filename.endswith(".json"):
+            self.write_json(filename)
+        else:
+            self.write_csv(filename)
@@ -9,8 +9,35 @@ class Variable (Debug, Utility):
     """Base class to describe a variable and what we know about it so far.
        Has no value. Have the derived class create the kind of value it should hold."""
 
+    def parse_packed_values (self, label, initial_values):
+        """Pack an array declared as "LANESxWIDTH: value value ...", LANES values per word,
+           zero-filling the lanes of the last word. Note the lane packing of the variable."""
+        if type(initial_values) != list or len(initial_values) == 0:
+            return initial_values
+        packings = set(self.parse_packing(entry) for entry in initial_values) - {None}
+        if len(packings) > 1:
+            print("Variable {0} mixes lane packings {1}.".format(label, sorted(packings)))
+            self.ask_for_debugger()
+        if len(packings) == 0:
+            return initial_values
+        packing = packings.pop()
+        if self.packing is not None and self.packing != packing:
+            print("Variable {0} was packed as {1}x{2}, not {3}x{4}.".format(label, *self.packing, *packing))
+            self.ask_for_debugger()
+        self.packing = packing
+        if not initial_values[0].endswith(":"):
+            return initial_values
+        lanes  = packing[0]
+        values = [self.try_int(entry) for entry in initial_values[1:]]
+        if len(values) == 0:
+            print("No values to pack in variable {0}.".format(label))
+            self.ask_for_debugger()
+        values += [0] * (-len(values) % lanes)
+        return [self.pack_lanes(values[index:index + lanes], packing, initial_values[0]) for index in range(0, len(values), lanes)]
+
     def parse_value (self, label, initial_values):
         """Deal with ints, lists, and strings. Convert to int where possible."""
+        initial_values = self.parse_packed_values(label, initial_values)
         if type(initial_values) == list:
             if len(initial_values) == 0:
                 print("Empty list of values passed to variable {0}.".format(label))
@@ -37,6 +64,8 @@ class Variable (Debug, Utility):
         self.label   = label
         self.address = address
         self.memory  = memory
+        # (lanes, width) if declared with packed values. See Utility.parse_packed()
+        self.packing = None
 
 class Shared_Variable (Variable):
     """Shared variables exist as a unique value identically addressed by all threads."""
@@ -45,6 +74,10 @@ class Shared_Variable (Variable):
         Variable.__init__(self, label = label, address = address, memory = memory)
         self.value = self.parse_value(label, value)
 
+    def word_count (self):
+        """Memory words taken by the value."""
+        return len(self.value) if type(self.value) is list else 1
+
 class Private_Variable (Variable):
     """Private variables can have multiple values, one per thread. The CPU adds a per-thread
        offset to the common address so as to access the per-thread value."""
@@ -56,6 +89,8 @@ class Private_Variable (Variable):
         # If created in multiple threads at a time
         for thread in threads:
             self.value[thread] = value
+        # {lane:{thread:value}}, for the SIMD lanes past lane 0 given their own values
+        self.lanes = {}
 
     def add_value (self, value, threads):
         """Add a new per-thread value. Disallow changing initial values once not None. Disallow duplicate threads.
@@ -91,6 +126,40 @@ class Private_Variable (Variable):
         """Don't expose the value implementation outside this class. Return the thread number associated with each value."""
         return list(self.value.keys())
 
+    def word_count (self):
+        """Memory words taken by the value of each thread, all of the same length."""
+        values = list(self.value.values())
+        if len(values) == 0:
+            return 1
+        return len(values[0]) if type(values[0]) is list else 1
+
+    def add_lane_value (self, value, threads, lane):
+        """Add the value of a SIMD lane other than lane 0, for threads which already have a lane 0 value.
+           It must have the same length, so the variable stays at the same address in every lane."""
+        value  = self.parse_value(self.label, value)
+        length = len(value) if type(value) is list else 1
+        lane_values = self.lanes.setdefault(lane, {})
+        for thread in threads:
+            if thread not in self.value:
+                print("Private variable {0} has no lane 0 value in thread {1} for lane {2} to differ from.".format(self.label, thread, lane))
+                self.ask_for_debugger()
+            old_value = self.value[thread]
+            if length != (len(old_value) if type(old_value) is list else 1):
+                print("Private variable {0}: lane {1} value {2} for thread {3} not of same length as lane 0 value {4}.".format(self.label, lane, value, thread, old_value))
+                self.ask_for_debugger()
+            if thread in lane_values:
+                print("Thread {0} already has a value {1} in lane {2} of private variable {3}. Tried to assign {4}.".format(thread, lane_values[thread], lane, self.label, value))
+                self.ask_for_debugger()
+            lane_values[thread] = value
+
+    def lane_value (self, lane, thread):
+        """The value in a thread of a SIMD lane: that of lane 0 unless given."""
+        return self.lanes.get(lane, {}).get(thread, self.value[thread])
+
+    def is_lane_divergent (self):
+        """Can the value differ between SIMD lanes?"""
+        return any(value != self.value[thread] for lane_values in self.lanes.values() for thread, value in lane_values.items())
+
 class Pointer_Variable (Variable):
     """Describes pointer initialization data, which indirect memory slot it refers to, and in which threads is it used. Has no value."""
 
@@ -105,6 +174,12 @@ class Pointer_Variable (Variable):
         # Set at Resolution, as the code and data haven't been generated yet!
         self.init_load  = None
         self.threads    = threads
+        # Set at Resolution once past its drop_pointer, after which its slot can be reused
+        self.dropped    = False
+        # Set at Resolution: the init load write to the Programmed Offset entry,
+        # and each (instruction, operand) which accesses memory through this pointer
+        self.init_instruction   = None
+        self.operands           = []
 
     def add_threads (self, threads):
         """Add new threads in which this pointer is used. Disallow duplicate thread addition."""
@@ -116,11 +191,14 @@ class Pointer_Variable (Variable):
         self.threads.sort()
 
 class Port_Variable (Variable):
-    """Describes an I/O port. Derive address from port number. Has no value. Identical in all threads."""
+    """Describes an I/O port. Derive address from port number. Has no value. Identical in all threads.
+       The latency, if given, is the number of machine cycles after a write to a port with this number
+       (in either memory) until a read of this port sees its result, as for an accelerator."""
 
-    def __init__ (self, label = None, address = None, memory = None, number = None):
+    def __init__ (self, label = None, address = None, memory = None, number = None, latency = None):
         Variable.__init__(self, label = label, address = address, memory = memory)
-        self.number = number
+        self.number  = number
+        self.latency = latency
 
 class Data (Utility, Debug):
     """Contains descriptions of data and resolves locations, etc... before passing to back-end for memory image generation"""
@@ -130,6 +208,8 @@ class Data (Utility, Debug):
         Debug.__init__(self)
         # Used for private and pointer variables
         self.current_threads = []
+        # SIMD lanes given the values of private variables
+        self.current_lanes   = [0]
         # Variable type lists
         self.shared     = []
         self.private    = []
@@ -172,6 +252,16 @@ class Data (Utility, Debug):
             print("Duplicate thread numbers not allowed: {0}".format(current_threads))
             self.ask_for_debugger()
 
+    def set_current_lanes (self, lane_list):
+        self.current_lanes = [self.try_int(lane) for lane in lane_list]
+        for lane in self.current_lanes:
+            if type(lane) is not int or lane not in range(self.configuration.lane_count):
+                print("Lane {0} is not a lane number from 0 to {1}. Lanes: {2}".format(lane, self.configuration.lane_count - 1, lane_list))
+                self.ask_for_debugger()
+        if len(self.current_lanes) == 0 or len(self.current_lanes) > len(set(self.current_lanes)):
+            print("Lane numbers must be given once each: {0}".format(lane_list))
+            self.ask_for_debugger()
+
     def lookup_variable_name (self, name):
         """Locate variable by name if it exists. Checks for duplicate entries."""
         if name is None:
@@ -204,9 +294,16 @@ class Data (Utility, Debug):
             self.ask_for_debugger()
         return variables[0]
 
-    def allocate_private (self, label, value = None, threads = None):
+    def check_packing_width (self, values):
+        """Packed values must fit in a memory word. See Utility.parse_packing()"""
+        for value in values if type(values) is list else [values]:
+            self.parse_packing(value, self.configuration.memory_width_bits)
+
+    def allocate_private (self, label, value = None, threads = None, lanes = None):
         """Allocate a private variable. Must be named (label not None).
-           If the variable already exists, check the type, and add the values and threads."""
+           If the variable already exists, check the type, and add the values and threads.
+           Values for SIMD lanes other than 0 go to an existing variable."""
+        self.check_packing_width(value)
         # No threads given when parsing source, but the Resolver may create a private variable here,
         # so provide the expected threads
         if threads is None:
@@ -218,6 +315,13 @@ class Data (Utility, Debug):
         if variable is not None and type(variable) is not Private_Variable:
             print("A non-private variable named {0} of type {1} already exists!".format(label, type(variable)))
             self.ask_for_debugger()
+        if lanes is not None and 0 not in lanes:
+            if variable is None:
+                print("Private variable {0} must be declared in lane 0 before lanes {1}.".format(label, lanes))
+                self.ask_for_debugger()
+            for lane in lanes:
+                variable.add_lane_value(value, threads, lane)
+            return variable
         if variable is None:
             variable = Private_Variable(label = label, value = value, threads = threads)
             self.private.append(variable)
@@ -227,6 +331,7 @@ class Data (Utility, Debug):
 
     def allocate_shared (self, label, value = None):
         """Allocate a shared variable. Disallow redefinition or duplicate names. None name is allowed (literal constant)."""
+        self.check_packing_width(value)
         if label is not None:
             variable = self.lookup_variable_name(label)
             if variable is not None:
@@ -237,16 +342,17 @@ class Data (Utility, Debug):
         return variable
 
     def next_pointer_slot (self, set_pointer):
-        """Find the highest used slot in all pointers in the same memory, and return the next one."""
-        max_slot = -1
-        for pointer in self.pointers:
-            if pointer.memory != set_pointer.memory:
-                continue
-            slot     = pointer.slot
-            if slot is None:
-                slot = -1
-            max_slot = max(slot, max_slot)
-        return max_slot + 1
+        """Find the lowest slot not used by a live pointer in the same memory.
+           Dropped pointers keep their slot, but no longer hold it."""
+        used_slots = [pointer.slot for pointer in self.pointers if pointer.memory == set_pointer.memory and pointer.slot is not None and pointer.dropped is False]
+        slot = 0
+        while slot in used_slots:
+            slot += 1
+        return slot
+
+    def drop_pointer (self, label):
+        pointer = self.lookup_variable_name(label)
+        pointer.dropped = True
 
     def allocate_pointer (self, label, base = None, incr = None, offset = None):
         """Allocate a pointer. If it already exists, and the type and initial parameters matches, only add the threads."""
@@ -281,8 +387,44 @@ class Data (Utility, Debug):
             self.pointers.append(pointer)
         return pointer
 
-    def allocate_port (self, label, memory, number):
-        """Allocate a port, giving it a name and number. Disallow duplicate definition or redefinition."""
+    def partition (self, values, thread_count):
+        """Split values into thread_count contiguous slices, in order, the first ones longer by one if they do not divide evenly."""
+        (size, extra) = divmod(len(values), thread_count)
+        slices        = []
+        start         = 0
+        for index in range(thread_count):
+            end = start + size + (1 if index < extra else 0)
+            slices.append(values[start:end])
+            start = end
+        return slices
+
+    def allocate_parallel_for (self, label, counter, pointers, values):
+        """Spread one array over the current threads (all threads if none given): each thread gets a
+           private slice, padded with zeroes to the longest slice so all slices share one address,
+           and a private counter set to N-1 for its N elements, for a counter branch.
+           The pointers step through a slice from its start."""
+        threads = self.current_threads
+        if len(threads) == 0:
+            threads = list(range(self.configuration.thread_count))
+        values  = [self.try_int(value) for value in values]
+        if len(values) < len(threads):
+            print("parallel_for {0}: {1} values cannot give each of the {2} threads {3} at least one.".format(label, len(values), len(threads), threads))
+            self.ask_for_debugger()
+        slices  = self.partition(values, len(threads))
+        length  = len(slices[0])
+        for thread, values_slice in zip(threads, slices):
+            padding = [0] * (length - len(values_slice))
+            self.allocate_private(label, values_slice + padding, threads = [thread])
+            self.allocate_private(counter, [len(values_slice) - 1], threads = [thread])
+        current_threads      = self.current_threads
+        self.current_threads = threads
+        for pointer in pointers:
+            self.allocate_pointer(pointer, label, "1", "0")
+        self.current_threads = current_threads
+        return slices
+
+    def allocate_port (self, label, memory, number, latency = None):
+        """Allocate a port, giving it a name and number, and optionally a latency in cycles. Disallow duplicate definition or redefinition."""
         if label is None:
             print("Port cannot have a None name! Memory: {0}, Number: {1}".format(memory, number))
             self.ask_for_debugger()
@@ -291,7 +433,9 @@ class Data (Utility, Debug):
             print("A variable named {0} of type {1} already exists when trying to allocate a port.".format(label, type(port)))
             self.ask_for_debugger()
         number      = int(number, 0)
-        new_port    = Port_Variable(label = label, memory = memory, number = number)
+        if latency is not None:
+            latency = int(latency, 0)
+        new_port    = Port_Variable(label = label, memory = memory, number = number, latency = latency)
         self.ports.append(new_port)
         return new_port
 
@@ -322,6 +466,9 @@ class Data (Utility, Debug):
         max_data_length = 1
         # Find the higest set address amongst all variables of the given variable type in the given memory
         variables = self.get_variable_type_list(new_variable)
+        # Shared variables past the I/O ports are not in the literal pool
+        if type(new_variable) is Shared_Variable:
+            variables = [variable for variable in variables if variable.address not in self.configuration.memory_map.shared_data]
         for variable in variables:
             address = variable.address
             if address is not None and variable.memory == memory:
@@ -342,8 +489,8 @@ class Data (Utility, Debug):
         next_address =  max_address + max_data_length
         # Limit the address to the given range of the variables (shared, private, etc...)
         # We assume shared starts at zero
-        if type(new_variable) is Shared_Variable and next_address not in self.configuration.memory_map.shared:
-            print("Out of bounds address {0} for shared variable {1}. Limit is {2}.".format(next_address, new_variable.label, self.configuration.memory_map.shared[-1]))
+        if type(new_variable) is Shared_Variable and next_address not in self.configuration.memory_map.pool:
+            print("Out of bounds address {0} for shared variable {1}. Limit is {2}.".format(next_address, new_variable.label, self.configuration.memory_map.pool[-1]))
             self.ask_for_debugger()
         if type(new_variable) is Private_Variable and next_address not in self.configuration.memory_map.private:
             # Catch the first private variable given an address and put it at the start of the private area, the rest will follow.
@@ -403,8 +550,13 @@ class Data (Utility, Debug):
             variable.memory = memory 
             if variable.slot is None:
                 variable.slot = self.next_pointer_slot(variable)
+            indirect = self.configuration.memory_map.indirect
+            if variable.slot >= len(indirect) and self.configuration.allocate_by_liveness is False:
+                print("No more free indirect memory slots in memory {0} for pointer {1}.".format(memory, name))
+                self.ask_for_debugger()
             if variable.address is None:
-                variable.address = self.configuration.memory_map.indirect[variable.slot]
+                # Past the end is a virtual slot. See Optimizer.Liveness_Allocation
+                variable.address = indirect[variable.slot % len(indirect)]
             return variable
 
 
@@ -0,0 +1,273 @@
+#! /usr/bin/python3
+
+"""Static cycle estimate of the resolved program, without simulating it.
+   Each instruction issue takes one thread cycle, and the barrel issues one
+   thread per machine cycle, so with all threads busy the machine cycles per
+   element equal the thread cycles per element of one thread. A branch costs
+   nothing, except that a mispredicted origin gets cancelled and wastes its
+   issue slot. Over the control flow graph, each branch is taken with some
+   probability: always or never for constant conditions, from the counter
+   initial value for counter conditions (N-1 for N passes), from a profile if
+   given, else half the time per data-dependent flag. The expected visits of
+   each instruction then follow from solving the Markov chain.
+   Not modelled: I/O stalls (ports are assumed always ready), and branches
+   which may fire anywhere."""
+
+import numpy
+from Debug          import Debug
+from Utility        import Utility
+from bitstring      import BitArray
+from Flow           import Control_Flow
+
+class Cycle_Estimate (Debug, Utility):
+    """Per-loop, per-element, and total thread cycle estimates of each thread start point."""
+
+    def __init__ (self, data, code, configuration, operators, profile = None):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.operators      = operators
+        self.profile        = profile
+        self.flow           = Control_Flow(code, configuration)
+        self.count          = len(self.flow.instructions)
+        self.init_positions = set(self.flow.position(instruction) for entry in code.instructions if type(entry) is list for instruction in entry)
+        # {header:body}, merging the natural loops of each header
+        self.loops          = dict()
+        for body in self.flow.loops():
+            header = self.header(body)
+            self.loops[header] = self.loops.get(header, set()) | body
+        self.depths         = self.flow.loop_depths(list(self.loops.values()))
+        self.edges          = [dict() for position in range(self.count)]
+        self.mispredicts    = [dict() for position in range(self.count)]
+        self.anywhere       = [branch for branch in code.branches if self.flow.is_anywhere(branch)]
+        self.build()
+
+    def header (self, body):
+        """The only way into a natural loop, which dominates the rest of it."""
+        entries = [position for position in body if position in self.flow.entries or len(self.flow.predecessors[position] - body) > 0]
+        if len(entries) == 1:
+            return entries[0]
+        return [position for position in body if all(self.flow.dominates(position, other) for other in body)][0]
+
+    def counter_value (self, branch):
+        """Initial counter value of a counter branch, or None if not a known number."""
+        value = self.try_int(branch.counter)
+        if type(value) is str:
+            variable = self.data.lookup_variable_name(value)
+            value    = None if variable is None else variable.value
+        if type(value) is BitArray:
+            value = value.uint
+        if type(value) is not int:
+            return None
+        return value
+
+    def flag_probabilities (self, branch):
+        """Probabilities of the A and B flags of a branch being set."""
+        a = 0.5
+        b = 0.5
+        if branch.condition.b == "b_counter":
+            value = self.counter_value(branch)
+            if value is not None:
+                # Running for N-1 of N passes
+                b = value / (value + 1)
+        return (a, b)
+
+    def taken (self, branch):
+        """Probability of a branch predicate being true when its origin is reached."""
+        if self.profile is not None:
+            counts = self.profile.counts(branch.destination_label)
+            if counts is not None:
+                (reached, taken) = counts
+                return taken / reached
+        op     = getattr(self.operators.dyadic, branch.condition.ab_operator).uint
+        (a, b) = self.flag_probabilities(branch)
+        taken  = 0.0
+        for a_value in [0, 1]:
+            for b_value in [0, 1]:
+                if (op >> ((a_value << 1) | b_value)) & 1:
+                    taken += (a if a_value else 1 - a) * (b if b_value else 1 - b)
+        return taken
+
+    def mispredict (self, branch, taken):
+        """Probability the origin gets cancelled."""
+        configuration = self.configuration
+        if branch.prediction == configuration.branch_label_not_taken:
+            return taken
+        if branch.prediction == configuration.branch_label_taken:
+            return 1 - taken
+        return 0.0
+
+    def build (self):
+        """Edge probabilities out of each position. The lowest numbered Branch
+           Detector entry wins when several branches are taken at once."""
+        order = {id(branch):index for index, branch in enumerate(self.code.branches)}
+        for position in range(self.count):
+            instruction = self.flow.instructions[position]
+            branches    = [branch for branch in self.code.branches if branch.instruction is instruction and not self.flow.is_anywhere(branch)]
+            branches.sort(key = lambda branch: (branch.bd_index if branch.bd_index is not None else len(order), order[id(branch)]))
+            remaining   = 1.0
+            for branch in branches:
+                taken       = self.taken(branch)
+                destination = self.flow.destination(branch)
+                self.edges[position][destination] = self.edges[position].get(destination, 0.0) + remaining * taken
+                remaining  *= 1 - taken
+                prediction  = branch.prediction
+                self.mispredicts[position][prediction] = self.mispredicts[position].get(prediction, 0.0) + self.mispredict(branch, taken)
+            if remaining > 0:
+                self.edges[position][position + 1] = self.edges[position].get(position + 1, 0.0) + remaining
+
+    def visits (self, start, keep, header = None):
+        """Expected visits of each position in keep, entering once at start,
+           until control leaves keep or comes back to header.
+           Returns {position:visits}, or None if control never leaves."""
+        keep    = set(keep)
+        reached = self.reached(start, keep, header)
+        if not self.leaves(reached, keep, header):
+            return None
+        reached = sorted(reached)
+        index   = {position:row for row, position in enumerate(reached)}
+        matrix  = numpy.identity(len(reached))
+        for position in reached:
+            for successor, probability in self.edges[position].items():
+                if successor in index and successor != header:
+                    matrix[index[successor], index[position]] -= probability
+        source  = numpy.zeros(len(reached))
+        source[index[start]] = 1
+        solution = numpy.linalg.solve(matrix, source)
+        return {position:solution[index[position]] for position in reached}
+
+    def reached (self, start, keep, header):
+        """Positions in keep reachable from start, without coming back to header."""
+        reached = set()
+        stack   = [start]
+        while len(stack) > 0:
+            position = stack.pop()
+            if position in reached:
+                continue
+            reached.add(position)
+            stack.extend(successor for successor, probability in self.edges[position].items()
+                         if probability > 0 and successor in keep and successor != header)
+        return reached
+
+    def leaves (self, reached, keep, header):
+        """Can control get out of keep, or back to header, from every reached position?"""
+        escape  = set(position for position in reached
+                      if any(probability > 0 and (successor not in keep or successor == header) for successor, probability in self.edges[position].items()))
+        changed = True
+        while changed:
+            changed = False
+            for position in reached - escape:
+                if any(probability > 0 and successor in escape for successor, probability in self.edges[position].items()):
+                    escape.add(position)
+                    changed = True
+        return escape == reached
+
+    def costs (self, visits):
+        """(thread cycles, init load cycles, {prediction:cancelled cycles}) of the given visits."""
+        cycles    = sum(visits.values())
+        init      = sum(count for position, count in visits.items() if position in self.init_positions)
+        cancelled = dict()
+        for position, count in visits.items():
+            for prediction, probability in self.mispredicts[position].items():
+                cancelled[prediction] = cancelled.get(prediction, 0.0) + count * probability
+        return (cycles, init, cancelled)
+
+    def exit_probability (self, header):
+        """Probability an iteration of the loop leaves it instead of coming back to the header."""
+        body   = self.loops[header]
+        visits = self.visits(header, body, header)
+        if visits is None:
+            return (None, 0.0)
+        back   = sum(count * probability for position, count in visits.items()
+                     for successor, probability in self.edges[position].items() if successor == header)
+        return (visits, max(0.0, 1.0 - back))
+
+    def name (self, position):
+        label = self.flow.label_before(position)
+        if label is None:
+            return "@{0}".format(position)
+        if self.flow.labels[label] == position:
+            return label
+        return "{0}+{1}".format(label, position - self.flow.labels[label])
+
+    def element_loop (self, label = None):
+        """Header of the loop doing one element per iteration: the innermost loop
+           around the given label, else the innermost loop."""
+        if len(self.loops) == 0:
+            return None
+        headers = list(self.loops.keys())
+        if label is not None:
+            if label not in self.flow.labels:
+                print("Estimate: no instruction with label {0} for the element loop.".format(label))
+                self.ask_for_debugger()
+            position = self.flow.labels[label]
+            headers  = [header for header in headers if position in self.loops[header]]
+            if len(headers) == 0:
+                print("Estimate: label {0} is not inside a loop.".format(label))
+                self.ask_for_debugger()
+        return max(headers, key = lambda header: (self.depths[header], -len(self.loops[header]), -header))
+
+    def per_element (self, element, elements_per_iteration, total):
+        """Thread cycles per element, amortizing the enclosing loops: over the
+           whole run if it ends, else over an iteration of the outermost loop around the element loop."""
+        if total is None:
+            outer   = [header for header in self.loops if element in self.loops[header]]
+            header  = min(outer, key = lambda header: (self.depths[header], header))
+            visits  = self.visits(header, self.loops[header], header)
+        else:
+            visits  = total
+        if visits is None or visits.get(element, 0) == 0:
+            return None
+        (cycles, init, cancelled) = self.costs(visits)
+        count = visits[element] * elements_per_iteration
+        return (cycles / count, init / count, {prediction:value / count for prediction, value in cancelled.items()})
+
+    def format_cancelled (self, cancelled):
+        if len(cancelled) == 0 or sum(cancelled.values()) == 0:
+            return "none"
+        return ", ".join("{0:.3f} {1}".format(value, prediction) for prediction, value in sorted(cancelled.items()) if value > 0)
+
+    def report (self, element_label = None, elements_per_iteration = 1):
+        """Print the estimates, and return the thread cycles per element (None if unknown)."""
+        print("Cycle estimate (thread cycles; one thread cycle is {0} machine cycles, I/O stalls not counted):".format(self.configuration.thread_count))
+        if len(self.anywhere) > 0:
+            print("    Not estimated: {0} branch(es) which may fire anywhere".format(len(self.anywhere)))
+        for header in sorted(self.loops.keys()):
+            (visits, exit_rate) = self.exit_probability(header)
+            if visits is None:
+                print("    Loop {0} (depth {1}): never exits, inner loop does not return".format(self.name(header), self.depths[header]))
+                continue
+            (cycles, init, cancelled) = self.costs(visits)
+            trips = "forever" if exit_rate <= 0 else "{0:.1f} iterations per entry".format(1 / exit_rate)
+            print("    Loop {0} (depth {1}): {2:.3f} cycles/iteration, {3:.3f} init load, cancelled {4}, {5}".format(
+                  self.name(header), self.depths[header], cycles, init, self.format_cancelled(cancelled), trips))
+        element  = self.element_loop(element_label)
+        estimate = None
+        for start in sorted(self.flow.entries):
+            threads = [thread for thread, pc in enumerate(self.code.initial_pc) if self.flow.start(pc) == start]
+            total   = self.visits(start, range(self.count))
+            print("    Threads {0} from {1}:".format(threads, self.name(start)))
+            if total is None:
+                headers = [header for header in self.loops if self.depths[header] == 1 and header in self.flow.reachable([start])]
+                startup = None if start in headers else self.visits(start, set(range(self.count)) - set(headers))
+                if startup is not None:
+                    (cycles, init, cancelled) = self.costs(startup)
+                    print("        Startup: {0:.3f} cycles, {1:.3f} init load, then runs forever".format(cycles, init))
+                else:
+                    print("        Runs forever")
+            else:
+                (cycles, init, cancelled) = self.costs(total)
+                print("        Total run: {0:.3f} cycles ({1:.3f} machine cycles), {2:.3f} init load, cancelled {3}".format(
+                      cycles, cycles * self.configuration.thread_count, init, self.format_cancelled(cancelled)))
+            if element is None or element not in self.flow.reachable([start]):
+                continue
+            result = self.per_element(element, elements_per_iteration, total)
+            if result is None:
+                continue
+            (cycles, init, cancelled) = result
+            print("        Per element (loop {0}, {1} per iteration): {2:.3f} cycles, {3:.3f} init load, cancelled {4}".format(
+                  self.name(element), elements_per_iteration, cycles, init, self.format_cancelled(cancelled)))
+            estimate = cycles if estimate is None else max(estimate, cycles)
+        return estimate
+
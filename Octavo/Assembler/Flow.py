@@ -0,0 +1,147 @@
+#! /usr/bin/python3
+
+"""Control flow of the allocated code, before instruction addresses are known.
+   Instructions are numbered by their position in the instruction stream,
+   which becomes their address once resolved."""
+
+from Debug          import Debug
+
+class Control_Flow (Debug):
+    """Successors and predecessors of each instruction. The edges are a superset
+       of the possible ones: every branch may or may not be taken, except those
+       whose condition is always true, and branches which may fire anywhere
+       get an edge from every instruction."""
+
+    def __init__ (self, code, configuration):
+        Debug.__init__(self)
+        self.code           = code
+        self.configuration  = configuration
+        self.instructions   = list(code.all_instructions())
+        self.positions      = {id(instruction):position for position, instruction in enumerate(self.instructions)}
+        self.labels         = {instruction.label:position for position, instruction in enumerate(self.instructions) if instruction.label is not None}
+        self.successors     = [set() for instruction in self.instructions]
+        self.predecessors   = [set() for instruction in self.instructions]
+        self.entries        = set(self.start(pc) for pc in code.initial_pc) - {None}
+        self.build()
+
+    def position (self, instruction):
+        return self.positions.get(id(instruction), None)
+
+    def start (self, pc):
+        """Position of a thread start point, given as a label, or as an address once resolved."""
+        if pc in self.labels:
+            return self.labels[pc]
+        for position, instruction in enumerate(self.instructions):
+            if type(pc) is int and instruction.address == pc:
+                return position
+        return None
+
+    def destination (self, branch):
+        """Position of a branch destination, from its label, since the branch may already have an address."""
+        if branch.destination_label not in self.labels:
+            print("No instruction with label {0} found for branch destination.".format(branch.destination_label))
+            self.ask_for_debugger()
+        return self.labels[branch.destination_label] + branch.destination_offset
+
+    def is_anywhere (self, branch):
+        return branch.prediction in [self.configuration.branch_label_anywhere, self.configuration.branch_label_anywhere_cancel]
+
+    def is_unconditional (self, branch):
+        """Always taken: there is no fall-through after its origin."""
+        return branch.condition.ab_operator == "always_one" and not self.is_anywhere(branch)
+
+    def add_edge (self, source, destination):
+        if destination < len(self.instructions):
+            self.successors[source].add(destination)
+            self.predecessors[destination].add(source)
+
+    def build (self):
+        falls_through = [True] * len(self.instructions)
+        for branch in self.code.branches:
+            destination = self.destination(branch)
+            if self.is_anywhere(branch):
+                for source in range(len(self.instructions)):
+                    self.add_edge(source, destination)
+                continue
+            origin = self.position(branch.instruction)
+            if origin is None:
+                continue
+            self.add_edge(origin, destination)
+            if self.is_unconditional(branch):
+                falls_through[origin] = False
+        for position in range(len(self.instructions) - 1):
+            if falls_through[position]:
+                self.add_edge(position, position + 1)
+
+    def reachable (self, starts, avoid = None):
+        """Positions reachable from the starts, without going through avoid."""
+        seen  = set()
+        stack = [start for start in starts if start != avoid]
+        while len(stack) > 0:
+            position = stack.pop()
+            if position in seen:
+                continue
+            seen.add(position)
+            stack.extend(successor for successor in self.successors[position] if successor != avoid and successor not in seen)
+        return seen
+
+    def dominates (self, dominator, position):
+        """Does every path from a thread start point to position go through dominator?"""
+        if position == dominator:
+            return True
+        return position not in self.reachable(self.entries, avoid = dominator)
+
+    def in_loop (self, position):
+        return position in self.reachable(self.successors[position])
+
+    def live (self, uses, written):
+        """Positions where a value is live: backwards from its uses, stopping at
+           the writes to it. Returns the (live in, live out) position sets."""
+        live_in = set(position for position in uses if position is not None)
+        stack   = list(live_in)
+        while len(stack) > 0:
+            position = stack.pop()
+            for predecessor in self.predecessors[position]:
+                if predecessor in live_in or predecessor in written:
+                    continue
+                live_in.add(predecessor)
+                stack.append(predecessor)
+        live_out = set(predecessor for position in live_in for predecessor in self.predecessors[position])
+        return (live_in, live_out)
+
+    def loops (self):
+        """Natural loops, as position sets: a back edge to a header which dominates
+           its source, and the positions which reach that source without going
+           through the header."""
+        loops = []
+        for source in range(len(self.instructions)):
+            for header in self.successors[source]:
+                if not self.dominates(header, source):
+                    continue
+                body  = {header}
+                stack = [source]
+                while len(stack) > 0:
+                    position = stack.pop()
+                    if position in body:
+                        continue
+                    body.add(position)
+                    stack.extend(self.predecessors[position])
+                loops.append(body)
+        return loops
+
+    def loop_depths (self, loops = None):
+        """Number of natural loops containing each position."""
+        if loops is None:
+            loops = self.loops()
+        depths = [0] * len(self.instructions)
+        for body in loops:
+            for position in body:
+                depths[position] += 1
+        return depths
+
+    def label_before (self, position):
+        """Nearest label at or before a position, to name code in reports."""
+        for previous in range(position, -1, -1):
+            if self.instructions[previous].label is not None:
+                return self.instructions[previous].label
+        return None
@@ -5,6 +5,7 @@
 
 from bitstring      import pack, BitArray
 from sys            import exit
+from json           import dump
 from Debug          import Debug
 from Data           import Private_Variable
 
@@ -55,14 +56,14 @@ class Data_Memory (Base_Memory):
        This is essentially part of the combined register file/memory.
        Replicates private variables for each thread."""
 
-    def write_variables (self, variables, offset = 0, thread = None):
+    def write_variables (self, variables, offset = 0, thread = None, lane = 0):
         """Place the variable values in memory, with optional thread offset, and handling lists of values (arrays)."""
         for variable in variables:
             address = variable.address + offset
             if thread is None:
                 value = variable.value
             else:
-                value = variable.value[thread]
+                value = variable.lane_value(lane, thread)
             if type(value) is list:
                 for entry in value:
                     if type(value) != type(BitArray()):
@@ -84,7 +85,7 @@ class Data_Memory (Base_Memory):
                         value  = BitArray(uint=value, length=self.width)
                 self.write_bits(address, value)
 
-    def __init__(self, filename, memory, data, code, configuration):
+    def __init__(self, filename, memory, data, code, configuration, lane = 0):
         self.depth = configuration.memory_depth_words
         self.width = configuration.memory_width_bits
         Base_Memory.__init__(self, self.depth, self.width, filename)
@@ -99,7 +100,7 @@ class Data_Memory (Base_Memory):
             offsets = configuration.default_offset.offsets
             for thread in threads:
                 offset = offsets[thread]
-                self.write_variables([private_variable], offset = offset, thread = thread)
+                self.write_variables([private_variable], offset = offset, thread = thread, lane = lane)
 
 # ---------------------------------------------------------------------------
 
@@ -153,10 +154,10 @@ class Instruction_Memory (Base_Memory):
         # If D is not none, it's a simple instruction and DA/DB must be None
         # the reverse means it's a dual instruction, else it's invalid
         if instruction.D is not None:
-            instr_format = self.simple_instr_format
-        else:
-            instr_format = self.dual_instr_format
-        return pack(instr_format, instruction.opcode, instruction.D, instruction.A, instruction.B)
+            return pack(self.simple_instr_format, instruction.opcode, instruction.D, instruction.A, instruction.B)
+        # DB is a B memory write address, but its field is relative to the start of B
+        DB = instruction.DB - self.write_base_B
+        return pack(self.dual_instr_format, instruction.opcode, instruction.DA, DB, instruction.A, instruction.B)
 
     def __init__(self, filename, code, configuration):
         depth = configuration.memory_depth_words
@@ -164,6 +165,7 @@ class Instruction_Memory (Base_Memory):
         Base_Memory.__init__(self, depth, width, filename)
         self.simple_instr_format = "uint:{0},uint:{1},uint:{2},uint:{3}".format(configuration.instr_OP_width, configuration.instr_D_width, configuration.instr_A_width, configuration.instr_B_width)
         self.dual_instr_format   = "uint:{0},uint:{1},uint:{2},uint:{3},uint:{4}".format(configuration.instr_OP_width, configuration.instr_DA_width, configuration.instr_DB_width, configuration.instr_A_width, configuration.instr_B_width)
+        self.write_base_B        = configuration.memory_map.write_bases["B"]
         address = 0
         for instruction in code.all_instructions():
             self.write_bits(address, self.to_binary(instruction))
@@ -250,8 +252,8 @@ class Branch_Detector:
         """Find the init load instruction in a branch, check if the destination is a branch detector, 
            find the init data variable and fill it with the branch detector initialization binary data."""
 
-        # Branch resolution always adds the BD init load first
-        init_instr = branch.init_load.instructions[0]
+        # May have moved out of the init load. See Optimizer.Init_Hoisting.
+        init_instr = branch.init_instruction
         # But check anyway...
         if init_instr.D not in configuration.memory_map.bd:
             print("First init load destination of branch {1} is not to BD entry!".format(branch))
@@ -354,6 +356,120 @@ class Programmed_Offset (Base_Memory):
 
 # ---------------------------------------------------------------------------
 
+class Reset_State (Debug):
+    """Create the initial contents of the Programmed Offset and branch memories
+       (Detector, Counter, Sentinel and Mask), from the startup init loads which
+       Resolution removed from the code. Each memory gets its own file, holding
+       one entry per thread, times the number of pointer slots for Programmed
+       Offsets. Memories no init load writes stay zero, as at reset."""
+
+    def add_memory (self, addresses, width, filename):
+        memory = Base_Memory(self.thread_count * len(addresses), width, filename)
+        for slot, address in enumerate(addresses):
+            self.destinations[address] = (memory, len(addresses), slot)
+        self.memories.append(memory)
+
+    def read (self, memory, address, thread):
+        """Value seen by a thread reading a direct address."""
+        if address not in self.memory_map.shared:
+            address = (address + self.offsets[thread]) % memory.depth
+        return memory.mem[address].uint
+
+    def __init__ (self, data_A, data_B, code, configuration):
+        Debug.__init__(self)
+        self.thread_count   = configuration.thread_count
+        self.memory_map     = configuration.memory_map
+        self.offsets        = configuration.default_offset.offsets
+        self.word_mask      = (1 << configuration.memory_width_bits) - 1
+        # {write address:(memory, entries per thread, entry)}
+        self.destinations   = dict()
+        self.memories       = []
+        for memory in ["A", "B", "DA", "DB"]:
+            if "D" in memory:
+                width = configuration.po_write_offset_bit_width
+            else:
+                width = configuration.po_read_offset_bit_width
+            width += configuration.po_increment_bits + configuration.po_increment_sign_bits
+            self.add_memory(self.memory_map.po[memory], width, configuration.filename_po.format(memory))
+        for module in range(len(self.memory_map.bd)):
+            self.add_memory([self.memory_map.bd[module]], configuration.bd_width, configuration.filename_bd.format(module))
+            self.add_memory([self.memory_map.bc[module]], configuration.memory_width_bits, configuration.filename_bc.format(module))
+            for memory in ["A", "B"]:
+                self.add_memory([self.memory_map.sentinel[memory][module]], configuration.memory_width_bits, configuration.filename_sentinel.format(memory, module))
+                self.add_memory([self.memory_map.mask[memory][module]],     configuration.memory_width_bits, configuration.filename_mask.format(memory, module))
+        # Replay the init loads in order, as each thread would have run them: D = A + B
+        for init_load in code.reset_loads:
+            for instruction in init_load:
+                (memory, slots, slot) = self.destinations[instruction.D]
+                for thread in range(self.thread_count):
+                    value = (self.read(data_A, instruction.A, thread) + self.read(data_B, instruction.B, thread)) & self.word_mask
+                    memory.write_bits((thread * slots) + slot, BitArray(uint = value & ((1 << memory.width) - 1), length = memory.width))
+
+    def file_dump (self):
+        for memory in self.memories:
+            memory.file_dump()
+
+# ---------------------------------------------------------------------------
+
+class Symbols (Debug):
+    """Maps the binary back to the source: instruction addresses to source lines and labels,
+       branches to their Branch Detector entries, data addresses to variables, and opcode
+       names to ALU control words. Not a memory, but dumped as JSON alongside them,
+       for the Simulator counters and other tools."""
+
+    def source_fields (self, source):
+        if source is None:
+            return {"file":None, "line":None, "source":None}
+        (filename, line_number, line) = source
+        return {"file":filename, "line":line_number, "source":line}
+
+    def value_length (self, value):
+        if type(value) is list:
+            return len(value)
+        return 1
+
+    def __init__ (self, filename, data, code, configuration):
+        Debug.__init__(self)
+        self.filename = filename
+        self.symbols  = {"instructions":[], "branches":[], "variables":[], "opcodes":{}, "default_offsets":configuration.default_offset.offsets}
+        for instruction in code.all_instructions():
+            entry = {"address":instruction.address, "label":instruction.label}
+            entry.update(self.source_fields(instruction.source))
+            self.symbols["instructions"].append(entry)
+        for branch in code.branches:
+            entry = {"label":branch.destination_label, "condition":branch.condition.label, "prediction":branch.prediction,
+                     "bd_index":branch.bd_index, "origin":branch.origin, "destination":branch.destination, "init":branch.init_load.label}
+            entry.update(self.source_fields(branch.source))
+            self.symbols["branches"].append(entry)
+        for variable in data.shared:
+            if variable.address is None:
+                continue
+            self.symbols["variables"].append({"label":variable.label, "kind":"shared", "memory":variable.memory, "address":variable.address,
+                                              "length":self.value_length(variable.value), "threads":None})
+        for variable in data.private:
+            if variable.address is None:
+                continue
+            entry = {"label":variable.label, "kind":"private", "memory":variable.memory, "address":variable.address,
+                     "length":self.value_length(list(variable.value.values())[0]), "threads":variable.threads()}
+            if len(variable.lanes) > 0:
+                entry["lanes"] = sorted(variable.lanes.keys())
+            self.symbols["variables"].append(entry)
+        for variable in data.pointers:
+            self.symbols["variables"].append({"label":variable.label, "kind":"pointer", "memory":variable.memory, "address":variable.address,
+                                              "length":1, "threads":variable.threads})
+        for variable in data.ports:
+            self.symbols["variables"].append({"label":variable.label, "kind":"port", "memory":variable.memory, "address":variable.address,
+                                              "length":1, "threads":None})
+        for label, opcode in code.opcodes.defined_opcodes.items():
+            self.symbols["opcodes"][label] = opcode.binary.uint
+
+    def file_dump (self):
+        with open(self.filename, 'w') as f:
+            dump(self.symbols, f, indent = 1)
+            f.write("\n")
+
+# ---------------------------------------------------------------------------
+
 class Generator (Debug):
     """Converts the resolved code/data/branch/etc... information into binary machine code."""
 
@@ -388,9 +504,23 @@ class Generator (Debug):
         self.init_mems.append(self.A)
         self.init_mems.append(self.B)
 
+        # The other SIMD lanes differ only in their private variables
+        self.lanes = []
+        for lane in range(1, configuration.lane_count):
+            for memory in [configuration.data_A_label, configuration.data_B_label]:
+                self.lanes.append(Data_Memory(configuration.filename_lane_data.format(memory, lane), memory, data, code, configuration, lane = lane))
+        self.init_mems.extend(self.lanes)
+
         self.I = Instruction_Memory(configuration.filename_I, code, configuration)
         self.init_mems.append(self.I)
 
+        if configuration.preload_reset_state is True:
+            self.reset_state = Reset_State(self.A, self.B, code, configuration)
+            self.init_mems.append(self.reset_state)
+
+        self.symbols = Symbols(configuration.filename_symbols, data, code, configuration)
+        self.init_mems.append(self.symbols)
+
     def generate (self, mem_obj_list = None):
         if mem_obj_list is None:
             mem_obj_list = self.init_mems
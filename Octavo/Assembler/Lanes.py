@@ -0,0 +1,149 @@
+#! /usr/bin/python3
+
+"""Checks that SIMD lanes can share one instruction stream. Each lane is a
+   datapath with its own A and B memories and I/O ports, but all the lanes
+   share the instructions, opcodes, program counters, Branch Detector and
+   addressing configuration, and the branches see the flags of lane 0 only.
+   So a value which may differ between lanes must never decide a branch, nor
+   be written to the shared I or H memories."""
+
+from Optimizer      import Instruction_Stream
+from Flow           import Control_Flow
+
+class Lane_Check (Instruction_Stream):
+    """Finds the values which may differ between lanes: private variables given
+       their own lane values, and reads of the ports the program never writes
+       (inputs from outside the lane), then anything written by an instruction
+       which reads one, or reads the previous result of one. A port the
+       program writes, like an accelerator, returns a divergent value once
+       written one. Ports are told apart by number, as for Optimizer.Port_Scheduler.
+       Locations are not told apart by program point, and an indirect access
+       stands for all of the variables its pointer slot points into, so this
+       errs on the safe side.
+       Runs on resolved operands, before instruction addresses."""
+
+    def __init__ (self, data, code, configuration):
+        Instruction_Stream.__init__(self, data, code, configuration)
+        self.flow           = Control_Flow(code, configuration)
+        # (memory, address) locations holding lane-divergent values, address None for any
+        self.divergent      = set()
+        self.variables      = 0
+        for variable in data.private:
+            if variable.address is None or variable.is_lane_divergent() is False:
+                continue
+            self.divergent.update((variable.memory, address) for address in range(variable.address, variable.address + variable.word_count()))
+            self.variables += 1
+        self.targets        = self.pointer_targets()
+        self.written_ports  = set(write[1] for instruction in self.flow.instructions for write in self.writes(instruction) if write[0] == "port")
+
+    def pointer_targets (self):
+        """{(memory, indirect address):locations}, the words of the variables the pointers using
+           that indirect slot point into, or None (any address) if not known."""
+        targets = dict()
+        for pointer in self.data.pointers:
+            if pointer.address is None:
+                continue
+            memory    = pointer.memory[-1]
+            key       = (memory, pointer.address)
+            variables = [variable for variable in self.data.shared + self.data.private if variable.memory == memory and variable.address == pointer.base]
+            if len(variables) == 0 or targets.get(key, set()) is None:
+                targets[key] = None
+                continue
+            targets.setdefault(key, set()).update((memory, address) for address in range(pointer.base, pointer.base + variables[0].word_count()))
+        return targets
+
+    def indirect (self, memory, address):
+        locations = self.targets.get((memory, address))
+        if locations is None:
+            return {(memory, None)}
+        return locations
+
+    def reads (self, instruction):
+        """(memory, address) pairs read, address None for any, and ("port", number) for I/O."""
+        memory_map = self.memory_map
+        reads      = set()
+        for memory, address in [("A", instruction.A), ("B", instruction.B)]:
+            if address in memory_map.indirect:
+                reads.update(self.indirect(memory, address))
+            elif address in memory_map.io:
+                reads.add(("port", address - memory_map.io.start))
+            elif address != 0:
+                reads.add((memory, address))
+        return reads
+
+    def writes (self, instruction):
+        """(memory, address) pairs written, address None for any, ("port", number) for I/O,
+           and ("I"/"H", address) for the shared memories."""
+        memory_map  = self.memory_map
+        write_bases = memory_map.write_bases
+        writes      = set()
+        for address in self.write_addresses(instruction):
+            if address >= write_bases["H"]:
+                writes.add(("H", address))
+                continue
+            if address >= write_bases["I"]:
+                writes.add(("I", address))
+                continue
+            memory = "A" if address < write_bases["B"] else "B"
+            local  = address - write_bases[memory]
+            if local in memory_map.indirect:
+                writes.update(self.indirect(memory, local))
+            elif local in memory_map.io:
+                writes.add(("port", local - memory_map.io.start))
+            elif local != 0:
+                writes.add((memory, local))
+        return writes
+
+    def is_divergent (self, read):
+        (memory, address) = read
+        if memory == "port":
+            return address not in self.written_ports or read in self.divergent
+        if (memory, None) in self.divergent:
+            return True
+        if address is None:
+            return any(location[0] == memory for location in self.divergent)
+        return read in self.divergent
+
+    def propagate (self):
+        """Mark the instructions computing lane-divergent results, and their writes. Returns the marks by position."""
+        instructions = self.flow.instructions
+        marked       = [False] * len(instructions)
+        changed      = True
+        while changed:
+            changed = False
+            for position, instruction in enumerate(instructions):
+                if marked[position] is True:
+                    continue
+                previous = self.code.opcodes.lookup_opcode(instruction.opcode).uses_previous_result() and any(marked[source] for source in self.flow.predecessors[position])
+                if previous or any(self.is_divergent(read) for read in self.reads(instruction)):
+                    marked[position] = True
+                    self.divergent.update(write for write in self.writes(instruction) if write[0] in ["A", "B", "port"])
+                    changed = True
+        return marked
+
+    def check (self):
+        marked   = self.propagate()
+        failures = 0
+        for position, instruction in enumerate(self.flow.instructions):
+            if marked[position] is True and any(write[0] in ["I", "H"] for write in self.writes(instruction)):
+                print("Lanes: {0} writes a value which may differ between lanes into the shared I or H memory.".format(instruction.describe()))
+                failures += 1
+        for branch in self.code.branches:
+            if self.uses_flags(branch) is False:
+                continue
+            if self.flow.is_anywhere(branch):
+                sources = range(len(self.flow.instructions))
+            else:
+                origin = self.flow.position(branch.instruction)
+                if origin is None:
+                    continue
+                sources = self.flow.predecessors[origin]
+            for source in sorted(sources):
+                if marked[source] is True:
+                    print("Lanes: branch to {0} tests the flags of {1}, which may differ between lanes.".format(branch.destination_label, self.flow.instructions[source].describe()))
+                    failures += 1
+        if failures > 0:
+            print("Lanes: control flow would diverge between the {0} lanes.".format(self.configuration.lane_count))
+            self.ask_for_debugger()
+        print("Lanes: {0} lanes, {1} lane-divergent variable(s), {2} instruction(s) computing lane-divergent values, control flow shared".format(
+              self.configuration.lane_count, self.variables, marked.count(True)))
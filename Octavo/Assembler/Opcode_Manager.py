@@ -21,15 +21,33 @@ class Opcode (Debug):
         self.binary     = self.to_binary(operators)
 
     def is_dual (self):
-        """Does an opcode use the dual addressing mode (DA/DB instead of D)?"""
-        if self.dual == "dual":
+        """Does an opcode use the dual addressing mode (DA/DB instead of D)?
+           The hardware splits the D operand when the split bit is set.
+           (The simple/dual bit selects the triadic operation instead.)"""
+        if self.split == "split_yes":
             return True
-        elif self.dual == "simple":
+        elif self.split == "split_no":
             return False
         else:
-            print("Invalid simple/dual opcode specifier {0} for opcode {1}".format(self.dual, self.label))
+            print("Invalid split opcode specifier {0} for opcode {1}".format(self.split, self.label))
             self.ask_for_debugger()
 
+    # Dyadic operators which give the same result with a and b exchanged,
+    # and adder settings which negate both inputs or neither.
+    symmetric_dyadic = ["always_zero", "a_and_b", "a_xor_b", "a_or_b", "a_nor_b", "a_xnor_b", "a_nand_b", "always_one"]
+    symmetric_addsub = ["addsub_a_plus_b", "addsub_minus_a_minus_b"]
+
+    def is_commutative (self):
+        """Can the A and B operands be exchanged without changing the results or the flags?
+           Both dyadic operators and the adder must be symmetric. The third dyadic
+           operator only sees their outputs, so it does not matter."""
+        return self.dyadic1 in self.symmetric_dyadic and self.dyadic2 in self.symmetric_dyadic and self.addsub in self.symmetric_addsub
+
+    def uses_previous_result (self):
+        """Does the result depend on the previous result (R) of the thread?
+           R only selects between the two dyadic operators, so not if they are the same."""
+        return self.dyadic1 != self.dyadic2
+
     def is_same_as (self, opcode):
         """Check if the given opcode object encodes the same operation as this opcode, regardless of label or address."""
         for entry in ["split", "shift", "dyadic3", "addsub", "dual", "dyadic2", "dyadic1", "select"]:
@@ -70,6 +88,8 @@ class Opcode_Manager (Debug):
         # One set of initial/current opcodes per thread
         self.initial_opcodes    = [[None for entry in range(self.configuration.opcode_count)] for thread in range(self.configuration.thread_count)]
         self.current_opcodes    = [[None for entry in range(self.configuration.opcode_count)] for thread in range(self.configuration.thread_count)]
+        # {opcode label:number}, when numbered by Optimizer.Opcode_Scheduler
+        self.schedule           = None
 
     def define_opcode (self, label, split, shift, dyadic3, addsub, dual, dyadic2, dyadic1, select):
         """Add an opcode to the pool of defined opcodes we can draw from.
@@ -148,6 +168,9 @@ class Opcode_Manager (Debug):
         if new_opcode_label not in self.defined_opcodes:
             print("Unknown new opcode {0} when loading over previous opcode {1}.".format(new_opcode_label, old_opcode_label))
             self.ask_for_debugger()
+        if self.configuration.schedule_opcodes is True:
+            print("Opcode {0}: opcode loads are placed by the assembler when scheduling opcodes. Remove the load.".format(new_opcode_label))
+            self.ask_for_debugger()
         # Load and check for consistency in opcode indices across current threads
         # Not sure if this is necessary or correct, but if wrong, it'll fail here instead of at runtime.
         indices = []
@@ -180,6 +203,9 @@ class Opcode_Manager (Debug):
         if label not in self.defined_opcodes:
             print("Undefined opcode {0} when resolving to opcode number.".format(label))
             self.ask_for_debugger()
+        # Numbered after scheduling. See Resolver.resolve_opcodes()
+        if self.configuration.schedule_opcodes is True:
+            return label
         numbers = []
         for thread in self.data.current_threads:
             number = self.resolve_thread_opcode(label, thread)
@@ -200,6 +226,9 @@ class Opcode_Manager (Debug):
         return opcode
 
     def lookup_opcode (self, opcode_number):
+        # Still a label when scheduling opcodes
+        if type(opcode_number) is str:
+            return self.defined_opcodes[opcode_number]
         opcodes = []
         for thread in self.data.current_threads:
             opcode = self.lookup_thread_opcode(opcode_number, thread)
@@ -0,0 +1,1833 @@
+#! /usr/bin/python3
+
+"""Optional optimization passes over the allocated code, run between
+   Allocation and address Resolution. Each is enabled in Configuration,
+   so the default output stays as written in the source."""
+
+from copy           import copy
+from Debug          import Debug
+from Utility        import Utility
+from Code           import Instruction
+from Data           import Shared_Variable, Private_Variable, Port_Variable
+from Flow           import Control_Flow
+
+class Init_Hoisting (Debug):
+    """Moves init load writes which are loop-invariant to the start of the program.
+       Branch Detector, Sentinel and Mask entries only change when written, and so
+       do Programmed Offsets whose pointer never increments. Branch Counters and
+       incrementing pointers change as they are used, so they must be re-loaded.
+       A write is invariant if it is the only write to its config register, and
+       hoisting is safe if the write dominates all uses of that register, so no
+       use can see the new value any earlier than before."""
+
+    def __init__ (self, data, code, configuration):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.flow           = Control_Flow(code, configuration)
+
+    def writers (self, address):
+        return len([instruction for instruction in self.flow.instructions if instruction.D == address])
+
+    def branch_of (self, init_load):
+        for branch in self.code.branches:
+            if branch.init_load is init_load:
+                return branch
+        return None
+
+    def pointer_of (self, init_load):
+        for pointer in self.data.pointers:
+            if pointer.label == init_load.destination:
+                return pointer
+        return None
+
+    def pointer_users (self, pointer):
+        """Positions of the instructions which access memory through a pointer."""
+        memory_map = self.configuration.memory_map
+        if "D" in pointer.memory:
+            address = memory_map.read_to_write_address(pointer.address, pointer.memory)
+            return [position for position, instruction in enumerate(self.flow.instructions) if address in [instruction.D, instruction.DA, instruction.DB]]
+        return [position for position, instruction in enumerate(self.flow.instructions) if getattr(instruction, pointer.memory) == pointer.address]
+
+    def uses (self, init_load, instruction):
+        """Positions which read the register an init write sets, or None if it is not loop-invariant."""
+        memory_map = self.configuration.memory_map
+        D          = instruction.D
+        if D in memory_map.bd or D in memory_map.sentinel["A"] + memory_map.sentinel["B"] + memory_map.mask["A"] + memory_map.mask["B"]:
+            branch = self.branch_of(init_load)
+            if branch is None or self.flow.is_anywhere(branch):
+                return None
+            return [self.flow.position(branch.instruction)]
+        if D in memory_map.po["A"] + memory_map.po["B"] + memory_map.po["DA"] + memory_map.po["DB"]:
+            pointer = self.pointer_of(init_load)
+            if pointer is None or pointer.incr != 0:
+                return None
+            return self.pointer_users(pointer)
+        # Counters, opcode loads, and anything else
+        return None
+
+    def hoistable (self, init_load, instruction):
+        flow     = self.flow
+        position = flow.position(instruction)
+        if position is None or not flow.in_loop(position):
+            return False
+        if any(branch.instruction is instruction for branch in self.code.branches):
+            return False
+        uses = self.uses(init_load, instruction)
+        if uses is None or None in uses or self.writers(instruction.D) != 1:
+            return False
+        return all(flow.dominates(position, use) for use in uses)
+
+    def hoist (self):
+        """Returns {loop label:instructions removed from each pass}."""
+        code    = self.code
+        flow    = self.flow
+        first   = flow.instructions[0] if len(flow.instructions) > 0 else None
+        destinations = [branch.destination_label for branch in code.branches]
+        if first is None or first.label is None or first.label in destinations or any(label != first.label for label in code.initial_pc):
+            print("Init hoisting needs all threads to start at the first instruction, which no branch returns to.")
+            return dict()
+        hoisted = []
+        saved   = dict()
+        for init_load in code.init_loads:
+            for instruction in list(init_load.instructions):
+                if not self.hoistable(init_load, instruction):
+                    continue
+                # Labels stay where they are, on the next write of the same init load
+                if instruction.label is not None:
+                    index = init_load.instructions.index(instruction)
+                    if index + 1 >= len(init_load.instructions) or init_load.instructions[index + 1].label is not None:
+                        continue
+                    init_load.instructions[index + 1].label = instruction.label
+                    instruction.label = None
+                loop = flow.label_before(flow.position(instruction))
+                init_load.instructions.remove(instruction)
+                hoisted.append(instruction)
+                saved[loop] = saved.get(loop, 0) + 1
+        if len(hoisted) > 0:
+            hoisted[0].label = first.label
+            first.label      = None
+            code.instructions.insert(0, hoisted)
+        for loop, count in saved.items():
+            print("Hoisted {0} invariant init write(s) out of the loop at {1}: {0} fewer cycle(s) per pass, per thread".format(count, loop))
+        return saved
+
+class Live_Range (Debug):
+    """Where one user of a reconfigurable entry needs it to keep its value:
+       a branch (its detector, counter, sentinel and mask share an index) or a
+       pointer (its Programmed Offset slot). Positions are in Control_Flow order."""
+
+    def __init__ (self, owner, domain, index, definitions):
+        Debug.__init__(self)
+        self.owner          = owner
+        # "branch", or the pointer memory: A, B, DA, DB
+        self.domain         = domain
+        # Entry given at Allocation, maybe virtual (past the end)
+        self.index          = index
+        # The init load writes to the entry
+        self.definitions    = definitions
+        self.written        = set()
+        self.live_in        = set()
+        self.live_out       = set()
+        self.colour         = None
+
+    def interferes (self, other):
+        return len(self.live_in & other.live_in) > 0 or len(self.written & other.live_out) > 0 or len(other.written & self.live_out) > 0
+
+class Liveness_Allocation (Debug):
+    """Assigns Branch Detector entries and pointer slots by graph colouring of
+       their live ranges, so users which are never live at the same time share
+       an entry. An entry is live from its init load writes to its uses (branch
+       origin, or memory accesses through the pointer). If a branch still gets
+       no entry, its init writes move to just before its origin, which shrinks
+       its live range to those writes, at the cost of running them each time.
+       Pointers are not re-initialized, as that would reset their increments."""
+
+    def __init__ (self, data, code, configuration):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.flow           = None
+        self.spilled        = []
+
+    def capacity (self, domain):
+        memory_map = self.configuration.memory_map
+        if domain == "branch":
+            return len(memory_map.bd)
+        return len(memory_map.po[domain])
+
+    def live_ranges (self):
+        ranges = []
+        for branch in self.code.branches:
+            live_range = Live_Range(branch, "branch", branch.bd_index, branch.init_instructions)
+            if self.flow.is_anywhere(branch):
+                uses = range(len(self.flow.instructions))
+            else:
+                uses = [self.flow.position(branch.instruction)]
+            self.liveness(live_range, uses)
+            ranges.append(live_range)
+        for pointer in self.data.pointers:
+            if pointer.slot is None or pointer.init_instruction is None:
+                continue
+            live_range = Live_Range(pointer, pointer.memory, pointer.slot, [pointer.init_instruction])
+            self.liveness(live_range, [self.flow.position(instruction) for instruction, operand in pointer.operands])
+            ranges.append(live_range)
+        return ranges
+
+    def liveness (self, live_range, uses):
+        live_range.written = set(self.flow.position(instruction) for instruction in live_range.definitions) - {None}
+        (live_range.live_in, live_range.live_out) = self.flow.live(uses, live_range.written)
+
+    def colour (self, ranges):
+        """Greedy colouring, keeping the Allocation entry when possible.
+           Returns the first live range which gets no entry, else None."""
+        ranges = sorted(ranges, key = lambda live_range: (live_range.domain, live_range.index))
+        for live_range in ranges:
+            taken = set(other.colour for other in ranges if other.colour is not None and other.domain == live_range.domain and live_range.interferes(other))
+            free  = [colour for colour in range(self.capacity(live_range.domain)) if colour not in taken]
+            if len(free) == 0:
+                return live_range
+            live_range.colour = live_range.index if live_range.index in free else free[0]
+        return None
+
+    def spill_reason (self, live_range):
+        """Return None if the branch init writes can move before its origin, else why not."""
+        branch = live_range.owner
+        if live_range.domain != "branch":
+            return "pointers cannot be re-initialized without resetting their offset"
+        if branch in self.spilled:
+            return "already re-initialized before its origin"
+        if branch.counter is not None:
+            return "its counter would restart each time"
+        if self.flow.is_anywhere(branch):
+            return "it may fire anywhere"
+        if not any(entry is branch.instruction for entry in self.code.instructions):
+            return "its origin is not a plain instruction"
+        if Instruction_Stream(self.data, self.code, self.configuration).uses_previous(branch.instruction):
+            return "its origin depends on the instruction before it"
+        if self.code.lands_past_label(branch.instruction.label):
+            return self.code.landed_past_label
+        return None
+
+    def spill_candidate (self, failed, ranges):
+        """The live range without an entry, else the interfering one with the fewest init writes."""
+        neighbours = [other for other in ranges if other.colour is not None and other.domain == failed.domain and failed.interferes(other)]
+        neighbours.sort(key = lambda other: len(other.definitions))
+        for candidate in [failed] + neighbours:
+            if self.spill_reason(candidate) is None:
+                return candidate
+        return None
+
+    def spill (self, branch):
+        """Move the branch init writes to just before its origin. A moved write
+           passes its label to the next init load write, and if there is none,
+           stays in place and gets copied instead. The origin label moves onto
+           the moved writes, so branches to the origin run them too."""
+        code      = self.code
+        init_load = branch.init_load
+        reinit    = []
+        for instruction in list(branch.init_instructions):
+            index     = init_load.instructions.index(instruction)
+            following = init_load.instructions[index + 1:]
+            if instruction.label is not None:
+                if len(following) == 0 or following[0].label is not None:
+                    duplicate       = copy(instruction)
+                    duplicate.label = None
+                    branch.init_instructions.append(duplicate)
+                    reinit.append(duplicate)
+                    continue
+                following[0].label = instruction.label
+                instruction.label  = None
+            init_load.instructions.remove(instruction)
+            reinit.append(instruction)
+        reinit[0].label = branch.instruction.label
+        branch.instruction.label = None
+        index = next(index for index, entry in enumerate(code.instructions) if entry is branch.instruction)
+        code.instructions.insert(index, reinit)
+        self.spilled.append(branch)
+        print("Branch {0} to {1}: re-initialized before its origin, {2} more cycle(s) each time it is reached".format(branch.condition.label, branch.destination_label, len(reinit)))
+
+    def patch_branch (self, branch, colour):
+        memory_map = self.configuration.memory_map
+        resources  = [memory_map.bd, memory_map.bc] + list(memory_map.sentinel.values()) + list(memory_map.mask.values())
+        for instruction in branch.init_instructions:
+            resource = next(resource for resource in resources if instruction.D in resource)
+            instruction.D = resource[colour]
+        branch.bd_index = colour
+
+    def patch_pointer (self, pointer, colour):
+        memory_map       = self.configuration.memory_map
+        pointer.slot     = colour
+        pointer.address  = memory_map.indirect[colour]
+        write_address    = memory_map.read_to_write_address(pointer.address, pointer.memory)
+        for instruction, operand in pointer.operands:
+            setattr(instruction, operand, write_address if "D" in operand else pointer.address)
+        pointer.init_instruction.D = memory_map.po[pointer.memory][colour]
+
+    def update_usage (self, ranges):
+        """Shared entries name their last user."""
+        memory_map = self.configuration.memory_map
+        usage      = self.code.usage
+        usage.bd_in_use = usage.init_flags(memory_map.bd)
+        usage.bc_in_use = usage.init_flags(memory_map.bc)
+        for operand in ["A", "B"]:
+            usage.sentinel_in_use[operand] = usage.init_flags(memory_map.sentinel[operand])
+            usage.mask_in_use[operand]     = usage.init_flags(memory_map.mask[operand])
+        for operand in ["A", "B", "DA", "DB"]:
+            usage.po_in_use[operand] = usage.init_flags(memory_map.po[operand])
+        for live_range in ranges:
+            owner = live_range.owner
+            if live_range.domain != "branch":
+                usage.po_in_use[live_range.domain][live_range.colour] = owner.label
+                continue
+            label = owner.condition.label
+            usage.bd_in_use[live_range.colour] = label
+            if owner.counter is not None:
+                usage.bc_in_use[live_range.colour] = label
+            for operand, sentinel in [("A", owner.sentinel_a), ("B", owner.sentinel_b)]:
+                if sentinel is not None:
+                    usage.sentinel_in_use[operand][live_range.colour] = label
+                    usage.mask_in_use[operand][live_range.colour]     = label
+
+    def allocate (self):
+        """Returns the live ranges, with their entry as colour."""
+        while True:
+            self.flow = Control_Flow(self.code, self.configuration)
+            ranges    = self.live_ranges()
+            failed    = self.colour(ranges)
+            if failed is None:
+                break
+            candidate = self.spill_candidate(failed, ranges)
+            if candidate is None:
+                print("Out of {0} entries for {1}, and cannot re-initialize it: {2}.".format(failed.domain, failed.owner, self.spill_reason(failed)))
+                self.ask_for_debugger()
+            self.spill(candidate.owner)
+        for live_range in ranges:
+            if live_range.domain == "branch":
+                self.patch_branch(live_range.owner, live_range.colour)
+            else:
+                self.patch_pointer(live_range.owner, live_range.colour)
+        self.update_usage(ranges)
+        for domain in sorted(set(live_range.domain for live_range in ranges)):
+            users = [live_range for live_range in ranges if live_range.domain == domain]
+            print("Liveness allocation: {0} {1} user(s) in {2} of {3} entries".format(len(users), domain, len(set(live_range.colour for live_range in users)), self.capacity(domain)))
+        return ranges
+
+class Opcode_Scheduler (Debug):
+    """Chooses the Opcode Decoder slot of each opcode, and where to load the
+       opcodes which do not fit, so programs need not write their own loads.
+       Each opcode keeps one slot, so every instruction has one opcode number.
+       An opcode is live from its load (or program start, if preloaded) to its
+       uses, and opcodes never live at the same time share a slot. When the
+       slots run out, the opcode cheapest to load gets a load at the dominator
+       of its uses which sits in the fewest loops, then the closest to them.
+       Preloaded opcodes from the source, and "add" for the init loads, keep
+       their slot for the whole program."""
+
+    def __init__ (self, data, code, configuration):
+        Debug.__init__(self)
+        self.code           = code
+        self.configuration  = configuration
+        self.opcodes        = code.opcodes
+        self.stream         = Instruction_Stream(data, code, configuration)
+        self.flow           = None
+        self.loops          = None
+        self.depths         = None
+        # {opcode label:init load}
+        self.loads          = dict()
+
+    def pinned (self):
+        """Source preloads, which must agree across threads, and "add" for the init loads."""
+        initial = self.opcodes.initial_opcodes
+        if any(opcodes != initial[0] for opcodes in initial):
+            print("Opcode scheduling needs the same preloads in all threads: {0}".format(initial))
+            self.ask_for_debugger()
+        pinned = {label:slot for slot, label in enumerate(initial[0]) if label is not None}
+        if "add" not in pinned:
+            if None not in initial[0]:
+                print("Opcode scheduling needs a free slot for the init load opcode \"add\": {0}".format(initial[0]))
+                self.ask_for_debugger()
+            pinned["add"] = initial[0].index(None)
+        return pinned
+
+    def uses (self, label):
+        return [position for position, instruction in enumerate(self.flow.instructions) if instruction.opcode == label]
+
+    def live_ranges (self, pinned):
+        ranges = []
+        labels = list(pinned) + sorted(set(instruction.opcode for instruction in self.flow.instructions) - set(pinned))
+        for label in labels:
+            definitions = self.loads[label].instructions if label in self.loads else []
+            live_range  = Live_Range(label, "opcode", pinned.get(label, None), definitions)
+            live_range.written = set(self.flow.position(instruction) for instruction in definitions) - {None}
+            (live_range.live_in, live_range.live_out) = self.flow.live(self.uses(label), live_range.written)
+            ranges.append(live_range)
+        return ranges
+
+    def interferes (self, live_range, other):
+        """Opcodes without loads are all in the Opcode Decoder at start, so cannot share."""
+        if len(live_range.definitions) == 0 and len(other.definitions) == 0:
+            return True
+        return live_range.interferes(other)
+
+    def colour (self, ranges, pinned):
+        """Pinned opcodes keep their slot, alone. The rest are coloured greedily.
+           Returns the first live range which gets no slot, else None."""
+        free_slots = [slot for slot in range(self.configuration.opcode_count) if slot not in pinned.values()]
+        for live_range in ranges:
+            if live_range.owner in pinned:
+                live_range.colour = pinned[live_range.owner]
+                continue
+            taken = set(other.colour for other in ranges if other.colour is not None and other.owner not in pinned and self.interferes(live_range, other))
+            free  = [slot for slot in free_slots if slot not in taken]
+            if len(free) == 0:
+                return live_range
+            live_range.colour = free[0]
+        return None
+
+    def entry_starts (self):
+        """{position:index in code.instructions} of the first instruction of each top-level entry."""
+        starts   = dict()
+        position = 0
+        for index, entry in enumerate(self.code.instructions):
+            if type(entry) == list:
+                if len(entry) > 0:
+                    starts[position] = index
+                position += len(entry)
+            else:
+                starts[position] = index
+                position += 1
+        return starts
+
+    def load_point (self, label):
+        """Return (position, cost) of the best place to load an opcode, or None.
+           The cost is the number of loops around that place. The place must be
+           inside every loop around all the uses, else the opcode stays live
+           around that loop and the load frees nothing. The load cannot split
+           an instruction from the one before it which it depends on."""
+        flow         = self.flow
+        uses         = self.uses(label)
+        reached      = flow.reachable(flow.entries)
+        enclosing    = [body for body in self.loops if all(use in body for use in uses)]
+        best = None
+        for position, index in self.entry_starts().items():
+            if position not in reached or self.stream.insertion_reason(index) is not None:
+                continue
+            if not all(position in body for body in enclosing):
+                continue
+            avoided = flow.reachable(flow.entries, avoid = position)
+            if any(use in avoided for use in uses):
+                continue
+            candidate = (self.depths[position], -position)
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        return (-best[1], best[0])
+
+    def spill (self, ranges, failed, pinned):
+        """Load the cheapest of the failed opcode and its interfering neighbours."""
+        neighbours = [other for other in ranges if other.colour is not None and other.owner not in pinned and self.interferes(failed, other)]
+        best = None
+        for candidate in [failed] + neighbours:
+            if candidate.owner in self.loads:
+                continue
+            point = self.load_point(candidate.owner)
+            if point is None:
+                continue
+            if best is None or point[1] < best[1][1]:
+                best = (candidate, point)
+        if best is None:
+            print("Opcode scheduling: more opcodes live at once than the {0} Opcode Decoder slots, at opcode {1}.".format(self.configuration.opcode_count, failed.owner))
+            self.ask_for_debugger()
+        (candidate, (position, cost)) = best
+        print("Opcode {0}: loaded before {1}, inside {2} loop(s)".format(candidate.owner, self.describe(position), cost))
+        self.insert_load(candidate.owner, position)
+
+    def describe (self, position):
+        """Name the instruction at position by its label, else by the nearest label before it."""
+        instructions = self.flow.instructions
+        label        = self.flow.label_before(position)
+        if label is None:
+            return "instruction {0}".format(position)
+        distance = position - max(previous for previous in range(position + 1) if instructions[previous].label == label)
+        if distance == 0:
+            return label
+        return "{0} + {1}".format(label, distance)
+
+    def insert_load (self, label, position):
+        """Same as a source opcode load, before the top-level entry at position.
+           Its label moves onto the load, so branches to it run the load too.
+           The Opcode Decoder address is set once the slot is known."""
+        code      = self.code
+        index     = self.entry_starts()[position]
+        first     = self.flow.instructions[position]
+        init_load = code.allocate_init_load(None, self.configuration.memory_map.od[0])
+        code.instructions.remove(init_load.instructions)
+        code.instructions.insert(index, init_load.instructions)
+        opcode    = self.opcodes.defined_opcodes[label]
+        init_data = init_load.add_shared(opcode.binary)
+        init_data.label = opcode.label + "_init"
+        init_load.add_instruction(None, init_load.destination, init_data.label)
+        init_load.toggle_memory()
+        init_load.instructions[0].label = first.label
+        first.label = None
+        self.loads[label] = init_load
+
+    def load_instructions (self):
+        return [instruction for init_load in self.loads.values() for instruction in init_load.instructions]
+
+    def verify (self, ranges):
+        """Every use of a loaded opcode must be dominated by its load."""
+        flow = self.flow
+        for live_range in ranges:
+            for instruction in live_range.definitions:
+                load = flow.position(instruction)
+                for use in self.uses(live_range.owner):
+                    if not flow.dominates(load, use):
+                        print("Opcode {0}: load at {1} does not dominate its use at {2}.".format(live_range.owner, load, use))
+                        self.ask_for_debugger()
+
+    def schedule (self):
+        """Returns {opcode label:slot}, and sets the initial Opcode Decoder contents."""
+        pinned = self.pinned()
+        while True:
+            self.flow   = Control_Flow(self.code, self.configuration)
+            self.loops  = self.flow.loops()
+            self.depths = self.flow.loop_depths(self.loops)
+            ranges      = self.live_ranges(pinned)
+            failed      = self.colour(ranges, pinned)
+            if failed is None:
+                break
+            self.spill(ranges, failed, pinned)
+        self.verify(ranges)
+        memory_map = self.configuration.memory_map
+        initial    = [None] * self.configuration.opcode_count
+        for live_range in ranges:
+            if live_range.owner in self.loads:
+                self.loads[live_range.owner].instructions[0].D = memory_map.od[live_range.colour]
+                self.loads[live_range.owner].destination       = memory_map.od[live_range.colour]
+            else:
+                initial[live_range.colour] = live_range.owner
+        for thread in range(self.configuration.thread_count):
+            self.opcodes.initial_opcodes[thread] = list(initial)
+            self.opcodes.current_opcodes[thread] = list(initial)
+        self.opcodes.schedule = {live_range.owner:live_range.colour for live_range in ranges}
+        print("Opcode scheduling: {0} opcode(s) in {1} of {2} slots, {3} runtime load(s)".format(len(ranges), len(set(live_range.colour for live_range in ranges)), self.configuration.opcode_count, len(self.loads)))
+        return self.opcodes.schedule
+
+def entry_positions (code):
+    """({instruction or init load list id:entry index}, {label:entry index}) of the
+       top-level code entries. The label of a pointer init load names its empty list."""
+    owners    = {id(init_load.instructions):init_load.label for init_load in code.init_loads}
+    positions = dict()
+    labels    = dict()
+    for index, entry in enumerate(code.instructions):
+        instructions = entry if type(entry) == list else [entry]
+        positions[id(entry)] = index
+        for instruction in instructions:
+            positions[id(instruction)] = index
+            if instruction.label is not None:
+                labels[instruction.label] = index
+        if type(entry) == list and owners.get(id(entry)) is not None:
+            labels.setdefault(owners[id(entry)], index)
+    return (positions, labels)
+
+def entry_depths (code):
+    """Loop nesting of each top-level code entry, counting branches back to an earlier
+       entry. (Control_Flow needs every label on an instruction, but pointer init loads
+       are still empty before resolution.) Returns ({instruction id:entry index}, depths)."""
+    (positions, labels) = entry_positions(code)
+    depths = [0] * len(code.instructions)
+    for branch in code.branches:
+        origin      = positions.get(id(branch.instruction))
+        destination = labels.get(branch.destination_label)
+        if origin is None or destination is None or destination > origin:
+            continue
+        for index in range(destination, origin + 1):
+            depths[index] += 1
+    return (positions, depths)
+
+class Bank_Assignment (Debug, Utility):
+    """Chooses the memory (A or B) of each variable from all the instructions
+       which read it, instead of from its first read. An instruction reads its
+       A operand from A memory and its B operand from B memory, so the operands
+       of an instruction which cannot exchange them fix their memories, and
+       those of a commutative one need only differ. These are parity
+       constraints, kept in a union-find: the variables in a set have known
+       memories relative to each other. Instructions in the deepest loops go
+       first. Any left in conflict read a replica of a small read-only variable
+       in the other memory, or else a copy made by a new instruction just
+       before them, which costs a cycle each time it runs.
+       Variables left unconstrained keep the memory of their first read."""
+
+    # Largest read-only variable, in words per thread, to replicate rather than copy
+    replica_limit = 8
+
+    def __init__ (self, data, code, configuration):
+        Utility.__init__(self)
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        # {label:parent label} and {label:memory differs from the parent's}.
+        # The None node stands for A memory.
+        self.parent         = {None:None}
+        self.parity         = {None:0}
+        # {(variable label, memory):label of its replica or copy in that memory}
+        self.others         = dict()
+        self.swaps          = 0
+        self.replicas       = 0
+        self.copies         = 0
+
+    def find (self, node):
+        """Returns (root, memory of node differs from the root's)."""
+        if node not in self.parent:
+            self.parent[node] = node
+            self.parity[node] = 0
+        parent = self.parent[node]
+        if parent == node:
+            return (node, 0)
+        (root, parity)     = self.find(parent)
+        self.parent[node]  = root
+        self.parity[node] ^= parity
+        return (root, self.parity[node])
+
+    def union (self, node, other, parity):
+        """Require the memories of two nodes to differ (parity 1) or not (0). False if they cannot."""
+        (root, node_parity)         = self.find(node)
+        (other_root, other_parity)  = self.find(other)
+        if root == other_root:
+            return (node_parity ^ other_parity) == parity
+        # Keep the A memory node a root
+        if root is None:
+            (root, other_root) = (other_root, root)
+        self.parent[root] = other_root
+        self.parity[root] = node_parity ^ other_parity ^ parity
+        return True
+
+    def constrain (self, constraints):
+        """Apply all the (node, other, parity) constraints, or none of them."""
+        saved = (dict(self.parent), dict(self.parity))
+        for constraint in constraints:
+            if self.union(*constraint) is False:
+                (self.parent, self.parity) = saved
+                return False
+        return True
+
+    def memory (self, label):
+        (root, parity) = self.find(label)
+        if root is not None:
+            return None
+        return ["A", "B"][parity]
+
+    def port_parity (self, operand):
+        return {"A":0, "B":1}[operand]
+
+    def variable (self, operand):
+        """The variable an operand reads, or None for a literal."""
+        value = self.try_int(operand)
+        if type(value) is not str:
+            return None
+        return self.data.lookup_variable_name(value)
+
+    def fixed_constraints (self):
+        """I/O ports have a memory, pointers share theirs with the variable they point into,
+           and dual writes only reach the start of their own memory."""
+        constraints = [(port.label, None, self.port_parity(port.memory)) for port in self.data.ports]
+        constraints += [(pointer.label, pointer.base, 0) for pointer in self.data.pointers]
+        for instruction in self.code.all_instructions():
+            for (operand, memory) in [("DA", "A"), ("DB", "B")]:
+                variable = self.variable(getattr(instruction, operand))
+                if type(variable) in [Shared_Variable, Private_Variable]:
+                    constraints.append((variable.label, None, self.port_parity(memory)))
+        return constraints
+
+    def instruction_constraints (self, instruction, reads):
+        (a, b) = reads
+        if self.code.is_instruction_commutative(instruction):
+            if a is not None and b is not None:
+                return [(a.label, b.label, 1)]
+            return []
+        return [(variable.label, None, self.port_parity(operand)) for (operand, variable) in [("A", a), ("B", b)] if variable is not None]
+
+    def written (self):
+        """Labels of variables which may change: written by an instruction, or through a pointer."""
+        written = set(pointer.base for pointer in self.data.pointers)
+        for instruction in self.code.all_instructions():
+            for operand in ["D", "DA", "DB"]:
+                value = self.try_int(getattr(instruction, operand))
+                if type(value) is str:
+                    written.add(value)
+        return written
+
+    def replicable (self, variable):
+        return type(variable) in [Shared_Variable, Private_Variable] and variable.label not in self.written_labels and variable.word_count() <= self.replica_limit
+
+    def other (self, variable, memory):
+        """A replica of a read-only variable in the given memory, or else a private
+           variable to copy it into, since threads must not share a copy."""
+        key = (variable.label, memory)
+        if key in self.others:
+            return self.others[key]
+        label = "{0}_{1}".format(variable.label, memory)
+        while self.data.lookup_variable_name(label) is not None:
+            label += "_"
+        if self.replicable(variable):
+            other         = copy(variable)
+            other.value   = copy(variable.value)
+            self.data.get_variable_type_list(variable).append(other)
+            self.replicas += 1
+        else:
+            other         = Private_Variable(value = 0, threads = list(range(self.configuration.thread_count)))
+            self.data.private.append(other)
+        other.label   = label
+        other.address = None
+        other.memory  = memory
+        self.others[key] = label
+        return label
+
+    def insert_copy (self, instruction, variable, memory):
+        """Copy the variable into the given memory just before the instruction. Its label
+           moves onto the copy, so branches to it make the copy too."""
+        reason = None
+        if not any(entry is instruction for entry in self.code.instructions):
+            reason = "it is part of an init load"
+        elif any(branch.instruction is instruction for branch in self.code.branches):
+            reason = "a branch at it would see the flags of the copy"
+        elif self.code.opcodes.lookup_opcode(instruction.opcode).uses_previous_result():
+            reason = "its opcode would see the result of the copy"
+        elif self.code.lands_past_label(instruction.label):
+            reason = self.code.landed_past_label
+        if reason is not None:
+            print("Cannot copy {0} into memory {1} before instruction {2}: {3}. Copy it by hand.".format(variable.label, memory, instruction, reason))
+            self.ask_for_debugger()
+        label  = self.other(variable, memory)
+        (A, B) = (variable.label, 0) if self.memory(variable.label) == "A" else (0, variable.label)
+        new    = Instruction(label = instruction.label, opcode = self.code.opcodes.resolve_opcode("add"), D = label, A = A, B = B, source = instruction.source)
+        instruction.label = None
+        index  = [position for position, entry in enumerate(self.code.instructions) if entry is instruction][0]
+        self.code.instructions.insert(index, new)
+        self.copies += 1
+        return label
+
+    def place (self, instruction, reads):
+        """Exchange the operands of a commutative instruction if each is in the other memory."""
+        (a, b) = reads
+        if not self.code.is_instruction_commutative(instruction):
+            return
+        if (a is not None and self.memory(a.label) != "A") or (b is not None and self.memory(b.label) != "B"):
+            (instruction.A, instruction.B) = (instruction.B, instruction.A)
+            self.swaps += 1
+
+    def misplaced (self, operands):
+        """Cost of reading (A, B) variables from the wrong memory: a replica is free at runtime, a copy is not."""
+        cost = 0
+        for (operand, variable) in zip(["A", "B"], operands):
+            if variable is not None and self.memory(variable.label) != operand:
+                cost += 1 if self.replicable(variable) else len(self.code.instructions)
+        return cost
+
+    def resolve_conflict (self, instruction, reads):
+        options = [reads]
+        if self.code.is_instruction_commutative(instruction):
+            options.append((reads[1], reads[0]))
+        best = min(options, key = self.misplaced)
+        if best is not reads:
+            (instruction.A, instruction.B) = (instruction.B, instruction.A)
+            self.swaps += 1
+        for (operand, variable) in zip(["A", "B"], best):
+            if variable is None or self.memory(variable.label) == operand:
+                continue
+            if self.replicable(variable):
+                setattr(instruction, operand, self.other(variable, operand))
+            else:
+                setattr(instruction, operand, self.insert_copy(instruction, variable, operand))
+
+    def orient (self, instructions, reads):
+        """Put each unconstrained set of variables where its first variable is first read, as without this pass."""
+        for instruction in instructions:
+            for (operand, variable) in zip(["A", "B"], reads[id(instruction)]):
+                if variable is not None and self.memory(variable.label) is None:
+                    self.union(variable.label, None, self.port_parity(operand))
+
+    def assign (self):
+        if self.constrain(self.fixed_constraints()) is False:
+            print("Conflicting memories for I/O ports, pointed-to variables, and dual write operands.")
+            self.ask_for_debugger()
+        self.written_labels = self.written()
+        (positions, depths) = entry_depths(self.code)
+        instructions = list(self.code.all_instructions())
+        reads        = {id(instruction):(self.variable(instruction.A), self.variable(instruction.B)) for instruction in instructions}
+        conflicts    = []
+        for instruction in sorted(instructions, key = lambda instruction: -depths[positions[id(instruction)]]):
+            if self.constrain(self.instruction_constraints(instruction, reads[id(instruction)])) is False:
+                conflicts.append(id(instruction))
+        self.orient(instructions, reads)
+        variables = []
+        for instruction in instructions:
+            for variable in reads[id(instruction)]:
+                if variable is not None and variable not in variables:
+                    variables.append(variable)
+        for variable in variables:
+            if type(variable) is not Port_Variable:
+                variable.memory = self.memory(variable.label)
+        for instruction in instructions:
+            if id(instruction) in conflicts:
+                self.resolve_conflict(instruction, reads[id(instruction)])
+            else:
+                self.place(instruction, reads[id(instruction)])
+        print("Bank assignment: {0} variable(s), {1} conflict(s), {2} swap(s), {3} replica(s), {4} copy instruction(s)".format(len(variables), len(conflicts), self.swaps, self.replicas, self.copies))
+
+class Data_Placement (Bank_Assignment):
+    """Places all the data in A and B memories and gives it addresses, to fit the
+       literal pool (shared, at the start of each memory) and the private
+       memory of each thread. Sets of variables left unconstrained by their
+       reads, init load data most of all, go to whichever memory leaves the
+       pool fitting and the most private memory free in both, largest first.
+       Literals go next to them, in the other memory. Pointer init data, made
+       later by the Resolver, is planned here too. If a pool still overflows,
+       read-only literals and shared variables move to private memory, at one
+       word per thread instead of one. See Literal_Spilling."""
+
+    def __init__ (self, data, code, configuration):
+        Bank_Assignment.__init__(self, data, code, configuration)
+        memory_map          = configuration.memory_map
+        self.pool_size      = len(memory_map.pool)
+        self.private_size   = len(memory_map.private)
+        # {id(pointer init load):memory}
+        self.pointer_data   = dict()
+        # Instructions whose literal either memory can hold. See free_literal()
+        self.free_literals  = set()
+        self.spilling       = Literal_Spilling(data, code, configuration)
+        self.spilled        = 0
+
+    def other_memory (self, memory):
+        return {"A":"B", "B":"A"}[memory]
+
+    def members (self):
+        """Variables in the union-find, by label."""
+        variables = dict()
+        for label in self.parent:
+            variable = self.data.lookup_variable_name(label) if label is not None else None
+            if type(variable) in [Shared_Variable, Private_Variable]:
+                variables[label] = variable
+        return variables
+
+    def literals (self, instruction, reads, memory_of):
+        """(value, memory) of the non-zero literals an instruction reads, as it will
+           read them: opposite its one named operand if commutative, else as written.
+           The memory is None while that operand's is not chosen."""
+        named = [variable for variable in reads if variable is not None]
+        found = []
+        for (operand, raw) in [("A", instruction.A), ("B", instruction.B)]:
+            value = self.try_int(raw)
+            if type(value) is not int or value == 0:
+                continue
+            if len(named) == 1 and self.code.is_instruction_commutative(instruction):
+                memory = memory_of(named[0].label)
+                found.append((value, None if memory is None else self.other_memory(memory)))
+            else:
+                found.append((value, operand))
+        return found
+
+    def usage (self, members, instructions, reads, chosen):
+        """({memory:pool words}, {memory:private words per thread}), counting only the sets
+           whose memory is known, given {root:parity} choices for the unconstrained ones."""
+        def memory_of (label):
+            (root, parity) = self.find(label)
+            if root is not None:
+                if root not in chosen:
+                    return None
+                parity ^= chosen[root]
+            return ["A", "B"][parity]
+        pool     = {"A":0, "B":0}
+        private  = {"A":0, "B":0}
+        literals = {"A":set(), "B":set()}
+        for label, variable in members.items():
+            memory = memory_of(label)
+            if memory is None:
+                continue
+            if type(variable) is Shared_Variable:
+                pool[memory] += variable.word_count()
+            else:
+                private[memory] += variable.word_count()
+        for instruction in instructions:
+            if id(instruction) in self.free_literals:
+                continue
+            for (value, memory) in self.literals(instruction, reads[id(instruction)], memory_of):
+                if memory is not None:
+                    literals[memory].add(value)
+        for memory in self.pointer_data.values():
+            private[memory] += 1
+        for memory in ["A", "B"]:
+            pool[memory] += len(literals[memory])
+        return (pool, private, literals)
+
+    def free_literal (self, instruction, reads):
+        """The literal of a commutative read of one literal and zero, which either memory can hold, or None."""
+        if reads != (None, None) or not self.code.is_instruction_commutative(instruction):
+            return None
+        values = sorted([self.try_int(instruction.A), self.try_int(instruction.B)], key = lambda value: value != 0)
+        if values[0] == 0 and type(values[1]) is int and values[1] != 0:
+            return values[1]
+        return None
+
+    def cost (self, usage):
+        """Pool overflow, then the fullest private memory, then the fullest pool."""
+        (pool, private, literals) = usage
+        return (sum(max(0, words - self.pool_size) for words in pool.values()), max(private.values()), max(pool.values()))
+
+    def orient (self, instructions, reads):
+        members = self.members()
+        self.free_literals = set(id(instruction) for instruction in instructions if self.free_literal(instruction, reads[id(instruction)]) is not None)
+        sets    = dict()
+        for label, variable in members.items():
+            (root, parity) = self.find(label)
+            if root is not None:
+                sets[root] = sets.get(root, 0) + variable.word_count()
+        chosen = dict()
+        for root in sorted(sets, key = lambda root: -sets[root]):
+            chosen[root] = min([0, 1], key = lambda parity: self.cost(self.usage(members, instructions, reads, dict(chosen, **{root:parity}))))
+        for root, parity in chosen.items():
+            self.union(root, None, parity)
+        # Sets of variables which are only read outside the union-find, if any, as without this pass
+        Bank_Assignment.orient(self, instructions, reads)
+        # Then the free literals, into whichever pool has them already, or else has more room
+        (pool, private, literals) = self.usage(members, instructions, reads, dict())
+        for instruction in instructions:
+            if id(instruction) not in self.free_literals:
+                continue
+            value  = self.free_literal(instruction, reads[id(instruction)])
+            memory = "A" if self.try_int(instruction.A) == value else "B"
+            other  = self.other_memory(memory)
+            if value not in literals[memory] and (value in literals[other] or pool[other] < pool[memory]):
+                (instruction.A, instruction.B) = (instruction.B, instruction.A)
+                self.swaps += 1
+                memory = other
+            if value not in literals[memory]:
+                literals[memory].add(value)
+                pool[memory] += 1
+        # One private word per thread for each pointer init load, once resolved
+        for pointer in self.data.pointers:
+            init_load = self.code.lookup_init_load(pointer.label)
+            if init_load is None:
+                continue
+            (pool, private, literals) = self.usage(members, instructions, reads, dict())
+            memory = min(["A", "B"], key = lambda memory: private[memory])
+            self.pointer_data[id(init_load)] = memory
+            init_load.memory = memory
+
+    def spill (self, memory, value, variable):
+        """Move a literal value, or a read-only shared variable, from the pool to private memory."""
+        self.spilled += 1
+        if variable is None:
+            self.spilling.spill_literal(memory, value)
+            return
+        private        = Private_Variable(label = variable.label, value = variable.value, threads = list(range(self.configuration.thread_count)))
+        private.memory = memory
+        self.data.shared.remove(variable)
+        self.data.private.append(private)
+
+    def overflow (self, memory, area, words, size, variables):
+        largest = sorted(variables, key = lambda variable: -variable.word_count())[0:5]
+        print("Data placement: {0} memory {1} needs {2} words, but has {3}. Largest: {4}".format(memory, area, words, size, ", ".join("{0} ({1})".format(variable.label, variable.word_count()) for variable in largest)))
+        self.ask_for_debugger()
+
+    def allocate (self):
+        memory_map   = self.configuration.memory_map
+        instructions = list(self.code.all_instructions())
+        for label, variable in self.members().items():
+            variable.memory = self.memory(label)
+        init_data = set(id(variable) for init_load in self.code.init_loads for variable in init_load.init_data)
+        init_read = set((self.try_int(getattr(instruction, operand)), operand) for init_load in self.code.init_loads for instruction in init_load.instructions for operand in ["A", "B"])
+        pool = dict()
+        for memory in ["A", "B"]:
+            literals = []
+            for instruction in instructions:
+                value = self.try_int(getattr(instruction, memory))
+                if type(value) is int and value != 0 and value not in literals:
+                    literals.append(value)
+            named    = [variable for variable in self.data.shared if variable.label is not None and variable.memory == memory]
+            # Literals first, least used first, as they are one word each, then read-only shared variables, smallest first
+            uses      = self.spilling.uses(memory)
+            spillable = [(value, None) for value in sorted(literals, key = lambda value: (uses.get(value, 0), value)) if (value, memory) not in init_read]
+            spillable += [(None, variable) for variable in sorted(named, key = lambda variable: variable.word_count()) if variable.label not in self.written_labels and id(variable) not in init_data]
+            while len(literals) + sum(variable.word_count() for variable in named) > self.pool_size and len(spillable) > 0:
+                (value, variable) = spillable.pop(0)
+                self.spill(memory, value, variable)
+                if variable is None:
+                    literals.remove(value)
+                else:
+                    named.remove(variable)
+            words = len(literals) + sum(variable.word_count() for variable in named)
+            if words > self.pool_size:
+                self.overflow(memory, "literal pool", words, self.pool_size, named)
+            pool[memory] = (named, literals)
+        # Unnamed shared variables hold the literals. Keep those still read from their memory.
+        unused = [variable for variable in self.data.shared if variable.label is None and variable.address != 0 and not (type(variable.value) is int and variable.value in pool[variable.memory][1])]
+        for variable in unused:
+            self.data.shared.remove(variable)
+        used = {"A":0, "B":0}
+        for memory in ["A", "B"]:
+            (named, literals) = pool[memory]
+            address = memory_map.pool[0]
+            for variable in named:
+                variable.address = address
+                address         += variable.word_count()
+            for value in literals:
+                variable = self.data.lookup_shared_variable_value(value, memory)
+                if variable is None:
+                    variable = self.data.allocate_shared(None, value = value)
+                    variable.memory = memory
+                variable.address = address
+                address         += 1
+            address = memory_map.private[0]
+            private = [variable for variable in self.data.private if variable.memory == memory]
+            for variable in private:
+                variable.address = address
+                address         += variable.word_count()
+            used[memory] = address - memory_map.private[0] + list(self.pointer_data.values()).count(memory)
+            if used[memory] > self.private_size:
+                self.overflow(memory, "private", used[memory], self.private_size, private)
+        print("Data placement: literal pool A {0}/{2}, B {1}/{2} words, private A {3}/{5}, B {4}/{5} words per thread, {6} moved to private memory".format(
+              len(pool["A"][1]) + sum(variable.word_count() for variable in pool["A"][0]), len(pool["B"][1]) + sum(variable.word_count() for variable in pool["B"][0]), self.pool_size,
+              used["A"], used["B"], self.private_size, self.spilled))
+
+    def assign (self):
+        Bank_Assignment.assign(self)
+        self.allocate()
+
+class Literal_Spilling (Debug, Utility):
+    """Moves the least used literals out of a full literal pool into private
+       constants: each thread gets its own copy at its default offset, so the
+       same address reads the same value in every thread. Uses are weighted by
+       loop nesting, so the literals of inner loops stay in the pool. Literals
+       read by init loads stay too. Runs before the read operands are resolved,
+       on the memories they will have then."""
+
+    def __init__ (self, data, code, configuration):
+        Utility.__init__(self)
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.pool_size      = len(configuration.memory_map.pool)
+        self.spilled        = 0
+
+    def memories (self):
+        """{label:memory} of the named shared variables: as already set, or else that of their first read."""
+        memories = {variable.label:variable.memory for variable in self.data.shared if variable.label is not None}
+        for instruction in self.code.all_instructions():
+            for operand in ["A", "B"]:
+                label = self.try_int(getattr(instruction, operand))
+                if type(label) is str and label in memories and memories[label] is None:
+                    memories[label] = operand
+        return memories
+
+    def uses (self, memory):
+        """{literal value:reads from a memory, weighted by loop nesting}"""
+        (positions, depths) = entry_depths(self.code)
+        uses = dict()
+        for instruction in self.code.all_instructions():
+            value = self.try_int(getattr(instruction, memory))
+            if type(value) is int and value != 0:
+                uses[value] = uses.get(value, 0) + 10 ** depths[positions[id(instruction)]]
+        return uses
+
+    def pinned (self, memory):
+        """Literals read from a memory by init loads."""
+        return set(self.try_int(getattr(instruction, memory)) for init_load in self.code.init_loads for instruction in init_load.instructions)
+
+    def spill_literal (self, memory, value):
+        """Replace a literal read from a memory by a private constant. Returns its label."""
+        label = "constant_{0}{1}".format(memory, self.spilled)
+        while self.data.lookup_variable_name(label) is not None:
+            label += "_"
+        constant        = Private_Variable(label = label, value = value, threads = list(range(self.configuration.thread_count)))
+        constant.memory = memory
+        self.data.private.append(constant)
+        for instruction in self.code.all_instructions():
+            if self.try_int(getattr(instruction, memory)) == value:
+                setattr(instruction, memory, label)
+        self.spilled += 1
+        return label
+
+    def spill (self):
+        memories = self.memories()
+        for memory in ["A", "B"]:
+            named      = sum(variable.word_count() for variable in self.data.shared if variable.label is not None and memories[variable.label] == memory)
+            uses       = self.uses(memory)
+            pinned     = self.pinned(memory)
+            candidates = sorted((value for value in uses if value not in pinned), key = lambda value: (uses[value], value))
+            words      = named + len(uses)
+            while words > self.pool_size and len(candidates) > 0:
+                self.spill_literal(memory, candidates.pop(0))
+                words -= 1
+            if words > self.pool_size:
+                print("Literal pool {0} needs {1} words, but has {2}: {3} for named shared variables, the rest for literals read by init loads.".format(memory, words, self.pool_size, named))
+                self.ask_for_debugger()
+        if self.spilled > 0:
+            print("Literal spilling: {0} constant(s) moved from the literal pool to private memory".format(self.spilled))
+
+class Private_Deduplication (Debug, Utility):
+    """Moves the private variables which have the same value in all their threads,
+       and which nothing writes, to the shared data past the I/O ports, which
+       exists only if shared memory is made larger than the literal pool and the
+       ports. Each then takes its words once, instead of once per thread. The
+       variables of a pointer, and those with SIMD lane values, stay private.
+       Those saving the most words go first, while they fit. Runs after the
+       literals are spilled, before the read operands are resolved."""
+
+    def __init__ (self, data, code, configuration):
+        Utility.__init__(self)
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.shared_data    = configuration.memory_map.shared_data
+
+    def kept (self):
+        """Labels which stay private: written directly, or as the base of a pointer, which may
+           also write, or read by init loads, whose data may differ per thread once generated."""
+        labels = set(pointer.base for pointer in self.data.pointers)
+        labels.update(variable.label for init_load in self.code.init_loads for variable in init_load.init_data)
+        for instruction in self.code.all_instructions():
+            labels.update(operand for operand in [instruction.D, instruction.DA, instruction.DB] if type(self.try_int(operand)) is str)
+        return labels
+
+    def memories (self):
+        """{label:memory} of the first read of each label, as the read operands would resolve them."""
+        memories = dict()
+        for instruction in self.code.all_instructions():
+            for memory in ["A", "B"]:
+                label = self.try_int(getattr(instruction, memory))
+                if type(label) is str:
+                    memories.setdefault(label, memory)
+        return memories
+
+    def candidates (self):
+        kept     = self.kept()
+        memories = self.memories()
+        found    = []
+        for variable in self.data.private:
+            values = list(variable.value.values())
+            if len(values) < 2 or any(value != values[0] for value in values) or variable.is_lane_divergent() is True:
+                continue
+            if variable.label in kept or variable.address is not None:
+                continue
+            memory = variable.memory if variable.memory is not None else memories.get(variable.label)
+            if memory is None:
+                continue
+            found.append((variable, memory))
+        return sorted(found, key = lambda candidate: (-candidate[0].word_count() * (len(candidate[0].value) - 1), candidate[0].label))
+
+    def share (self, variable, memory, address):
+        """Replace a private variable by a shared one at the given address."""
+        shared         = Shared_Variable(label = variable.label, address = address, memory = memory, value = list(variable.value.values())[0])
+        shared.packing = variable.packing
+        self.data.private.remove(variable)
+        self.data.shared.append(shared)
+
+    def deduplicate (self):
+        tops    = {memory:self.shared_data.start for memory in ["A", "B"]}
+        moved   = 0
+        words   = 0
+        skipped = []
+        for (variable, memory) in self.candidates():
+            size = variable.word_count()
+            if tops[memory] + size > self.shared_data.stop:
+                skipped.append(variable.label)
+                continue
+            self.share(variable, memory, tops[memory])
+            tops[memory] += size
+            moved        += 1
+            words        += size
+        print("Private deduplication: {0} variable(s) moved to shared memory, freeing {1} private word(s) per thread, using {2} of {3} shared data words per memory".format(
+              moved, words, max(tops.values()) - self.shared_data.start, len(self.shared_data)))
+        if len(skipped) > 0:
+            print("Private deduplication: no room left in shared data for {0}. See --shared-count.".format(", ".join(skipped)))
+
+class Dead_Code (Debug, Utility):
+    """Strips what no thread can reach or read, before anything gets an
+       address: code entries (an instruction, or an init load) unreachable
+       from the initial program counters, branches whose origin or init load
+       is unreachable, pointers which no reachable instruction accesses, and
+       then the variables and literals nothing references any more. A branch
+       only leads to its destination, or stops its origin falling through,
+       while its init load is reachable. Literals already in the pool (those
+       of init loads) are packed down again over the freed words."""
+
+    def __init__ (self, data, code, configuration):
+        Utility.__init__(self)
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        (self.positions, self.labels) = entry_positions(code)
+        self.dead_branches  = 0
+        self.dead_pointers  = 0
+
+    def is_anywhere (self, branch):
+        return branch.prediction in [self.configuration.branch_label_anywhere, self.configuration.branch_label_anywhere_cancel]
+
+    def init_position (self, branch):
+        if branch.init_load is None:
+            return None
+        return self.positions.get(id(branch.init_load.instructions))
+
+    def origin (self, branch):
+        """Entry from which a branch fires. One which may fire anywhere does so once initialized."""
+        if self.is_anywhere(branch):
+            return self.init_position(branch)
+        return self.positions.get(id(branch.instruction))
+
+    def reach (self, branches):
+        """Indices of the code entries reachable from the initial program counters through the given branches."""
+        edges = dict()
+        stops = set()
+        for branch in branches:
+            origin = self.origin(branch)
+            if branch.destination_label in self.labels:
+                edges.setdefault(origin, set()).add(self.labels[branch.destination_label])
+            if branch.condition.ab_operator == "always_one" and not self.is_anywhere(branch):
+                stops.add(origin)
+        reached = set()
+        stack   = [self.labels[pc] for pc in self.code.initial_pc]
+        while len(stack) > 0:
+            index = stack.pop()
+            if index in reached or index >= len(self.code.instructions):
+                continue
+            reached.add(index)
+            stack.extend(edges.get(index, set()))
+            if index not in stops:
+                stack.append(index + 1)
+        return reached
+
+    def live_branches (self):
+        """(reachable entries, live branches): starting from all branches, drop
+           those left with an unreachable origin or init load, until none are."""
+        branches = list(self.code.branches)
+        while True:
+            reached = self.reach(branches)
+            live    = [branch for branch in branches if self.origin(branch) in reached and (branch.init_load is None or self.init_position(branch) in reached)]
+            if len(live) == len(branches):
+                return (reached, live)
+            branches = live
+
+    def operand_labels (self, instructions):
+        labels = set()
+        for instruction in instructions:
+            for operand in ["A", "B", "D", "DA", "DB"]:
+                value = self.try_int(getattr(instruction, operand))
+                if type(value) is str:
+                    labels.add(value)
+        return labels
+
+    def remove_instructions (self, entry, instructions):
+        """Remove instructions from an init load list, keeping its label on the first one left."""
+        label = entry[0].label if len(entry) > 0 else None
+        for instruction in instructions:
+            entry.remove(instruction)
+        if len(entry) > 0 and entry[0].label is None:
+            entry[0].label = label
+
+    def strip_code (self):
+        """Remove unreachable entries, dead branches and unaccessed pointers, and their init loads.
+           Returns the number of instructions removed."""
+        code            = self.code
+        (reached, live) = self.live_branches()
+        live_ids        = set(id(branch) for branch in live)
+        dead_branches   = [branch for branch in code.branches if id(branch) not in live_ids]
+        init_lists      = set(id(init_load.instructions) for init_load in code.init_loads)
+        entries         = [entry for index, entry in enumerate(code.instructions) if index in reached]
+        accessed        = self.operand_labels(entry for entry in entries if id(entry) not in init_lists)
+        dead_pointers   = [pointer for pointer in self.data.pointers if pointer.label not in accessed]
+        count           = sum(len(entry) if type(entry) == list else 1 for entry in code.instructions)
+        # Init loads shared with live branches keep their list
+        emptied = set()
+        for branch in dead_branches:
+            if branch.init_load is not None and self.init_position(branch) in reached:
+                entry = branch.init_load.instructions
+                self.remove_instructions(entry, [instruction for instruction in branch.init_instructions if instruction in entry])
+                if len(entry) == 0:
+                    emptied.add(id(entry))
+        for pointer in dead_pointers:
+            init_load = code.lookup_init_load(pointer.label)
+            if init_load is not None:
+                emptied.add(id(init_load.instructions))
+        kept     = [entry for entry in entries if id(entry) not in emptied]
+        kept_ids = set(id(entry) for entry in kept)
+        # A pointer dropped after a removed entry is dropped after the last entry kept before it
+        previous = dict()
+        last     = None
+        for entry in code.instructions:
+            previous[id(entry)] = last
+            if id(entry) in kept_ids:
+                last = entry
+        dead_labels        = set(pointer.label for pointer in dead_pointers)
+        code.pointer_drops = [(label, entry if entry is None or id(entry) in kept_ids else previous[id(entry)])
+                              for label, entry in code.pointer_drops if label not in dead_labels]
+        code.instructions[:]    = kept
+        code.init_loads[:]      = [init_load for init_load in code.init_loads if id(init_load.instructions) in kept_ids]
+        code.branches[:]        = live
+        self.data.pointers[:]   = [pointer for pointer in self.data.pointers if pointer.label not in dead_labels]
+        self.dead_branches  = len(dead_branches)
+        self.dead_pointers  = len(dead_pointers)
+        return count - sum(len(entry) if type(entry) == list else 1 for entry in kept)
+
+    def literal_used (self, variable, instructions):
+        for instruction in instructions:
+            value = self.try_int(getattr(instruction, variable.memory))
+            if type(value) is type(variable.value) and value == variable.value:
+                return True
+        return False
+
+    def pack (self, memory):
+        """Give the pool variables of a memory consecutive addresses again, in the same order."""
+        variables = sorted((variable for variable in self.data.shared if variable.memory == memory and variable.address not in [None, 0]), key = lambda variable: variable.address)
+        address   = self.configuration.memory_map.pool[0]
+        for variable in variables:
+            variable.address = address
+            address         += variable.word_count()
+
+    def strip_data (self, before):
+        """Remove the variables and pool literals no instruction or pointer references.
+           Returns (variables removed, data words freed from those which would have had an address)."""
+        instructions = list(self.code.all_instructions())
+        referenced   = self.operand_labels(instructions) | set(pointer.base for pointer in self.data.pointers)
+        removed      = []
+        for variables in [self.data.shared, self.data.private]:
+            for variable in list(variables):
+                if variable.label is not None:
+                    dead = variable.label not in referenced
+                else:
+                    dead = variable.address not in [None, 0] and not self.literal_used(variable, instructions)
+                if dead:
+                    variables.remove(variable)
+                    removed.append(variable)
+        for memory in ["A", "B"]:
+            if any(variable.label is None and variable.memory == memory for variable in removed):
+                self.pack(memory)
+        words = sum(variable.word_count() for variable in removed if variable.label is None or variable.label in before)
+        return (len(removed), words)
+
+    def strip (self):
+        code = self.code
+        if any(pc not in self.labels for pc in code.initial_pc):
+            print("Dead code: the initial program counters {0} are not all code labels. Nothing stripped.".format(code.initial_pc))
+            return
+        before              = self.operand_labels(code.all_instructions()) | set(pointer.base for pointer in self.data.pointers)
+        instructions        = self.strip_code()
+        (variables, words)  = self.strip_data(before)
+        print("Dead code: {0} instruction(s), {1} branch(es), {2} pointer(s) and {3} variable(s) stripped, freeing {4} data word(s)".format(
+              instructions, self.dead_branches, self.dead_pointers, variables, words))
+
+class Offset_Packing (Debug):
+    """Sizes each thread's private memory to what it holds, instead of an equal
+       share. Private variables move to new addresses, those of the most threads
+       lowest, so a variable only some threads have ends up above the common ones,
+       and variables of disjoint threads overlap. The default offsets then pack
+       each thread's private words right after the previous thread's.
+       Variables written by a dual instruction keep their order at the bottom,
+       as DA and DB only reach the start of memory. Runs on resolved operands."""
+
+    def __init__ (self, data, code, configuration):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.memory_map     = configuration.memory_map
+        self.default_offset = configuration.default_offset
+
+    def widen (self):
+        """Let a single thread's private variables take all of the private memory, until the footprints are known."""
+        start = self.memory_map.private.start
+        self.memory_map.private = range(start, start + self.default_offset.available)
+
+    def instructions (self):
+        """All the instructions, including the init loads moved into the reset state."""
+        instructions = list(self.code.all_instructions())
+        seen         = set(id(instruction) for instruction in instructions)
+        instructions.extend(instruction for init_load in self.code.reset_loads for instruction in init_load if id(instruction) not in seen)
+        return instructions
+
+    def dual_written (self, instructions):
+        """(memory, address) of the private words written through DA or DB."""
+        written = set()
+        for instruction in instructions:
+            if self.code.is_instruction_dual(instruction) is True:
+                written.add(("A", instruction.DA))
+                written.add(("B", instruction.DB - self.memory_map.write_bases["B"]))
+        return written
+
+    def relocate (self, memory, variables, dual):
+        """Give the private variables of a memory new addresses. Returns ({old address:new address} per word, {thread:top address})."""
+        start   = self.memory_map.private.start
+        pinned  = set(id(variable) for variable in variables
+                      if any((memory, address) in dual for address in range(variable.address, variable.address + variable.word_count())))
+        order   = sorted(variables, key = lambda variable: (id(variable) not in pinned, -len(variable.threads()), variable.address))
+        tops    = {thread:start for thread in range(self.configuration.thread_count)}
+        moves   = dict()
+        for variable in order:
+            threads = variable.threads()
+            address = max(tops[thread] for thread in threads)
+            size    = variable.word_count()
+            for word in range(size):
+                moves[variable.address + word] = address + word
+            for thread in threads:
+                tops[thread] = address + size
+            variable.address = address
+        return (moves, tops)
+
+    def remap (self, instructions, moves):
+        write_bases = self.memory_map.write_bases
+        for instruction in instructions:
+            for memory in ["A", "B"]:
+                address = getattr(instruction, memory)
+                setattr(instruction, memory, moves[memory].get(address, address))
+            for field in ["D", "DA", "DB"]:
+                address = getattr(instruction, field)
+                if type(address) is not int or address >= write_bases["I"]:
+                    continue
+                memory = "A" if address < write_bases["B"] else "B"
+                local  = address - write_bases[memory]
+                setattr(instruction, field, moves[memory].get(local, local) + write_bases[memory])
+        for pointer in self.data.pointers:
+            if pointer.address is not None:
+                pointer.base = moves[pointer.memory[-1]].get(pointer.base, pointer.base)
+
+    def pack (self):
+        instructions = self.instructions()
+        dual         = self.dual_written(instructions)
+        moves        = dict()
+        footprints   = [0] * self.configuration.thread_count
+        start        = self.memory_map.private.start
+        for memory in ["A", "B"]:
+            variables      = [variable for variable in self.data.private if variable.memory == memory and variable.address is not None and len(variable.threads()) > 0]
+            (moves[memory], tops) = self.relocate(memory, variables, dual)
+            for thread, top in tops.items():
+                footprints[thread] = max(footprints[thread], top - start)
+        self.remap(instructions, moves)
+        total = sum(footprints)
+        if total > self.default_offset.available:
+            print("Offset packing: the threads need {0} private words ({1} per thread), but only {2} exist.".format(total, footprints, self.default_offset.available))
+            self.ask_for_debugger()
+        self.default_offset.pack(footprints)
+        print("Offset packing: {0} private word(s) per thread, default offsets {1}, {2} of {3} words free".format(
+              footprints, self.default_offset.offsets, self.default_offset.available - total, self.default_offset.available))
+
+class Instruction_Stream (Debug):
+    """Dependencies between top-level instructions on resolved addresses, and
+       safe places to insert or remove them, for the passes which change the
+       instruction stream just before it gets addresses."""
+
+    def __init__ (self, data, code, configuration):
+        Debug.__init__(self)
+        self.data           = data
+        self.code           = code
+        self.configuration  = configuration
+        self.memory_map     = configuration.memory_map
+
+    def write_addresses (self, instruction):
+        if self.code.is_instruction_dual(instruction):
+            return [instruction.DA, instruction.DB]
+        return [instruction.D]
+
+    def effects (self, instruction):
+        """(reads, writes) as (memory, address) pairs, or None if it writes I or H memory.
+           Indirect accesses stand for any address of their memory, and also
+           step their pointer. Ports also stand for their device."""
+        memory_map = self.memory_map
+        reads      = set()
+        writes     = set()
+        for memory, address in [("A", instruction.A), ("B", instruction.B)]:
+            if address in memory_map.indirect:
+                reads.add((memory, None))
+                writes.add((memory, None))
+            elif address in memory_map.io:
+                reads.add(("port", address - memory_map.io.start))
+                writes.add(("port", address - memory_map.io.start))
+            elif address != 0:
+                reads.add((memory, address))
+        for address in self.write_addresses(instruction):
+            if address >= memory_map.write_bases["I"]:
+                return None
+            memory = "A" if address < memory_map.write_bases["B"] else "B"
+            local  = address - memory_map.write_bases[memory]
+            if local in memory_map.indirect:
+                reads.add((memory, None))
+                writes.add((memory, None))
+            elif local in memory_map.io:
+                writes.add(("port", local - memory_map.io.start))
+            elif local != 0:
+                writes.add((memory, local))
+        return (reads, writes)
+
+    def overlap (self, accesses, other_accesses):
+        for (memory, address) in accesses:
+            if (memory, address) in other_accesses:
+                return True
+            if memory != "port" and (address is None or (memory, None) in other_accesses) and any(entry[0] == memory for entry in other_accesses):
+                return True
+        return False
+
+    def conflicts (self, first, second):
+        """Must the two instructions stay in order?"""
+        effects = [self.effects(first), self.effects(second)]
+        if None in effects:
+            return True
+        ((reads, writes), (other_reads, other_writes)) = effects
+        return self.overlap(reads, other_writes) or self.overlap(writes, other_reads) or self.overlap(writes, other_writes)
+
+    def origin_branches (self, instruction):
+        return [branch for branch in self.code.branches if branch.instruction is instruction]
+
+    def uses_flags (self, branch):
+        """Does the branch condition depend on the result of the instruction before its origin?"""
+        condition = branch.condition
+        op        = getattr(self.code.operators.dyadic, condition.ab_operator).uint
+        uses_a    = any(((op >> ((1 << 1) | b)) & 1) != ((op >> b) & 1) for b in [0, 1])
+        uses_b    = any(((op >> ((a << 1) | 1)) & 1) != ((op >> (a << 1)) & 1) for a in [0, 1])
+        return (uses_a and condition.a != "a_external") or (uses_b and condition.b not in ["b_counter", "b_external"])
+
+    def uses_previous (self, entry):
+        """Does the entry depend on the instruction just before it, through R or the branch flags?"""
+        if type(entry) is list:
+            return False
+        if self.code.opcodes.lookup_opcode(entry.opcode).uses_previous_result():
+            return True
+        return any(self.uses_flags(branch) for branch in self.origin_branches(entry))
+
+    def insertion_reason (self, index):
+        """None if an instruction can go before the top-level entry at index, else why not."""
+        entry = self.code.instructions[index]
+        if type(entry) is list:
+            return "it is an init load"
+        if self.uses_previous(entry):
+            return "it depends on the instruction before it"
+        if self.code.lands_past_label(entry.label):
+            return self.code.landed_past_label
+        return None
+
+    def insert (self, index, instruction):
+        """Put the instruction before the entry at index. The label moves onto it, so branches to the entry run it too."""
+        entry = self.code.instructions[index]
+        instruction.label = entry.label
+        entry.label       = None
+        self.code.instructions.insert(index, instruction)
+
+    def block_end (self, index):
+        """Top-level index of the last entry of the basic block holding index."""
+        instructions = self.code.instructions
+        while index + 1 < len(instructions):
+            entry = instructions[index]
+            after = instructions[index + 1]
+            if type(entry) is list or type(after) is list or after.label is not None or len(self.origin_branches(entry)) > 0:
+                break
+            index += 1
+        return index
+
+class Port_Scheduler (Instruction_Stream):
+    """Spaces each read of a port after the writes to ports of the same number,
+       by the latency of the port. The barrel issues each thread once every
+       thread_count cycles, so a latency of L cycles needs L / thread_count
+       instruction slots (rounded up) from the write to the read, along every
+       path. Source nops padding before such reads are removed first. Then,
+       for each read too close to a write, later independent instructions of
+       the same basic block move up before the read, and nops fill whatever
+       gap is left. Runs on resolved addresses, once no other pass adds or
+       removes instructions."""
+
+    def __init__ (self, data, code, configuration):
+        Instruction_Stream.__init__(self, data, code, configuration)
+        self.slots          = self.port_slots()
+        self.moved          = 0
+        self.nops           = 0
+        self.removed        = 0
+
+    def port_slots (self):
+        """{port number:instruction slots from a write to a read}, for ports with a latency."""
+        slots = dict()
+        for port in self.data.ports:
+            if port.latency is None:
+                continue
+            count = max(1, -(-port.latency // self.configuration.thread_count))
+            slots[port.number] = max(count, slots.get(port.number, 1))
+        return slots
+
+    def ports_read (self, instruction):
+        io = self.memory_map.io
+        return set(address - io.start for address in [instruction.A, instruction.B] if address in io)
+
+    def ports_written (self, instruction):
+        io    = self.memory_map.io
+        ports = set()
+        for address in self.write_addresses(instruction):
+            for memory in ["A", "B"]:
+                local = address - self.memory_map.write_bases[memory]
+                if local in io:
+                    ports.add(local - io.start)
+        return ports
+
+    def is_padding (self, entry):
+        return type(entry) is not list and entry.label is None and len(self.origin_branches(entry)) == 0 \
+               and self.code.opcodes.lookup_opcode(entry.opcode).label == "nop" and (entry.A, entry.B, entry.D) == (0, 0, 0)
+
+    def pads_read (self, index):
+        """Is the entry at index shortly before a read of a port with a latency, in the same basic block?"""
+        if len(self.slots) == 0:
+            return False
+        instructions = self.code.instructions
+        window       = instructions[index + 1:min(self.block_end(index), index + max(self.slots.values())) + 1]
+        return any(type(after) is not list and len(self.ports_read(after) & set(self.slots)) > 0 for after in window)
+
+    def remove_padding (self):
+        """Remove source nops sitting just before a read of a port with a latency."""
+        instructions = self.code.instructions
+        index = 0
+        while index < len(instructions):
+            if self.is_padding(instructions[index]) and self.pads_read(index):
+                del instructions[index]
+                self.removed += 1
+                continue
+            index += 1
+
+    def shortfall (self, flow, position):
+        """Slots missing between the instruction at a flow position and the closest earlier write of a port it reads."""
+        ports   = self.ports_read(flow.instructions[position]) & set(self.slots)
+        if len(ports) == 0:
+            return 0
+        need    = 0
+        level   = {position}
+        for distance in range(1, max(self.slots[port] for port in ports)):
+            level = set(predecessor for current in level for predecessor in flow.predecessors[current])
+            for predecessor in level:
+                for port in ports & self.ports_written(flow.instructions[predecessor]):
+                    need = max(need, self.slots[port] - distance)
+        return need
+
+    def nop (self, source):
+        opcodes = self.code.opcodes
+        if "nop" not in opcodes.defined_opcodes or (self.configuration.schedule_opcodes is True and "nop" not in opcodes.schedule):
+            print("Port scheduling needs a \"nop\" opcode to pad port reads, at {0}.".format(source))
+            self.ask_for_debugger()
+        return Instruction(opcode = opcodes.resolve_opcode("nop"), D = 0, A = 0, B = 0, source = source)
+
+    def pad (self, instruction, need):
+        """Fill need slots before the instruction: first with later instructions of its basic block, then nops."""
+        instructions = self.code.instructions
+        index        = [position for position, entry in enumerate(instructions) if entry is instruction][0]
+        point        = index
+        # Move up past entries which must keep the instruction before them, but not past a port write
+        while self.insertion_reason(point) is not None:
+            previous = point - 1
+            if previous < 0 or self.block_end(previous) < point or len(self.ports_written(instructions[previous])) > 0:
+                print("Port scheduling: cannot pad before {0}, since {1}. Pad it by hand.".format(instruction.describe(), self.insertion_reason(point)))
+                self.ask_for_debugger()
+            point = previous
+        candidate = index + 1
+        while need > 0 and candidate <= self.block_end(index) and candidate < len(instructions):
+            entry = instructions[candidate]
+            if self.movable(point, candidate):
+                del instructions[candidate]
+                self.insert(point, entry)
+                point  += 1
+                index  += 1
+                need   -= 1
+                self.moved += 1
+            candidate += 1
+        for count in range(need):
+            self.insert(point, self.nop(instruction.source))
+            point += 1
+            self.nops += 1
+
+    def movable (self, point, candidate):
+        """Can the entry at candidate move before the entry at point, in the same basic block?"""
+        instructions = self.code.instructions
+        entry        = instructions[candidate]
+        if type(entry) is list or entry.label is not None or len(self.origin_branches(entry)) > 0 or self.is_padding(entry):
+            return False
+        if len((self.ports_read(entry) | self.ports_written(entry)) & set(self.slots)) > 0:
+            return False
+        if self.uses_previous(entry):
+            return False
+        if candidate + 1 < len(instructions) and self.uses_previous(instructions[candidate + 1]):
+            return False
+        return not any(self.conflicts(other, entry) for other in instructions[point:candidate])
+
+    def schedule (self):
+        if len(self.slots) == 0:
+            return
+        self.remove_padding()
+        while True:
+            flow    = Control_Flow(self.code, self.configuration)
+            pending = [(position, self.shortfall(flow, position)) for position in range(len(flow.instructions))]
+            pending = [(position, need) for position, need in pending if need > 0]
+            if len(pending) == 0:
+                break
+            (position, need) = pending[0]
+            instruction = flow.instructions[position]
+            if not any(entry is instruction for entry in self.code.instructions):
+                print("Port scheduling: cannot pad a port read inside an init load: {0}".format(instruction.describe()))
+                self.ask_for_debugger()
+            self.pad(instruction, need)
+        print("Port scheduling: {0} padding nop(s) removed, {1} instruction(s) moved, {2} nop(s) added".format(self.removed, self.moved, self.nops))
+
+class Peephole (Instruction_Stream):
+    """Rewrites of short instruction sequences, on resolved addresses:
+       a copy "add X Y 0" (or "add X 0 Y") to a private X read next in its
+       basic block, and dead after that read, goes, and the read reads Y;
+       an instruction which only writes the zero register (address 0), such
+       as a nop hosting a jmp, moves its branches to the previous instruction
+       of its basic block, if they do not depend on flags, and goes;
+       the same without branches just goes, unless it pads a port read.
+       Nothing goes if the next instruction depends on its result or flags."""
+
+    def __init__ (self, data, code, configuration):
+        Instruction_Stream.__init__(self, data, code, configuration)
+        self.ports  = Port_Scheduler(data, code, configuration)
+        # {rule:instructions saved}
+        self.saved  = {"copies folded":0, "branches folded":0, "zero writes removed":0}
+
+    def reads (self, instruction, memory, address):
+        return getattr(instruction, memory) == address
+
+    def writes (self, instruction, memory, address):
+        return self.memory_map.write_bases[memory] + address in self.write_addresses(instruction)
+
+    def inert (self, instruction):
+        """Writes nothing but the zero register, and reads no port or pointer."""
+        effects = self.effects(instruction)
+        return effects is not None and len(effects[1]) == 0
+
+    def pointed (self, memory, address):
+        """Can a pointer reach the address?"""
+        for pointer in self.data.pointers:
+            base = self.data.lookup_variable_name(pointer.base)
+            if base is not None and base.memory == memory and base.address <= address < base.address + base.word_count():
+                return True
+        return False
+
+    def copy_operands (self, instruction):
+        """(X memory, X, Y memory, Y) of a copy from Y to a private X, else None."""
+        memory_map = self.memory_map
+        opcode     = self.code.opcodes.lookup_opcode(instruction.opcode)
+        if opcode.label != "add" or opcode.is_dual() or instruction.D >= memory_map.write_bases["I"]:
+            return None
+        X_memory = "A" if instruction.D < memory_map.write_bases["B"] else "B"
+        X        = instruction.D - memory_map.write_bases[X_memory]
+        if X not in memory_map.private or (instruction.A == 0) == (instruction.B == 0):
+            return None
+        (Y_memory, Y) = ("A", instruction.A) if instruction.B == 0 else ("B", instruction.B)
+        if Y in memory_map.io or (Y_memory, Y) == (X_memory, X):
+            return None
+        return (X_memory, X, Y_memory, Y)
+
+    def live_after (self, flow, position, memory, address):
+        """Is the value at the address read after the position, before being written again?"""
+        uses    = [index for index, instruction in enumerate(flow.instructions) if self.reads(instruction, memory, address)]
+        written = set(index for index, instruction in enumerate(flow.instructions) if self.writes(instruction, memory, address))
+        (live_in, live_out) = flow.live(uses, written)
+        return any(successor in live_in for successor in flow.successors[position])
+
+    def removal_reason (self, index):
+        """None if the top-level instruction at index can go, else why not."""
+        instructions = self.code.instructions
+        entry        = instructions[index]
+        after        = instructions[index + 1] if index + 1 < len(instructions) else None
+        if after is not None and self.uses_previous(after):
+            return "the next instruction uses its result or flags"
+        if entry.label is not None:
+            if after is None or type(after) is list or after.label is not None:
+                return "its label cannot move to the next instruction"
+            if self.code.lands_past_label(entry.label):
+                return self.code.landed_past_label
+        return None
+
+    def remove (self, index, rule):
+        """Remove the instruction at index. Its label moves onto the next instruction."""
+        instructions = self.code.instructions
+        entry        = instructions.pop(index)
+        if entry.label is not None:
+            instructions[index].label = entry.label
+        self.saved[rule] += 1
+        print("Peephole: {0}: {1}, 1 instruction saved".format(entry.describe(), rule))
+
+    def fold_copy (self, flow, index):
+        instructions = self.code.instructions
+        copy         = instructions[index]
+        operands     = self.copy_operands(copy)
+        if operands is None or len(self.origin_branches(copy)) > 0 or self.removal_reason(index) is not None:
+            return False
+        (X_memory, X, Y_memory, Y) = operands
+        if self.pointed(X_memory, X):
+            return False
+        consumer = None
+        for candidate in instructions[index + 1:self.block_end(index) + 1]:
+            effects = self.effects(candidate)
+            if type(candidate) is list or effects is None:
+                return False
+            if self.reads(candidate, X_memory, X):
+                consumer = candidate
+                break
+            # X must reach the consumer, and Y must not change before it,
+            # nor the pointer of an indirect Y move
+            (reads, writes) = effects
+            if (X_memory, None) in reads or self.writes(candidate, X_memory, X) or self.writes(candidate, Y_memory, Y) or (Y_memory, None) in writes:
+                return False
+            if Y in self.memory_map.indirect and (Y_memory, None) in reads:
+                return False
+        if consumer is None:
+            return False
+        if not self.writes(consumer, X_memory, X) and self.live_after(flow, flow.position(consumer), X_memory, X):
+            return False
+        if X_memory == Y_memory:
+            setattr(consumer, X_memory, Y)
+        elif getattr(consumer, Y_memory) == 0 and self.code.is_instruction_commutative(consumer):
+            setattr(consumer, X_memory, 0)
+            setattr(consumer, Y_memory, Y)
+        else:
+            return False
+        self.remove(index, "copies folded")
+        return True
+
+    def fold_branches (self, index):
+        instructions = self.code.instructions
+        entry        = instructions[index]
+        branches     = self.origin_branches(entry)
+        if len(branches) == 0 or not self.inert(entry) or entry.label is not None or index == 0:
+            return False
+        previous = instructions[index - 1]
+        if type(previous) is list or len(self.origin_branches(previous)) > 0 or self.removal_reason(index) is not None:
+            return False
+        if any(branch.prediction in [self.configuration.branch_label_anywhere, self.configuration.branch_label_anywhere_cancel] or self.uses_flags(branch) for branch in branches):
+            return False
+        # The previous instruction must not be cancelled when the branch mispredicts
+        for branch in branches:
+            branch.instruction = previous
+            branch.prediction  = self.configuration.branch_label_none
+        self.remove(index, "branches folded")
+        return True
+
+    def remove_zero_write (self, index):
+        entry = self.code.instructions[index]
+        if not self.inert(entry) or len(self.origin_branches(entry)) > 0 or self.removal_reason(index) is not None or self.ports.pads_read(index):
+            return False
+        self.remove(index, "zero writes removed")
+        return True
+
+    def optimize (self):
+        changed = True
+        while changed:
+            changed = False
+            flow    = Control_Flow(self.code, self.configuration)
+            for index, entry in enumerate(self.code.instructions):
+                if type(entry) is list:
+                    continue
+                if self.fold_copy(flow, index) or self.fold_branches(index) or self.remove_zero_write(index):
+                    changed = True
+                    break
+        print("Peephole: {0} instruction(s) saved: {1}".format(sum(self.saved.values()), ", ".join("{0} {1}".format(count, rule) for rule, count in self.saved.items())))
@@ -33,7 +33,9 @@ class Parser (Debug):
 
     def parse_file (self, filename):
         with open(filename) as f:
-            for raw_line in f.readlines():
+            for line_number, raw_line in enumerate(f.readlines(), start = 1):
+                # Remember where code comes from, to map it back from the binary later
+                self.commands.set_source(filename, line_number, raw_line.strip())
                 self.parse_line(raw_line)
 
 # These are assembler commands, not related to the programming itself.
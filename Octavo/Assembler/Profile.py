@@ -0,0 +1,131 @@
+#! /usr/bin/python3
+
+"""Profile-guided branch prediction. Branches given the "auto" prediction are
+   written as "not_taken": the origin instruction belongs to the fall-through
+   path, and gets cancelled when the branch is taken. A cancelled instruction
+   still uses up its issue slot, so changing only the prediction bits cannot
+   save cycles without changing what the program does. Instead, when the
+   profile shows the branch is taken more often than not, we copy the first
+   instruction of the destination into the origin slot, predict "taken", and
+   branch to the instruction after the destination. The original origin
+   instruction moves down one slot, and is only reached when not taken.
+   The taken path then saves a cycle, and the fall-through path pays one."""
+
+from json           import load
+from Debug          import Debug
+from Code           import Instruction
+
+class Branch_Profile (Debug):
+    """Per-branch outcome counts, from the JSON counters report of the Simulator.
+       Branches are identified by their destination label."""
+
+    def __init__ (self, filename):
+        Debug.__init__(self)
+        self.filename = filename
+        self.reached  = dict()
+        self.taken    = dict()
+        with open(filename, 'r') as f:
+            report = load(f)
+        for row in report["branches"]:
+            label = row["label"]
+            if label is None:
+                continue
+            # A branch may use more than one Branch Detector configuration over a run
+            self.reached[label] = self.reached.get(label, 0) + row["reached"]
+            self.taken[label]   = self.taken.get(label, 0)   + row["predicate"]
+
+    def counts (self, label):
+        """Return (reached, taken) for a branch, or None if the profile never reached it."""
+        if self.reached.get(label, 0) == 0:
+            return None
+        return (self.reached[label], self.taken[label])
+
+class Branch_Prediction (Debug):
+    """Replaces "auto" branch predictions with "not_taken", or with "taken" and
+       a copy of the destination instruction, whichever the profile shows
+       cancels fewer instructions. Runs after Allocation, before Resolution."""
+
+    def __init__ (self, code, configuration, profile = None):
+        Debug.__init__(self)
+        self.code           = code
+        self.configuration  = configuration
+        self.profile        = profile
+
+    def attached_branches (self, instruction):
+        return [branch for branch in self.code.branches if branch.instruction is instruction]
+
+    def position (self, instruction):
+        """Index of a top-level instruction in the code, or None if part of an init load."""
+        for index, entry in enumerate(self.code.instructions):
+            if entry is instruction:
+                return index
+        return None
+
+    def opcode_loads_between (self, first, last):
+        """Does any opcode load sit between two top-level instruction indices?"""
+        od = self.configuration.memory_map.od
+        for entry in self.code.instructions[min(first, last):max(first, last) + 1]:
+            if type(entry) is list and len(entry) > 0 and entry[0].D in od:
+                return True
+        return False
+
+    def hoist_reason (self, branch):
+        """Return None if the destination instruction can be copied into the origin slot, else why not."""
+        origin      = branch.instruction
+        destination = self.code.lookup_instruction(branch.destination)
+        origin_index      = self.position(origin)
+        destination_index = self.position(destination)
+        if origin_index is None or destination_index is None:
+            return "origin or destination is part of an init load"
+        if destination_index == origin_index + 1:
+            return "destination is the fall-through instruction"
+        if destination_index + 1 >= len(self.code.instructions):
+            return "destination is the last instruction"
+        if len(self.attached_branches(origin)) > 1:
+            return "other branches share the origin instruction"
+        if len(self.attached_branches(destination)) > 0:
+            return "the destination instruction has branches of its own"
+        if self.opcode_loads_between(origin_index, destination_index):
+            return "an opcode load lies between origin and destination"
+        if self.code.lands_past_label(origin.label):
+            return self.code.landed_past_label
+        return None
+
+    def hoist (self, branch):
+        """Copy the destination instruction into the origin slot, and move the origin instruction after it.
+           The origin label moves onto the copy, so jumps to it (and threads starting there) run the branch too."""
+        origin      = branch.instruction
+        destination = self.code.lookup_instruction(branch.destination)
+        copy        = Instruction(opcode = destination.opcode, D = destination.D, DA = destination.DA, DB = destination.DB,
+                                  A = destination.A, B = destination.B, source = destination.source)
+        self.code.instructions.insert(self.position(origin), copy)
+        copy.label                  = origin.label
+        origin.label                = None
+        branch.instruction          = copy
+        branch.destination_offset   = 1
+        branch.prediction           = self.configuration.branch_label_taken
+
+    def assign (self):
+        configuration = self.configuration
+        for branch in self.code.branches:
+            if branch.prediction != configuration.branch_label_auto:
+                continue
+            branch.prediction = configuration.branch_label_not_taken
+            label = branch.destination_label
+            if self.profile is None:
+                continue
+            counts = self.profile.counts(label)
+            if counts is None:
+                print("Branch {0}: not reached in profile {1}, predicted {2}".format(label, self.profile.filename, branch.prediction))
+                continue
+            (reached, taken) = counts
+            # not_taken cancels on every taken branch, taken (with the copy) on every fall-through.
+            if reached - taken >= taken:
+                print("Branch {0}: predicted {1}, cancelling {2} of {3}".format(label, branch.prediction, taken, reached))
+                continue
+            reason = self.hoist_reason(branch)
+            if reason is not None:
+                print("Branch {0}: predicted {1}, cancelling {2} of {3}, since {4}".format(label, branch.prediction, taken, reached, reason))
+                continue
+            self.hoist(branch)
+            print("Branch {0}: predicted {1} with the destination instruction copied to the origin, cancelling {2} of {3} instead of {4}".format(label, branch.prediction, reached - taken, reached, taken))
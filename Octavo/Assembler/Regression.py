@@ -0,0 +1,321 @@
+#! /usr/bin/python3
+
+"""Regression and timing harness for the benchmarks directory. Each benchmark
+   is re-assembled in a scratch copy of the benchmarks tree, and the new
+   memory images must match the committed ones byte for byte. The committed
+   images then run in the Simulator, and each thread's output port stream
+   must match a Python reference model of the benchmark. Variants assemble
+   the same benchmarks with optional passes: their images are not committed,
+   so the new images run instead, and only their outputs are checked.
+   Assembly time and simulated cycles per element are reported, and can be
+   appended to a history file to follow performance over time."""
+
+from os             import path, listdir, remove
+from sys            import executable, exit
+from json           import load, dumps
+from time           import perf_counter, strftime
+from shutil         import copytree
+from tempfile       import TemporaryDirectory
+from subprocess     import run, DEVNULL, PIPE, STDOUT, TimeoutExpired
+from argparse       import ArgumentParser
+from Debug          import Debug
+from Configuration  import Configuration
+from Simulator      import Simulator
+
+here = path.dirname(path.abspath(__file__))
+
+# ---------------------------------------------------------------------------
+
+class Benchmark (Debug):
+    """How to run one benchmark and check its output: the output port label,
+       the array variable it works on, its Python reference model, and the
+       Assembler options to build it with. The committed images were built
+       with those options, unless it is a variant (committed = False).
+       The test benches for the benchmarks without accelerators use A0 as
+       an external port, so these also run without accelerators."""
+
+    def __init__ (self, name, port, array, reference, accelerators = True, flags = None, committed = True):
+        Debug.__init__(self)
+        self.name           = name
+        self.port           = port
+        self.array          = array
+        self.reference      = reference
+        self.accelerators   = accelerators
+        self.flags          = flags if flags is not None else []
+        self.committed      = committed
+
+    def source (self):
+        return self.name + ".asm"
+
+    def title (self):
+        if self.committed:
+            return self.name
+        return " ".join([self.name] + self.flags)
+
+    def configuration (self):
+        """As the Assembler options set it, for the Simulator."""
+        configuration = Configuration()
+        if "--shared-count" in self.flags:
+            configuration.set_shared_count(int(self.flags[self.flags.index("--shared-count") + 1]))
+        return configuration
+
+    def variant (self, flags):
+        return Benchmark(self.name, self.port, self.array, self.reference, self.accelerators, self.flags + flags, committed = False)
+
+benchmarks = [Benchmark("hailstone-s",      "seed_out", "seeds", "hailstone"),
+              Benchmark("hailstone-arrays", "seed_out", "seeds", "hailstone", accelerators = False),
+              Benchmark("array-reverse-3",  "output",   "array", "reverse",   accelerators = False),
+              Benchmark("repeat-odd-liveness", "out",   "values", "repeat_odd", accelerators = False, flags = ["--allocate-liveness"]),
+              Benchmark("repeat-odd-opcodes", "out",    "values", "repeat_odd", accelerators = False, flags = ["--schedule-opcodes"]),
+              Benchmark("count-up-hoist",   "out",      "x",     "count_up",   accelerators = False, flags = ["--profile", "profile.json"]),
+              Benchmark("hailstone-parallel", "seed_out", "seeds", "hailstone", accelerators = False)]
+
+# The optional passes on the benchmarks above, checked against the same reference models.
+passes = [["--preload-state"],
+          ["--hoist-init"],
+          ["--allocate-liveness"],
+          ["--schedule-opcodes"],
+          ["--assign-banks"],
+          ["--place-data"],
+          ["--schedule-ports"],
+          ["--peephole", "--strip-dead"],
+          ["--pack-offsets", "--dedup-private", "--shared-count", "40"],
+          ["--lanes", "2"]]
+# These load their own opcodes, so cannot have them scheduled.
+opcode_loads = ["hailstone-arrays", "hailstone-parallel"]
+plain = {benchmark.name:benchmark for benchmark in benchmarks}
+benchmarks += [plain[name].variant(flags) for name in ["hailstone-s", "hailstone-arrays", "array-reverse-3", "hailstone-parallel"] for flags in passes
+               if not (name in opcode_loads and "--schedule-opcodes" in flags)]
+
+# ---------------------------------------------------------------------------
+
+class Reference (Debug):
+    """Python models of the benchmarks. Each returns the first count values
+       a thread writes to the output port, given the thread's initial array."""
+
+    def __init__ (self, word_width):
+        Debug.__init__(self)
+        self.word_mask = (1 << word_width) - 1
+
+    def hailstone_step (self, x):
+        """Modified Hailstone, as the benchmarks compute it."""
+        if x % 2 == 1:
+            return ((3 * x) + 1) // 2
+        return x // 2
+
+    def hailstone (self, array, count):
+        """Step each array element in place and output it, over and over."""
+        array  = list(array)
+        output = []
+        while len(output) < count:
+            for index in range(len(array)):
+                array[index] = self.hailstone_step(array[index]) & self.word_mask
+                output.append(array[index])
+        return output[:count]
+
+    def reverse (self, array, count):
+        """Output -1 after each full reversal of the array."""
+        return [-1 & self.word_mask] * count
+
+    def repeat_odd (self, array, count):
+        """Output each array element, and odd elements twice, over and over."""
+        output = []
+        while len(output) < count:
+            for x in array:
+                output.extend([x] * (1 + (x % 2)))
+        return output[:count]
+
+    def count_up (self, array, count):
+        """Output the variable, then add 2 to it, over and over."""
+        return [(array[0] + (2 * step)) & self.word_mask for step in range(count)]
+
+    def elements (self, name, array):
+        """Array elements processed per output."""
+        if name == "reverse":
+            return len(array)
+        if name == "repeat_odd":
+            return len(array) / (len(array) + sum(x % 2 for x in array))
+        return 1
+
+    def check_golden_hailstone (self, filename):
+        """Check the model against the archived (unmodified) Hailstone sequence,
+           where each 3x+1 step is followed by a halving the model folds in."""
+        with open(filename, 'r') as f:
+            golden = [int(line) for line in f if line.strip() != ""]
+        seed     = int(path.splitext(filename)[0].split("_")[-1])
+        expected = []
+        previous = seed
+        for value in golden:
+            if previous % 2 == 0:
+                expected.append(value)
+            previous = value
+        computed = []
+        x = seed
+        while x != 1:
+            x = self.hailstone_step(x)
+            computed.append(x)
+        return computed == expected
+
+# ---------------------------------------------------------------------------
+
+class Regression (Debug):
+    """Assembles, simulates, and checks the benchmarks."""
+
+    def __init__ (self, benchmarks_directory, cycles = 20000, timeout = 600):
+        Debug.__init__(self)
+        self.directory  = benchmarks_directory
+        self.cycles     = cycles
+        self.timeout    = timeout
+        self.assembler  = path.join(here, "Assembler.py")
+
+    def image_files (self, directory):
+        """The committed Generator output of a benchmark."""
+        configuration = Configuration()
+        return sorted([filename for filename in listdir(directory) if filename.endswith(".mem") or filename == configuration.filename_symbols])
+
+    def assemble (self, benchmark, scratch):
+        """Assemble in a scratch copy, so the committed images stay untouched.
+           Returns (seconds, list of image files which differ or are missing, error text, scratch benchmark directory).
+           The images of a variant are only checked to exist."""
+        committed = path.join(self.directory, benchmark.name)
+        tree      = path.join(scratch, "benchmarks")
+        copytree(self.directory, tree)
+        work = path.join(tree, benchmark.name)
+        for filename in self.image_files(committed):
+            remove(path.join(work, filename))
+        start = perf_counter()
+        try:
+            result = run([executable, self.assembler] + benchmark.flags + [benchmark.source()], cwd = work, stdin = DEVNULL, stdout = PIPE, stderr = STDOUT, timeout = self.timeout)
+        except TimeoutExpired:
+            return (perf_counter() - start, self.image_files(committed), "timed out", work)
+        seconds = perf_counter() - start
+        error   = None
+        if result.returncode != 0:
+            error = result.stdout.decode(errors = "replace").strip().split("\n")[-1]
+        differences = []
+        for filename in self.image_files(committed):
+            generated = path.join(work, filename)
+            if not path.exists(generated):
+                differences.append(filename)
+                continue
+            if not benchmark.committed:
+                continue
+            with open(generated, 'rb') as new, open(path.join(committed, filename), 'rb') as old:
+                if new.read() != old.read():
+                    differences.append(filename)
+        return (seconds, differences, error, work)
+
+    def symbols (self, directory):
+        configuration = Configuration()
+        with open(path.join(directory, configuration.filename_symbols), 'r') as f:
+            return load(f)
+
+    def variable (self, symbols, label):
+        for variable in symbols["variables"]:
+            if variable["label"] == label:
+                return variable
+        print("No variable {0} in the symbols.".format(label))
+        self.ask_for_debugger()
+
+    def initial_array (self, simulator, symbols, benchmark, thread):
+        variable = self.variable(symbols, benchmark.array)
+        memory   = simulator.A if variable["memory"] == "A" else simulator.B
+        base     = variable["address"]
+        if variable["kind"] == "private":
+            base += symbols["default_offsets"][thread]
+        return memory[base:base + variable["length"]]
+
+    def simulate (self, benchmark, directory):
+        """Returns (seconds, {thread:[output values]}, {thread:initial array}) for the images in directory."""
+        configuration = benchmark.configuration()
+        symbols   = self.symbols(directory)
+        simulator = Simulator(configuration, directory, benchmark.accelerators)
+        arrays    = {thread:self.initial_array(simulator, symbols, benchmark, thread) for thread in range(configuration.thread_count)}
+        port      = self.variable(symbols, benchmark.port)
+        device    = simulator.port(port["memory"], port["address"] - configuration.memory_map.io.start)
+        start     = perf_counter()
+        simulator.run(self.cycles)
+        seconds   = perf_counter() - start
+        outputs   = {thread:device.values(thread) for thread in range(configuration.thread_count)}
+        return (seconds, outputs, arrays)
+
+    def check (self, benchmark):
+        """Returns a result row for one benchmark."""
+        configuration = Configuration()
+        reference = Reference(configuration.memory_width_bits)
+        with TemporaryDirectory() as scratch:
+            (assembly_seconds, differences, error, work) = self.assemble(benchmark, scratch)
+            if benchmark.committed:
+                (simulation_seconds, outputs, arrays) = self.simulate(benchmark, path.join(self.directory, benchmark.name))
+            elif error is None and len(differences) == 0:
+                (simulation_seconds, outputs, arrays) = self.simulate(benchmark, work)
+            else:
+                (simulation_seconds, outputs, arrays) = (0, dict(), dict())
+        model     = getattr(reference, benchmark.reference)
+        mismatches = []
+        elements   = 0
+        for thread, values in outputs.items():
+            expected = model(arrays[thread], len(values))
+            if values != expected:
+                first = next(index for index, (value, wanted) in enumerate(zip(values, expected)) if value != wanted)
+                mismatches.append("thread {0} output {1}: {2} instead of {3}".format(thread, first, values[first], expected[first]))
+            elements += len(values) * reference.elements(benchmark.reference, arrays[thread])
+        row = {"benchmark":benchmark.title(),
+               "committed":benchmark.committed,
+               "images_match":len(differences) == 0 and error is None,
+               "image_differences":differences,
+               "assembler_error":error,
+               "outputs_match":len(mismatches) == 0 and elements > 0,
+               "output_mismatches":mismatches,
+               "outputs":sum(len(values) for values in outputs.values()),
+               "cycles":self.cycles,
+               "elements":elements,
+               "cycles_per_element":round(self.cycles / elements, 3) if elements > 0 else None,
+               "assembly_seconds":round(assembly_seconds, 3),
+               "simulation_seconds":round(simulation_seconds, 3)}
+        return row
+
+    def run (self, names = None):
+        rows = []
+        for benchmark in benchmarks:
+            if names is not None and len(names) > 0 and benchmark.name not in names:
+                continue
+            rows.append(self.check(benchmark))
+        return rows
+
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Re-assemble, simulate, and check the benchmarks against committed images and reference models.")
+    arguments.add_argument("names", nargs = "*", help = "benchmarks to run (default: all)")
+    arguments.add_argument("--directory", default = path.join(here, "benchmarks"))
+    arguments.add_argument("--cycles",  type = int, default = 20000)
+    arguments.add_argument("--history", default = None, help = "append the results as one JSON line to this file")
+    options = arguments.parse_args()
+
+    regression = Regression(options.directory, options.cycles)
+    configuration = Configuration()
+    golden = path.join(here, "archive", "golden_hailstone_77031.txt")
+    golden_match = Reference(configuration.memory_width_bits).check_golden_hailstone(golden)
+    print("Hailstone reference against {0}: {1}".format(path.basename(golden), "PASS" if golden_match else "FAIL"))
+    rows = regression.run(options.names)
+    failed = not golden_match
+    for row in rows:
+        passed = row["images_match"] and row["outputs_match"]
+        failed = failed or not passed
+        # Variant images are only built, not compared
+        images = ("match", "DIFFER") if row["committed"] else ("built", "MISSING")
+        print("{0:20} {1}  images {2}  outputs {3} ({4})  {5} cycles/element  assembly {6}s  simulation {7}s".format(
+              row["benchmark"], "PASS" if passed else "FAIL",
+              images[0] if row["images_match"] else images[1], "match" if row["outputs_match"] else "DIFFER",
+              row["outputs"], row["cycles_per_element"], row["assembly_seconds"], row["simulation_seconds"]))
+        for difference in row["image_differences"]:
+            print("    image {0}: {1}".format("differs" if row["committed"] else "missing", difference))
+        if row["assembler_error"] is not None:
+            print("    assembler: {0}".format(row["assembler_error"]))
+        for mismatch in row["output_mismatches"]:
+            print("    {0}".format(mismatch))
+    if options.history is not None:
+        with open(options.history, 'a') as f:
+            f.write(dumps({"time":strftime("%Y-%m-%d %H:%M:%S"), "results":rows}) + "\n")
+    exit(1 if failed else 0)
@@ -1,9 +1,12 @@
 #! /usr/bin/python3
 
 from sys import exit
+from itertools import chain
 from Utility import Utility
 from Debug import Debug
 from Data import Pointer_Variable
+from Optimizer import Init_Hoisting, Liveness_Allocation, Opcode_Scheduler, Bank_Assignment, Data_Placement, Literal_Spilling, Port_Scheduler, Peephole, Dead_Code, Offset_Packing, Private_Deduplication
+from Lanes import Lane_Check
 
 class Resolver (Utility, Debug):
     """Takes the allocated intermediate structures and resolves names, addresses, and code. The final result gets used for binary image generation."""
@@ -16,17 +19,95 @@ class Resolver (Utility, Debug):
         self.configuration  = configuration
 
     def resolve (self):
+        self.check_packing()
+        if self.configuration.pack_offsets is True:
+            offset_packing = Offset_Packing(self.data, self.code, self.configuration)
+            offset_packing.widen()
+        if self.configuration.strip_dead is True:
+            Dead_Code(self.data, self.code, self.configuration).strip()
+        if self.configuration.place_data is True:
+            Data_Placement(self.data, self.code, self.configuration).assign()
+        elif self.configuration.assign_banks is True:
+            Bank_Assignment(self.data, self.code, self.configuration).assign()
+        Literal_Spilling(self.data, self.code, self.configuration).spill()
+        if self.configuration.dedup_private is True:
+            Private_Deduplication(self.data, self.code, self.configuration).deduplicate()
         self.resolve_read_operands()
         self.resolve_write_operands()
         self.resolve_pointers()
+        if self.configuration.allocate_by_liveness is True:
+            Liveness_Allocation(self.data, self.code, self.configuration).allocate()
+        if self.configuration.schedule_opcodes is True:
+            scheduler = Opcode_Scheduler(self.data, self.code, self.configuration)
+            scheduler.schedule()
+            self.resolve_read_operands(scheduler.load_instructions())
+        if self.configuration.hoist_init_loads is True:
+            Init_Hoisting(self.data, self.code, self.configuration).hoist()
+        if self.configuration.preload_reset_state is True:
+            self.resolve_reset_loads()
+        if self.configuration.peephole is True:
+            Peephole(self.data, self.code, self.configuration).optimize()
+        if self.configuration.schedule_ports is True:
+            Port_Scheduler(self.data, self.code, self.configuration).schedule()
+        if self.configuration.lane_count > 1:
+            Lane_Check(self.data, self.code, self.configuration).check()
+        if self.configuration.pack_offsets is True:
+            offset_packing.pack()
         self.resolve_instruction_addresses()
         self.resolve_branches()
-#        self.resolve_opcodes()
+        self.resolve_opcodes()
         self.resolve_program_counters()
 
+    def operand_packing (self, operand):
+        """(lanes, width) of a packed literal, or of a packed variable read or written directly or through a pointer, else None."""
+        packing = self.parse_packing(operand, self.configuration.memory_width_bits)
+        if packing is not None or type(operand) is not str:
+            return packing
+        variable = self.data.lookup_variable_name(operand)
+        if type(variable) is Pointer_Variable:
+            variable = self.data.lookup_variable_name(variable.base)
+        if variable is None:
+            return None
+        return variable.packing
+
+    def check_packing (self):
+        """The ALU does not see lanes, so the packed operands of an instruction must all have the same lanes."""
+        for instruction in self.code.all_instructions():
+            operands = [instruction.D, instruction.DA, instruction.DB, instruction.A, instruction.B]
+            packings = set(self.operand_packing(operand) for operand in operands) - {None}
+            if len(packings) > 1:
+                print("Instruction mixes lane packings {0}: {1}".format(", ".join("{0}x{1}".format(*packing) for packing in sorted(packings)), instruction.source))
+                self.ask_for_debugger()
+
+    def program_order (self):
+        """Iterate over all instructions, marking pointers dropped as we pass their drop_pointer,
+           so a pointer first used after another is dropped can reuse its slot."""
+        for pointer in self.data.pointers:
+            pointer.dropped = False
+        self.drop_pointers(None)
+        for entry in self.code.instructions:
+            if type(entry) == list:
+                for instruction in entry:
+                    yield instruction
+            else:
+                yield entry
+            self.drop_pointers(entry)
+
+    def drop_pointers (self, entry):
+        for label, drop_entry in self.code.pointer_drops:
+            if drop_entry is entry:
+                self.data.drop_pointer(label)
+
+    def check_not_dropped (self, instruction, name):
+        variable = self.data.lookup_variable_name(name)
+        if type(variable) is Pointer_Variable and variable.dropped is True:
+            print("Pointer {0} used after drop_pointer.".format(name))
+            print(instruction)
+            self.ask_for_debugger()
+
     def resolve_read_operands (self, instruction_list = None):
         if instruction_list is None:
-            instruction_list = self.code.all_instructions()
+            instruction_list = self.program_order()
         for instruction in instruction_list:
             self.resolve_read_operand(instruction, "A")
             self.resolve_read_operand(instruction, "B")
@@ -40,7 +121,10 @@ class Resolver (Utility, Debug):
             entry = self.data.resolve_shared_value(value, operand)
         # If it's a string, look it up and add it to whichever memory area it belongs to
         elif type(value) == str:
+            self.check_not_dropped(instruction, value)
             entry = self.data.resolve_named(value, operand)
+            if type(entry) is Pointer_Variable:
+                entry.operands.append((instruction, operand))
         else:
             print("Read operand value has unexpected type!: {0}".format(value))
             print(instruction)
@@ -50,7 +134,7 @@ class Resolver (Utility, Debug):
 
     def resolve_write_operands (self, instruction_list = None):
         if instruction_list is None:
-            instruction_list = self.code.all_instructions()
+            instruction_list = self.program_order()
         for instruction in instruction_list:
             self.resolve_write_operand(instruction)
 
@@ -59,10 +143,19 @@ class Resolver (Utility, Debug):
         if is_dual is True:
             self.resolve_write_operand_case(instruction, "DA")
             self.resolve_write_operand_case(instruction, "DB")
+            self.check_dual_write_operands(instruction)
         else:
             self.resolve_write_operand_case(instruction, "D") 
 #        print(instruction.opcode, instruction.D, instruction.A, instruction.B)
 
+    def check_dual_write_operands (self, instruction):
+        """The DA and DB fields only reach the start of the A and B memories."""
+        configuration = self.configuration
+        DB = instruction.DB - configuration.memory_map.write_bases["B"]
+        if instruction.DA not in range(2**configuration.instr_DA_width) or DB not in range(2**configuration.instr_DB_width):
+            print("Dual write addresses DA {0} and DB {1} must be in A and B memory, at most {2} words from their start: {3}".format(instruction.DA, instruction.DB, 2**configuration.instr_DA_width, instruction))
+            self.ask_for_debugger()
+
     def resolve_write_operand_case (self, instruction, operand):
         value = getattr(instruction, operand)
         # Source is all strings, convert to int if possible
@@ -80,6 +173,7 @@ class Resolver (Utility, Debug):
                 print("Unknown variable {0} used as write operand.".format(converted_value))
                 print(instruction)
                 self.ask_for_debugger()
+            self.check_not_dropped(instruction, converted_value)
             # But if it's a pointer, instead find another resolved pointer which points to the
             # same variable and use that memory name, converted to its equivalent write name.
             # At a minimum, this will be a previously resolved read pointer.
@@ -99,6 +193,8 @@ class Resolver (Utility, Debug):
             variable      = self.data.resolve_named(converted_value, variable.memory)
             write_address = self.configuration.memory_map.read_to_write_address(variable.address, variable.memory)
             setattr(instruction, operand, write_address)
+            if type(variable) is Pointer_Variable:
+                variable.operands.append((instruction, operand))
             return
         else:
             print("Write operand value has unexpected type!: {0}".format(converted_value))
@@ -136,13 +232,72 @@ class Resolver (Utility, Debug):
         pointer.init_load = init_load
         init_label = pointer.label + "_init"
         init_load.add_private(init_label, pointer.threads)
-        init_address = self.configuration.memory_map.po[pointer.memory][pointer.slot]
-        self.code.usage.allocate_po(pointer.label, pointer.memory)
+        po_addresses = self.configuration.memory_map.po[pointer.memory]
+        init_address = po_addresses[pointer.slot % len(po_addresses)]
+        usage        = self.code.usage
+        previous     = None
+        if pointer.slot < len(usage.po_in_use[pointer.memory]):
+            previous = usage.po_in_use[pointer.memory][pointer.slot]
+        if previous is not None:
+            # Data.next_pointer_slot() only shares a slot after the previous pointer is dropped
+            usage.free_po(previous, pointer.memory, pointer.slot)
+        usage.allocate_po(pointer.label, pointer.memory, pointer.slot)
         instr  = init_load.add_instruction(init_load.label, init_address, init_label)
+        pointer.init_instruction = instr
         self.resolve_read_operands([instr])
         # Put the next pointer init data in the other memory (evens out storage)
         init_load.toggle_memory()
 
+    def reset_load_indices (self):
+        """Find the init loads at the start of the program which only set up the
+           reset state: all threads start at the first instruction, and no branch
+           lands on or leaves from them, so each thread runs them exactly once.
+           Opcode loads are kept in place, and do not end the search. A second write
+           to an entry (reused after a drop) ends it, as only one value can be preloaded."""
+        code        = self.code
+        memory_map  = self.configuration.memory_map
+        first       = next(code.all_instructions(), None)
+        if first is None or first.label is None or any(label != first.label for label in code.initial_pc):
+            return []
+        destinations    = [branch.destination_label for branch in code.branches]
+        origins         = [branch.instruction for branch in code.branches]
+        configuration   = list(chain(*memory_map.po.values(), *memory_map.sentinel.values(), *memory_map.mask.values(), memory_map.bc, memory_map.bd))
+        indices = []
+        written = set()
+        for index, entry in enumerate(code.instructions):
+            if type(entry) is not list:
+                break
+            if any(instruction.label in destinations or instruction in origins for instruction in entry):
+                break
+            if all(instruction.D in memory_map.od for instruction in entry):
+                continue
+            if not all(instruction.D in configuration for instruction in entry):
+                break
+            if any(instruction.D in written for instruction in entry):
+                break
+            written.update(instruction.D for instruction in entry)
+            indices.append(index)
+        return indices
+
+    def resolve_reset_loads (self):
+        """Move the startup init loads out of the code. The Generator writes their
+           values into the initial state images of the configuration memories."""
+        code    = self.code
+        indices = self.reset_load_indices()
+        labels  = [instruction.label for index in indices for instruction in code.instructions[index] if instruction.label is not None]
+        code.reset_loads = [code.instructions[index] for index in indices]
+        code.instructions = [entry for index, entry in enumerate(code.instructions) if index not in indices]
+        if len(labels) == 0:
+            return
+        # The threads now start at the first remaining instruction
+        first = next(code.all_instructions(), None)
+        if first is None:
+            print("No instructions left after removing the startup init loads.")
+            self.ask_for_debugger()
+        if first.label is None:
+            first.label = labels[0]
+        code.initial_pc = [first.label if label in labels else label for label in code.initial_pc]
+
     def resolve_instruction_addresses (self):
         """After all instructions are allocated and their operands resolved, we can sequentially give them addresses."""
         address = 0
@@ -173,18 +328,13 @@ class Resolver (Utility, Debug):
         if branch.destination is None or type(branch.destination) is not int:
             print("Instruction {0} did not have an address when resolving destination {1} of associated branch {2}".format(branch.instruction, branch.destination, branch))
             self.ask_for_debugger()
+        branch.destination += branch.destination_offset
 
-#    def resolve_opcodes (self, instruction_list = None):
-#        if instruction_list is None:
-#            instruction_list = self.code.all_instructions()
-#        for instruction in instruction_list:
-#            self.resolve_opcode(instruction)
-
-#    def resolve_opcode (self, instruction):
-#        """Convert opcode label into opcode number. Number depends on the order of the opcode definitions."""
-#        opcode = self.code.lookup_opcode(instruction.opcode)
-#        number = self.code.opcodes.index(opcode)
-#        instruction.opcode = number
+    def resolve_opcodes (self):
+        """Convert scheduled opcode labels into opcode numbers. See Optimizer.Opcode_Scheduler"""
+        for instruction in self.code.all_instructions():
+            if type(instruction.opcode) is str:
+                instruction.opcode = self.code.opcodes.schedule[instruction.opcode]
 
     def resolve_program_counters (self):
         """Convert code labels for thread initial start points into instruction addresses."""
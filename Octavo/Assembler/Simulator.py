@@ -0,0 +1,813 @@
+#! /usr/bin/python3
+
+"""Instruction-level model of the Octavo CPU, loaded from the memory images
+   written by the Generator. Each thread issues one instruction every
+   thread_count cycles, so an instruction always sees the completed results
+   of the previous instruction of its thread. This follows the Verilog in
+   ../Source, but does not model the pipeline itself."""
+
+from os             import path
+from collections    import deque
+from argparse       import ArgumentParser
+from Debug          import Debug
+from Configuration  import Configuration
+from Snapshot       import Snapshot
+
+# ---------------------------------------------------------------------------
+
+class Memory_Image (Debug):
+    """Reads back a readmemh() file written by Base_Memory.file_dump()."""
+
+    def __init__ (self, filename, depth = None):
+        Debug.__init__(self)
+        self.filename = filename
+        self.mem      = []
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line == "" or line.startswith("//"):
+                    continue
+                self.mem.append(int(line, 16))
+        if depth is not None and len(self.mem) != depth:
+            print("Memory image {0} has {1} entries, expected {2}.".format(filename, len(self.mem), depth))
+            self.ask_for_debugger()
+
+# ---------------------------------------------------------------------------
+
+class Triadic_ALU (Debug):
+    """Bit-accurate model of the Triadic ALU, driven by the raw ALU control word.
+       Only uses operators which behave the same on Python ints and on NumPy
+       uint64 arrays, so the same code can evaluate many cases at once."""
+
+    def __init__ (self, word_width):
+        Debug.__init__(self)
+        self.word_width = word_width
+        self.word_mask  = (1 << word_width) - 1
+        self.msb        = word_width - 1
+
+    def fields (self, control):
+        """Split a control word into its fields. Field order must match hardware."""
+        select  =  control        & 0x3
+        dyadic1 = (control >> 2)  & 0xF
+        dyadic2 = (control >> 6)  & 0xF
+        dual    = (control >> 10) & 0x1
+        addsub  = (control >> 11) & 0x3
+        dyadic3 = (control >> 13) & 0xF
+        shift   = (control >> 17) & 0x3
+        split   = (control >> 19) & 0x1
+        return (split, shift, dyadic3, addsub, dual, dyadic2, dyadic1, select)
+
+    def fill (self, bit):
+        """Replicate a 0/1 value across the word."""
+        return bit * self.word_mask
+
+    def mux (self, select_mask, in1, in2):
+        """Bitwise 2:1 mux: in1 where the select bit is 0, in2 where it is 1."""
+        return (in1 & (self.word_mask ^ select_mask)) | (in2 & select_mask)
+
+    def dyadic (self, op, a, b):
+        """Any of the 16 Boolean functions of a and b. Op bit {a,b} is the result."""
+        not_a = self.word_mask ^ a
+        not_b = self.word_mask ^ b
+        return ((a     & b     & self.fill((op >> 3) & 1)) |
+                (a     & not_b & self.fill((op >> 2) & 1)) |
+                (not_a & b     & self.fill((op >> 1) & 1)) |
+                (not_a & not_b & self.fill( op       & 1)))
+
+    def is_zero (self, value):
+        """1 if value is zero, else 0. Borrows past the MSB only from zero."""
+        return ((value - 1) >> self.word_width) & 1
+
+    def compute (self, control, A, B, R, S):
+        """Return (Ra, Rb, carry_out, overflow). R is the previous Ra of the thread."""
+        (split, shift, dyadic3, addsub, dual, dyadic2, dyadic1, select) = self.fields(control)
+        R_zero      = self.fill(self.is_zero(R))
+        R_negative  = self.fill((R >> self.msb) & 1)
+        select_low  = self.fill(select & 1)
+        select_high = self.fill((select >> 1) & 1)
+        selected_R  = self.mux(select_high, self.mux(select_low, R, R_zero), self.mux(select_low, R_negative, S))
+
+        D1 = self.dyadic(dyadic1, A, B)
+        D2 = self.dyadic(dyadic2, A, B)
+
+        A_negative  = addsub & 1
+        B_negative  = (addsub >> 1) & 1
+        A_signed    = A ^ self.fill(A_negative)
+        B_signed    = B ^ self.fill(B_negative)
+        total       = A_signed + B_signed + A_negative + B_negative
+        carry_out   = (total >> self.word_width) & 1
+        total       = total & self.word_mask
+        carry_in    = ((A_signed ^ B_signed ^ total) >> self.msb) & 1
+        overflow    = carry_in ^ carry_out
+
+        selected_1  = self.mux(selected_R, D1, D2)
+        selected_2  = self.mux(selected_R ^ self.fill(dual), D1, D2)
+        D3          = self.dyadic(dyadic3, selected_2, total)
+
+        shift_low   = self.fill(shift & 1)
+        shift_high  = self.fill((shift >> 1) & 1)
+        unsigned    = D3 >> 1
+        signed      = unsigned | (D3 & (1 << self.msb))
+        left        = (D3 << 1) & self.word_mask
+        shifted     = self.mux(shift_high, self.mux(shift_low, D3, unsigned), self.mux(shift_low, signed, left))
+
+        Rb = shifted
+        Ra = self.mux(self.fill(split), shifted, selected_1)
+        return (Ra, Rb, carry_out, overflow)
+
+# ---------------------------------------------------------------------------
+
+class IO_Port (Debug):
+    """An external I/O port. Reads take from the input queue, and annul the
+       instruction when it is empty. Writes are collected as (cycle, thread, value),
+       and annul the instruction once capacity (if any) is reached."""
+
+    def __init__ (self, label, capacity = None):
+        Debug.__init__(self)
+        self.label      = label
+        self.capacity   = capacity
+        self.input      = deque()
+        self.output     = []
+
+    def read_ready (self, thread):
+        return len(self.input) > 0
+
+    def write_ready (self, thread):
+        return self.capacity is None or len(self.output) < self.capacity
+
+    def peek (self, thread):
+        return self.input[0]
+
+    def read (self, thread):
+        return self.input.popleft()
+
+    def write (self, thread, value, cycle):
+        self.output.append((cycle, thread, value))
+
+    def values (self, thread = None):
+        """The written values, optionally for one thread only."""
+        return [value for (cycle, written_thread, value) in self.output if thread is None or written_thread == thread]
+
+    def save (self, snapshot, prefix):
+        snapshot.add(prefix + "input", list(self.input))
+        snapshot.add(prefix + "output", [field for entry in self.output for field in entry])
+
+    def restore (self, snapshot, prefix):
+        self.input  = deque(snapshot.get(prefix + "input"))
+        output      = snapshot.get(prefix + "output")
+        self.output = [tuple(output[entry:entry + 3]) for entry in range(0, len(output), 3)]
+
+class Multiplier (Debug):
+    """Multiplier accelerator. Operands are latched per thread, and the product of the
+       latest operands appears latency instructions after the write. A reads R_low, B reads R_high."""
+
+    def __init__ (self, label, thread_count, word_width, latency = 2):
+        Debug.__init__(self)
+        self.label      = label
+        self.word_width = word_width
+        self.word_mask  = (1 << word_width) - 1
+        self.latency    = latency
+        self.signed     = [0] * thread_count
+        self.operands   = [[0, 0] for thread in range(thread_count)]
+        self.product    = [0] * thread_count
+        self.pending    = [[] for thread in range(thread_count)]
+
+    def to_signed (self, value):
+        if value >> (self.word_width - 1):
+            return value - (1 << self.word_width)
+        return value
+
+    def update (self, thread, issue):
+        while len(self.pending[thread]) > 0 and self.pending[thread][0][0] <= issue:
+            self.product[thread] = self.pending[thread].pop(0)[1]
+
+    def read_ready (self, thread):
+        return True
+
+    def write_ready (self, thread):
+        return True
+
+    def read (self, thread, port, issue):
+        self.update(thread, issue)
+        if port == "A":
+            return self.product[thread] & self.word_mask
+        return (self.product[thread] >> self.word_width) & self.word_mask
+
+    def write (self, thread, port, value, issue):
+        self.operands[thread][0 if port == "A" else 1] = value
+        (A, B) = self.operands[thread]
+        if self.signed[thread] == 1:
+            product = (self.to_signed(A) * self.to_signed(B)) & ((1 << (2 * self.word_width)) - 1)
+        else:
+            product = A * B
+        self.pending[thread].append((issue + self.latency, product))
+
+    def configure (self, thread, value):
+        self.signed[thread] = value & 1
+
+    def save (self, snapshot, prefix):
+        """Wide products are split into low and high words. Pending products are (thread, ready, low, high)."""
+        snapshot.add(prefix + "signed",   self.signed)
+        snapshot.add(prefix + "operands", [operand for operands in self.operands for operand in operands])
+        snapshot.add(prefix + "product",  [word for product in self.product for word in (product & self.word_mask, product >> self.word_width)])
+        snapshot.add(prefix + "pending",  [field for thread, pending in enumerate(self.pending) for (ready, product) in pending
+                                                 for field in (thread, ready, product & self.word_mask, product >> self.word_width)])
+
+    def restore (self, snapshot, prefix):
+        thread_count  = len(self.signed)
+        self.signed   = snapshot.get(prefix + "signed")
+        operands      = snapshot.get(prefix + "operands")
+        self.operands = [operands[thread * 2:(thread + 1) * 2] for thread in range(thread_count)]
+        product       = snapshot.get(prefix + "product")
+        self.product  = [product[thread * 2] | (product[(thread * 2) + 1] << self.word_width) for thread in range(thread_count)]
+        pending       = snapshot.get(prefix + "pending")
+        self.pending  = [[] for thread in range(thread_count)]
+        for entry in range(0, len(pending), 4):
+            (thread, ready, low, high) = pending[entry:entry + 4]
+            self.pending[thread].append((ready, low | (high << self.word_width)))
+
+class Accumulator (Debug):
+    """Accumulator accelerator. Each write adds to the thread total, visible latency
+       instructions later. A read returns the total and clears it."""
+
+    def __init__ (self, label, thread_count, word_width, latency = 2):
+        Debug.__init__(self)
+        self.label      = label
+        self.word_mask  = (1 << word_width) - 1
+        self.latency    = latency
+        self.total      = [0] * thread_count
+        self.pending    = [[] for thread in range(thread_count)]
+
+    def update (self, thread, issue):
+        while len(self.pending[thread]) > 0 and self.pending[thread][0][0] <= issue:
+            self.total[thread] = (self.total[thread] + self.pending[thread].pop(0)[1]) & self.word_mask
+
+    def read_ready (self, thread):
+        return True
+
+    def write_ready (self, thread):
+        return True
+
+    def read (self, thread, port, issue):
+        self.update(thread, issue)
+        total = self.total[thread]
+        self.total[thread] = 0
+        return total
+
+    def write (self, thread, port, value, issue):
+        self.pending[thread].append((issue + self.latency, value))
+
+    def save (self, snapshot, prefix):
+        """Pending addends are (thread, ready, value)."""
+        snapshot.add(prefix + "total",   self.total)
+        snapshot.add(prefix + "pending", [field for thread, pending in enumerate(self.pending) for (ready, value) in pending
+                                                for field in (thread, ready, value)])
+
+    def restore (self, snapshot, prefix):
+        self.total   = snapshot.get(prefix + "total")
+        pending      = snapshot.get(prefix + "pending")
+        self.pending = [[] for thread in range(len(self.total))]
+        for entry in range(0, len(pending), 3):
+            (thread, ready, value) = pending[entry:entry + 3]
+            self.pending[thread].append((ready, value))
+
+# ---------------------------------------------------------------------------
+
+class Issue (Debug):
+    """What one instruction issue slot did. Handed to the observers of the Simulator."""
+
+    # Flag bits, as stored in traces
+    annulled    = 1
+    cancelled   = 2
+    jumped      = 4
+
+    def __init__ (self, cycle, thread, pc, opcode, control):
+        Debug.__init__(self)
+        self.cycle      = cycle
+        self.thread     = thread
+        self.pc         = pc
+        self.opcode     = opcode
+        # ALU control word the opcode decoded to
+        self.control    = control
+        self.flags      = 0
+        # Branch Detector entries as evaluated, before any writes by this instruction
+        self.bd         = ()
+        # Bitmasks over the branch modules
+        self.reached    = 0
+        self.predicate  = 0
+        self.cancels    = 0
+        # Index of the branch module which jumped, if any
+        self.branch     = None
+        # Translated read addresses, None if an I/O port
+        self.read_A     = None
+        self.read_B     = None
+        # (write address, value) of completed writes
+        self.writes     = []
+
+# ---------------------------------------------------------------------------
+
+def branch_fields (config):
+    """Split a Branch Detector entry into its fields. Field order must match hardware."""
+    op              =  config        & 0xF
+    b               = (config >> 4)  & 0x3
+    a               = (config >> 6)  & 0x3
+    predict_enable  = (config >> 8)  & 0x1
+    predict_taken   = (config >> 9)  & 0x1
+    destination     = (config >> 10) & 0x3FF
+    origin_enable   = (config >> 20) & 0x1
+    origin          = (config >> 21) & 0x3FF
+    return (origin, origin_enable, destination, predict_taken, predict_enable, a, b, op)
+
+# ---------------------------------------------------------------------------
+
+class Simulator (Debug):
+    """Holds the complete machine state and steps it one issue slot at a time."""
+
+    def __init__ (self, configuration, directory = ".", accelerators = True, lane = 0):
+        Debug.__init__(self)
+        self.configuration  = configuration
+        self.directory      = directory
+        # Which SIMD lane's A and B memories to run. The lanes share everything else.
+        self.lane           = lane
+        self.thread_count   = configuration.thread_count
+        self.word_width     = configuration.memory_width_bits
+        self.word_mask      = (1 << self.word_width) - 1
+        self.depth          = configuration.memory_depth_words
+        self.write_depth    = configuration.memory_depth_words_write
+        self.memory_map     = configuration.memory_map
+        self.alu            = Triadic_ALU(self.word_width)
+        self.observers      = []
+        self.load_state()
+
+        self.io_A = dict()
+        self.io_B = dict()
+        self.multiplier  = Multiplier("multiplier", self.thread_count, self.word_width)
+        self.accumulator = Accumulator("accumulator", self.thread_count, self.word_width)
+        for port in range(configuration.memory_io_count):
+            self.attach_port("A", port, IO_Port("A{0}".format(port)))
+            self.attach_port("B", port, IO_Port("B{0}".format(port)))
+        # Same port assignment as Octavo.v. Without them, as with Octavo_Core.
+        if accelerators is True:
+            self.attach_port("A", 0, self.multiplier)
+            self.attach_port("B", 0, self.multiplier)
+            self.attach_port("A", 1, self.accumulator)
+        # Must match the Verilog parameter
+        self.multiplier_config = 4000
+        # External branch conditions, per thread
+        self.external_A = [0] * self.thread_count
+        self.external_B = [0] * self.thread_count
+
+    def image (self, filename, depth):
+        return Memory_Image(path.join(self.directory, filename), depth).mem
+
+    def load_state (self):
+        """Reset the machine to the contents of the memory images."""
+        configuration   = self.configuration
+        threads         = range(self.thread_count)
+        modules         = len(self.memory_map.bd)
+        self.cycle      = 0
+        if self.lane == 0:
+            self.A      = self.image(configuration.filename_data_A, self.depth)
+            self.B      = self.image(configuration.filename_data_B, self.depth)
+        else:
+            self.A      = self.image(configuration.filename_lane_data.format(configuration.data_A_label, self.lane), self.depth)
+            self.B      = self.image(configuration.filename_lane_data.format(configuration.data_B_label, self.lane), self.depth)
+        self.I          = self.image(configuration.filename_I,      self.depth)
+        od              = self.image(configuration.filename_od,     configuration.opcode_count * self.thread_count)
+        self.OD         = [od[thread * configuration.opcode_count:(thread + 1) * configuration.opcode_count] for thread in threads]
+        self.PC         = self.image(configuration.filename_pc,     self.thread_count)
+        self.DO         = self.image(configuration.filename_do,     self.thread_count)
+        self.PO         = dict()
+        for memory in ["A", "B", "DA", "DB"]:
+            self.PO[memory] = [[0] * len(self.memory_map.po[memory]) for thread in threads]
+        self.S          = [0] * self.thread_count
+        self.R          = [0] * self.thread_count
+        self.Rb         = [0] * self.thread_count
+        self.carry_out  = [0] * self.thread_count
+        self.overflow   = [0] * self.thread_count
+        self.BD         = [[0] * modules for thread in threads]
+        self.BC         = [[0] * modules for thread in threads]
+        self.sentinel   = {"A":[[0] * modules for thread in threads], "B":[[0] * modules for thread in threads]}
+        self.mask       = {"A":[[0] * modules for thread in threads], "B":[[0] * modules for thread in threads]}
+        # Instructions issued by each thread. Accelerator latencies count these.
+        self.issued     = [0] * self.thread_count
+        self.load_reset_state()
+
+    def reset_image (self, filename, depth):
+        """An optional memory image, or None if the Generator did not write it."""
+        if not path.exists(path.join(self.directory, filename)):
+            return None
+        return self.image(filename, depth)
+
+    def load_reset_state (self):
+        """Load the initial Programmed Offset and branch memories, if present."""
+        configuration = self.configuration
+        for memory in ["A", "B", "DA", "DB"]:
+            slots  = len(self.memory_map.po[memory])
+            values = self.reset_image(configuration.filename_po.format(memory), slots * self.thread_count)
+            if values is not None:
+                self.PO[memory] = self.unflatten(values, slots)
+        for module in range(len(self.memory_map.bd)):
+            tables = [(self.BD, configuration.filename_bd.format(module)), (self.BC, configuration.filename_bc.format(module))]
+            for memory in ["A", "B"]:
+                tables.append((self.sentinel[memory], configuration.filename_sentinel.format(memory, module)))
+                tables.append((self.mask[memory],     configuration.filename_mask.format(memory, module)))
+            for table, filename in tables:
+                values = self.reset_image(filename, self.thread_count)
+                if values is not None:
+                    for thread, value in enumerate(values):
+                        table[thread][module] = value
+
+    def flatten (self, table):
+        return [entry for row in table for entry in row]
+
+    def unflatten (self, values, columns):
+        return [values[row:row + columns] for row in range(0, len(values), columns)]
+
+    def save_snapshot (self, filename):
+        """Save the complete machine state, including accelerators and I/O port contents."""
+        snapshot = Snapshot()
+        snapshot.add("shape", [self.thread_count, self.depth, self.word_width])
+        snapshot.add("cycle", [self.cycle])
+        for name in ["A", "B", "I", "PC", "DO", "S", "R", "Rb", "carry_out", "overflow", "issued", "external_A", "external_B"]:
+            snapshot.add(name, getattr(self, name))
+        for name in ["OD", "BD", "BC"]:
+            snapshot.add(name, self.flatten(getattr(self, name)))
+        for memory in ["A", "B", "DA", "DB"]:
+            snapshot.add("PO_" + memory, self.flatten(self.PO[memory]))
+        for memory in ["A", "B"]:
+            snapshot.add("sentinel_" + memory, self.flatten(self.sentinel[memory]))
+            snapshot.add("mask_" + memory,     self.flatten(self.mask[memory]))
+        self.multiplier.save(snapshot,  "multiplier_")
+        self.accumulator.save(snapshot, "accumulator_")
+        for ports, memory in [(self.io_A, "A"), (self.io_B, "B")]:
+            for port, device in ports.items():
+                if isinstance(device, IO_Port):
+                    device.save(snapshot, "io_{0}{1}_".format(memory, port))
+        snapshot.save(filename)
+
+    def load_snapshot (self, filename):
+        """Restore a state saved by save_snapshot(), with the same port assignment."""
+        snapshot = Snapshot()
+        snapshot.load(filename)
+        if snapshot.get("shape") != [self.thread_count, self.depth, self.word_width]:
+            print("Snapshot {0} has thread count, memory depth, and word width {1}, expected {2}.".format(filename, snapshot.get("shape"), [self.thread_count, self.depth, self.word_width]))
+            self.ask_for_debugger()
+        self.cycle = snapshot.get("cycle")[0]
+        for name in ["A", "B", "I", "PC", "DO", "S", "R", "Rb", "carry_out", "overflow", "issued", "external_A", "external_B"]:
+            setattr(self, name, snapshot.get(name))
+        modules = len(self.memory_map.bd)
+        self.OD = self.unflatten(snapshot.get("OD"), self.configuration.opcode_count)
+        self.BD = self.unflatten(snapshot.get("BD"), modules)
+        self.BC = self.unflatten(snapshot.get("BC"), modules)
+        for memory in ["A", "B", "DA", "DB"]:
+            self.PO[memory] = self.unflatten(snapshot.get("PO_" + memory), len(self.memory_map.po[memory]))
+        for memory in ["A", "B"]:
+            self.sentinel[memory] = self.unflatten(snapshot.get("sentinel_" + memory), modules)
+            self.mask[memory]     = self.unflatten(snapshot.get("mask_" + memory),     modules)
+        self.multiplier.restore(snapshot,  "multiplier_")
+        self.accumulator.restore(snapshot, "accumulator_")
+        for ports, memory in [(self.io_A, "A"), (self.io_B, "B")]:
+            for port, device in ports.items():
+                if isinstance(device, IO_Port):
+                    device.restore(snapshot, "io_{0}{1}_".format(memory, port))
+        snapshot.close()
+
+    def attach_port (self, memory, port, device):
+        """Connect an IO_Port or accelerator to a port number of the A or B memory."""
+        if memory == "A":
+            self.io_A[port] = device
+        elif memory == "B":
+            self.io_B[port] = device
+        else:
+            print("No I/O ports in memory {0}.".format(memory))
+            self.ask_for_debugger()
+
+    def port (self, memory, port):
+        if memory == "A":
+            return self.io_A[port]
+        return self.io_B[port]
+
+    # -----------------------------------------------------------------------
+    # Addressing
+
+    def po_fields (self, entry, offset_width):
+        """Split a Programmed Offset entry into offset and signed increment."""
+        increment_bits = self.configuration.po_increment_bits
+        offset    = entry & ((1 << offset_width) - 1)
+        increment = (entry >> offset_width) & ((1 << increment_bits) - 1)
+        if (entry >> (offset_width + increment_bits)) & 1:
+            increment = -increment
+        return offset, increment
+
+    def po_increment (self, memory, thread, slot, offset_width, address_depth):
+        entry            = self.PO[memory][thread][slot]
+        offset, increment = self.po_fields(entry, offset_width)
+        offset           = (offset + increment) % address_depth
+        self.PO[memory][thread][slot] = (entry & ~((1 << offset_width) - 1)) | offset
+
+    def read_address (self, thread, memory, raw):
+        """Return (translated address, pointer slot or None, port or None) for a read operand."""
+        memory_map = self.memory_map
+        if raw in memory_map.io:
+            return (None, None, raw - memory_map.io.start)
+        if raw in memory_map.indirect:
+            slot = raw - memory_map.indirect.start
+            offset, increment = self.po_fields(self.PO[memory][thread][slot], self.configuration.po_read_offset_bit_width)
+            return ((raw + offset) % self.depth, slot, None)
+        if raw in memory_map.shared:
+            return (raw, None, None)
+        return ((raw + self.DO[thread]) % self.depth, None, None)
+
+    def write_address (self, thread, memory, raw):
+        """Return (translated address, pointer slot or None, port or None) for a
+           write operand, where memory is the A (DA) or B (DB) write path."""
+        memory_map = self.memory_map
+        base       = memory_map.write_bases[memory]
+        po_memory  = "D" + memory
+        if raw >= memory_map.write_bases["I"]:
+            return (raw, None, None)
+        if raw - base in memory_map.io:
+            return (None, None, raw - base - memory_map.io.start)
+        if raw - base in memory_map.indirect:
+            slot = raw - base - memory_map.indirect.start
+            offset, increment = self.po_fields(self.PO[po_memory][thread][slot], self.configuration.po_write_offset_bit_width)
+            return ((raw + offset) % self.write_depth, slot, None)
+        if raw - base in memory_map.shared:
+            return (raw, None, None)
+        return ((raw + self.DO[thread]) % self.write_depth, None, None)
+
+    # -----------------------------------------------------------------------
+    # Flow Control
+
+    def sentinel_match (self, memory, thread, module, value):
+        mask = self.word_mask ^ self.mask[memory][thread][module]
+        return int((value & mask) == (self.sentinel[memory][thread][module] & mask))
+
+    def flow_control (self, issue, thread, pc, io_ready):
+        """Evaluate all branch modules against the flags left by the previous
+           instruction of this thread. Returns (jump, cancel, destination)."""
+        negative   = (self.Rb[thread] >> (self.word_width - 1)) & 1
+        carry_out  = self.carry_out[thread]
+        less_than  = self.overflow[thread] ^ negative
+        winner     = None
+        cancel_any = 0
+        issue.bd   = tuple(self.BD[thread])
+        for module in range(len(self.BD[thread])):
+            (origin, origin_enable, destination, predict_taken, predict_enable, a, b, op) = branch_fields(self.BD[thread][module])
+            reached = int(origin_enable == 0 or origin == pc)
+            running = int(self.BC[thread][module] != 0)
+            if a == 0:
+                a_value = negative
+            elif a == 1:
+                a_value = carry_out
+            elif a == 2:
+                a_value = self.sentinel_match("A", thread, module, self.Rb[thread])
+            else:
+                a_value = self.external_A[thread]
+            if b == 0:
+                b_value = less_than
+            elif b == 1:
+                b_value = running
+            elif b == 2:
+                b_value = self.sentinel_match("B", thread, module, self.Rb[thread])
+            else:
+                b_value = self.external_B[thread]
+            predicate = (op >> ((a_value << 1) | b_value)) & 1
+            jump      = reached & predicate
+            cancel    = reached & predict_enable & int(predict_taken != predicate)
+            if reached == 1 and io_ready is True and running == 1:
+                self.BC[thread][module] -= 1
+            if reached:
+                issue.reached   |= 1 << module
+            if predicate:
+                issue.predicate |= 1 << module
+            if cancel:
+                issue.cancels   |= 1 << module
+            cancel_any |= cancel
+            if jump == 1 and winner is None:
+                winner = (module, cancel, destination)
+        if winner is not None:
+            (module, cancel, destination) = winner
+            issue.branch = module
+            return (True, cancel == 1, destination)
+        return (False, cancel_any == 1, None)
+
+    # -----------------------------------------------------------------------
+    # Writes
+
+    def write_high (self, thread, address, value):
+        """Writes to I memory and the write-only configuration registers in H memory."""
+        memory_map = self.memory_map
+        if address < memory_map.write_bases["H"]:
+            self.I[(address - memory_map.write_bases["I"]) % self.depth] = value
+            return
+        if address == memory_map.s:
+            self.S[thread] = value
+            return
+        if address == memory_map.do:
+            self.DO[thread] = value & ((1 << self.configuration.default_offset_width) - 1)
+            return
+        for memory in ["A", "B", "DA", "DB"]:
+            if address in memory_map.po[memory]:
+                if "D" in memory:
+                    width = self.configuration.po_write_offset_bit_width
+                else:
+                    width = self.configuration.po_read_offset_bit_width
+                width += self.configuration.po_increment_bits + self.configuration.po_increment_sign_bits
+                self.PO[memory][thread][memory_map.po[memory].index(address)] = value & ((1 << width) - 1)
+                return
+        for memory in ["A", "B"]:
+            if address in memory_map.sentinel[memory]:
+                self.sentinel[memory][thread][memory_map.sentinel[memory].index(address)] = value
+                return
+            if address in memory_map.mask[memory]:
+                self.mask[memory][thread][memory_map.mask[memory].index(address)] = value
+                return
+        if address in memory_map.bc:
+            self.BC[thread][memory_map.bc.index(address)] = value
+            return
+        if address in memory_map.bd:
+            self.BD[thread][memory_map.bd.index(address)] = value & ((1 << 31) - 1)
+            return
+        if address in memory_map.od:
+            self.OD[thread][memory_map.od.index(address)] = value & ((1 << 20) - 1)
+            return
+        if address == self.multiplier_config:
+            self.multiplier.configure(thread, value)
+            return
+        # Other H addresses are not connected to anything.
+
+    def write_memory (self, thread, memory, address, value, issue):
+        if address >= self.memory_map.write_bases["I"]:
+            self.write_high(thread, address, value)
+        elif memory == "A":
+            self.A[address % self.depth] = value
+        else:
+            self.B[address % self.depth] = value
+        issue.writes.append((address, value))
+
+    # -----------------------------------------------------------------------
+    # Execution
+
+    def step (self):
+        """Issue one instruction from the thread whose turn it is."""
+        configuration = self.configuration
+        thread      = self.cycle % self.thread_count
+        pc          = self.PC[thread]
+        word        = self.I[pc]
+        opcode      = (word >> 32) & 0xF
+        D           = (word >> 20) & 0xFFF
+        A_raw       = (word >> 10) & 0x3FF
+        B_raw       =  word        & 0x3FF
+        control     = self.OD[thread][opcode]
+        split       = (control >> 19) & 1
+        issue       = Issue(self.cycle, thread, pc, opcode, control)
+        count       = self.issued[thread]
+
+        if split == 1:
+            DA = D >> configuration.instr_DB_width
+            DB = self.memory_map.write_bases["B"] + (D & ((1 << configuration.instr_DB_width) - 1))
+        else:
+            DA = D
+            DB = D
+
+        A_address, A_slot, A_port = self.read_address(thread, "A", A_raw)
+        B_address, B_slot, B_port = self.read_address(thread, "B", B_raw)
+        issue.read_A = A_address
+        issue.read_B = B_address
+
+        # A simple instruction only writes to the memory its address falls in.
+        # Ra goes to A, Rb goes to B and to I/H.
+        write_A = None
+        write_B = None
+        if split == 1 or DA < self.memory_map.write_bases["B"]:
+            write_A = self.write_address(thread, "A", DA)
+        if split == 1 or DB >= self.memory_map.write_bases["B"]:
+            write_B = self.write_address(thread, "B", DB)
+
+        io_ready = True
+        if A_port is not None and not self.io_A[A_port].read_ready(thread):
+            io_ready = False
+        if B_port is not None and not self.io_B[B_port].read_ready(thread):
+            io_ready = False
+        if write_A is not None and write_A[2] is not None and not self.io_A[write_A[2]].write_ready(thread):
+            io_ready = False
+        if write_B is not None and write_B[2] is not None and not self.io_B[write_B[2]].write_ready(thread):
+            io_ready = False
+
+        jump, cancel, destination = self.flow_control(issue, thread, pc, io_ready)
+        if cancel:
+            issue.flags |= Issue.cancelled
+        if jump:
+            issue.flags |= Issue.jumped
+
+        if io_ready is False:
+            issue.flags |= Issue.annulled
+        else:
+            A_value = self.read_operand("A", thread, A_address, A_port, count, cancel)
+            B_value = self.read_operand("B", thread, B_address, B_port, count, cancel)
+            Ra, Rb, carry_out, overflow = self.alu.compute(control, A_value, B_value, self.R[thread], self.S[thread])
+            if cancel is False:
+                if A_slot is not None:
+                    self.po_increment("A", thread, A_slot, configuration.po_read_offset_bit_width, self.depth)
+                if B_slot is not None:
+                    self.po_increment("B", thread, B_slot, configuration.po_read_offset_bit_width, self.depth)
+                if write_A is not None:
+                    self.write_result("A", thread, write_A, Ra, count, issue)
+                if write_B is not None:
+                    self.write_result("B", thread, write_B, Rb, count, issue)
+            self.R[thread]         = Ra
+            self.Rb[thread]        = Rb
+            self.carry_out[thread] = carry_out
+            self.overflow[thread]  = overflow
+            self.issued[thread]   += 1
+
+        if jump and (io_ready or cancel):
+            self.PC[thread] = destination
+        elif io_ready or cancel:
+            self.PC[thread] = (pc + 1) % self.depth
+
+        for observer in self.observers:
+            observer.observe(self, issue)
+        self.cycle += 1
+        return issue
+
+    def read_operand (self, memory, thread, address, port, count, cancel):
+        if port is None:
+            if memory == "A":
+                return self.A[address]
+            return self.B[address]
+        device = self.port(memory, port)
+        if isinstance(device, IO_Port):
+            # Cancelled instructions do not consume input
+            if cancel:
+                return device.peek(thread)
+            return device.read(thread)
+        return device.read(thread, memory, count)
+
+    def write_result (self, memory, thread, write, value, count, issue):
+        address, slot, port = write
+        if slot is not None:
+            self.po_increment("D" + memory, thread, slot, self.configuration.po_write_offset_bit_width, self.write_depth)
+        if port is None:
+            self.write_memory(thread, memory, address, value, issue)
+            return
+        device = self.port(memory, port)
+        if isinstance(device, IO_Port):
+            device.write(thread, value, self.cycle)
+        else:
+            device.write(thread, memory, value, count)
+        issue.writes.append((self.memory_map.write_bases[memory] + self.memory_map.io.start + port, value))
+
+    def run (self, cycles, until = None):
+        """Step for the given number of cycles, or until until(simulator) is true."""
+        for cycle in range(cycles):
+            self.step()
+            if until is not None and until(self):
+                break
+
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Simulate the memory images in a directory.")
+    arguments.add_argument("directory", nargs = "?", default = ".")
+    arguments.add_argument("--cycles",  type = int, default = 5000)
+    arguments.add_argument("--trace",   default = None, help = "write a binary execution trace to this file")
+    arguments.add_argument("--compress", action = "store_true", help = "compress trace chunks")
+    arguments.add_argument("--no-accelerators", dest = "accelerators", action = "store_false", help = "all ports are external")
+    arguments.add_argument("--restore",  default = None, help = "start from this snapshot instead of from reset")
+    arguments.add_argument("--snapshot", default = None, help = "save a snapshot to this file when done")
+    arguments.add_argument("--counters", default = None, help = "write event counters to this .json file, or to CSV files with this prefix")
+    arguments.add_argument("--lane",    type = int, default = 0, help = "run the A and B memories of this SIMD lane")
+    arguments.add_argument("--shared-count", dest = "shared_count", type = int, default = None, help = "words of shared memory, as given to the Assembler")
+    options = arguments.parse_args()
+
+    configuration = Configuration()
+    if options.shared_count is not None:
+        configuration.set_shared_count(options.shared_count)
+    simulator     = Simulator(configuration, options.directory, options.accelerators, options.lane)
+    if options.restore is not None:
+        simulator.load_snapshot(options.restore)
+    trace         = None
+    if options.trace is not None:
+        from Trace import Trace_Writer
+        trace = Trace_Writer(options.trace, configuration, compress = options.compress)
+        simulator.observers.append(trace)
+    counters      = None
+    if options.counters is not None:
+        from Counters import Counters
+        counters = Counters(configuration, path.join(options.directory, configuration.filename_symbols))
+        simulator.observers.append(counters)
+    simulator.run(options.cycles)
+    if counters is not None:
+        counters.write(options.counters)
+    if trace is not None:
+        trace.close()
+    if options.snapshot is not None:
+        simulator.save_snapshot(options.snapshot)
+    for ports in [simulator.io_A, simulator.io_B]:
+        for device in ports.values():
+            if isinstance(device, IO_Port):
+                for (cycle, thread, value) in device.output:
+                    print("{0} {1} {2} {3}".format(cycle, device.label, thread, value))
@@ -0,0 +1,88 @@
+#! /usr/bin/python3
+
+"""Snapshot file format for the Simulator state. A snapshot is a set of named
+   arrays of unsigned 64-bit words: a header, a table of contents, then the
+   arrays, each 8-byte aligned. Loading memory-maps the file, and each array
+   is read in place through a memoryview."""
+
+from struct         import Struct
+from mmap           import mmap, ACCESS_READ
+from Debug          import Debug
+
+class Snapshot (Debug):
+    """Named lists of unsigned ints, saved to and loaded from a snapshot file."""
+
+    magic       = b"OCTSNAP\0"
+    version     = 1
+    # magic, version, entry count
+    header      = Struct("<8sII")
+    # name, byte offset, word count
+    entry       = Struct("<32sQQ")
+    word_size   = 8
+
+    def __init__ (self):
+        Debug.__init__(self)
+        self.arrays = dict()
+        self.map    = None
+        self.file   = None
+        self.words  = None
+
+    def add (self, name, values):
+        if len(name.encode()) > 32:
+            print("Snapshot array name {0} is longer than 32 bytes.".format(name))
+            self.ask_for_debugger()
+        self.arrays[name] = values
+
+    def get (self, name):
+        """The named array, as a list of ints."""
+        if name not in self.arrays:
+            print("Snapshot has no array {0}.".format(name))
+            self.ask_for_debugger()
+        return list(self.arrays[name])
+
+    def names (self):
+        return list(self.arrays.keys())
+
+    def save (self, filename):
+        names    = self.names()
+        contents = self.header.size + (self.entry.size * len(names))
+        padding  = -contents % self.word_size
+        offset   = contents + padding
+        with open(filename, 'wb') as f:
+            f.write(self.header.pack(self.magic, self.version, len(names)))
+            for name in names:
+                f.write(self.entry.pack(name.encode(), offset, len(self.arrays[name])))
+                offset += self.word_size * len(self.arrays[name])
+            f.write(b"\0" * padding)
+            for name in names:
+                for value in self.arrays[name]:
+                    f.write(value.to_bytes(self.word_size, 'little'))
+
+    def load (self, filename):
+        """Map the file, and point each array at its place in the map."""
+        self.close()
+        self.file = open(filename, 'rb')
+        self.map  = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        (magic, version, count) = self.header.unpack_from(self.map, 0)
+        if magic != self.magic or version != self.version:
+            print("{0} is not a version {1} Octavo snapshot.".format(filename, self.version))
+            self.ask_for_debugger()
+        # Casts use the native byte order, so this assumes a little-endian host
+        self.words  = memoryview(self.map).cast('Q')
+        self.arrays = dict()
+        for number in range(count):
+            (name, offset, length) = self.entry.unpack_from(self.map, self.header.size + (self.entry.size * number))
+            start = offset // self.word_size
+            self.arrays[name.rstrip(b"\0").decode()] = self.words[start:start + length]
+
+    def close (self):
+        if self.map is not None:
+            # The map cannot close while views into it exist
+            for view in self.arrays.values():
+                view.release()
+            self.words.release()
+            self.arrays = dict()
+            self.map.close()
+            self.file.close()
+            self.map  = None
+            self.file = None
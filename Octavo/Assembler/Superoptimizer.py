@@ -0,0 +1,197 @@
+#! /usr/bin/python3
+
+"""Search the Triadic ALU control space for opcodes which compute a given
+   function of the A and B operands in one instruction. Candidate control
+   words run through the Simulator's bit-accurate ALU model, many at once as
+   NumPy arrays: first on a few inputs to prune, then on edge cases and
+   random inputs, then on a fresh random set to confirm. Passing is strong
+   evidence of equivalence, not a proof. The previous result (R) and the S
+   register get random values, so opcodes which depend on them fail.
+   Only simple (not split) opcodes are searched, as a split opcode changes
+   how the instruction addresses its results. Matches which differ only in
+   fields that do not change the result are merged, keeping the simplest
+   value of those fields, so the usual definitions come first."""
+
+import numpy
+from argparse       import ArgumentParser
+from Debug          import Debug
+from Configuration  import Configuration
+from Operators      import Operators
+from Simulator      import Triadic_ALU
+
+# ---------------------------------------------------------------------------
+
+class Opcode_Search (Debug):
+    """Finds the ALU control words whose simple result matches a target expression."""
+
+    # Opcode definition field order, as in Opcode_Manager.define_opcode()
+    fields      = ["split", "shift", "dyadic3", "addsub", "dual", "dyadic2", "dyadic1", "select"]
+    # Name prefixes of each field's values in Operators, None for the dyadic operators
+    prefixes    = {"split":"split_", "shift":"shift_", "dyadic3":None, "addsub":"addsub_", "dual":None, "dyadic2":None, "dyadic1":None, "select":"select_"}
+
+    def __init__ (self, configuration, operators, samples = 256, seed = 0):
+        Debug.__init__(self)
+        self.configuration  = configuration
+        self.operators      = operators
+        self.alu            = Triadic_ALU(configuration.memory_width_bits)
+        self.word_width     = configuration.memory_width_bits
+        self.word_mask      = (1 << self.word_width) - 1
+        self.samples        = samples
+        self.random         = numpy.random.default_rng(seed)
+        # Control words with the split bit clear
+        self.control_count  = 1 << (operators.triadic.control_width - operators.triadic.split_width)
+        self.names          = self.field_names()
+        # {field:(bit offset, width)} in the control word, select in the LSBs
+        self.layout         = dict()
+        offset              = 0
+        for field in reversed(self.fields):
+            width               = getattr(operators.triadic, field + "_width")
+            self.layout[field]  = (offset, width)
+            offset             += width
+
+    def field_names (self):
+        """{field:{value:name}}, from the Operators definitions."""
+        triadic = self.operators.triadic
+        dyadic  = {bits.uint:name for name, bits in vars(self.operators.dyadic).items() if name != "operator_width"}
+        names   = dict()
+        for field in self.fields:
+            prefix = self.prefixes[field]
+            if field == "dual":
+                names[field] = {triadic.simple.uint:"simple", triadic.dual.uint:"dual"}
+            elif prefix is None:
+                names[field] = dyadic
+            else:
+                names[field] = {bits.uint:name for name, bits in vars(triadic).items() if name.startswith(prefix) and not name.endswith("_width")}
+        return names
+
+    def edge_cases (self):
+        msb         = 1 << (self.word_width - 1)
+        alternating = int("01" * (self.word_width // 2), 2)
+        return [0, 1, 2, 3, self.word_mask, self.word_mask - 1, msb, msb - 1, msb + 1, alternating, alternating << 1]
+
+    def random_words (self, count):
+        return self.random.integers(0, 1 << self.word_width, size = count, dtype = numpy.uint64)
+
+    def wrap (self, value):
+        return value & self.word_mask
+
+    def sra (self, value, shift):
+        """Arithmetic shift right of a word."""
+        value = self.wrap(value)
+        sign  = (value >> (self.word_width - 1)) & 1
+        return (value >> shift) | (sign * (self.word_mask ^ (self.word_mask >> shift)))
+
+    def evaluate (self, expression, a, b = None):
+        """Evaluate an expression of a (and b) over arrays of words, wrapped to a word."""
+        names = {"a":a, "b":b, "wrap":self.wrap, "sra":self.sra, "__builtins__":{}}
+        value = eval(expression, names)
+        return self.wrap(numpy.asarray(value, dtype = numpy.uint64) + numpy.zeros_like(a))
+
+    def inputs (self, count, b_expression = None, edges = True):
+        """Return (A, B, R, S) sample arrays. B is independent of A, unless given as an expression of a."""
+        if edges is True:
+            edge_cases = self.edge_cases()
+            A = numpy.array([a for a in edge_cases for b in edge_cases], dtype = numpy.uint64)
+            B = numpy.array([b for a in edge_cases for b in edge_cases], dtype = numpy.uint64)
+            A = numpy.concatenate([A, self.random_words(count)])
+            B = numpy.concatenate([B, self.random_words(count)])
+        else:
+            A = self.random_words(count)
+            B = self.random_words(count)
+        if b_expression is not None:
+            B = self.evaluate(b_expression, A)
+        R = self.random_words(len(A))
+        S = self.random_words(len(A))
+        # Also exercise the R == 0 case of select_r_zero
+        R[::4] = 0
+        return (A, B, R, S)
+
+    def matches (self, controls, target, A, B, R, S, chunk = 4096):
+        """Return the control words, out of the given ones, whose result equals the target on all samples."""
+        found = []
+        for start in range(0, len(controls), chunk):
+            block = controls[start:start + chunk].reshape(-1, 1)
+            (Ra, Rb, carry_out, overflow) = self.alu.compute(block, A, B, R, S)
+            found.append(block[numpy.all(Rb == target, axis = 1), 0])
+        return numpy.concatenate(found) if len(found) > 0 else numpy.array([], dtype = numpy.uint64)
+
+    def value_cost (self, field, value):
+        """How far a field value is from the plain one. For the dyadic operators: the inputs
+           used, plus 1 for a true output on two false inputs, plus 2 if not monotonic,
+           so always_zero, then a or b, then and/or come before the negated forms."""
+        if self.prefixes[field] is not None or field == "dual":
+            return 0 if value == 0 else 1
+        table   = [(value >> index) & 1 for index in range(4)]
+        uses_a  = table[0] != table[2] or table[1] != table[3]
+        uses_b  = table[0] != table[1] or table[2] != table[3]
+        monotone = table[0] <= table[1] <= table[3] and table[0] <= table[2] <= table[3]
+        return int(uses_a) + int(uses_b) + table[0] + (0 if monotone else 2)
+
+    def complexity (self, control):
+        """Sum of the field value costs, to list the simplest opcodes first."""
+        values = dict(zip(self.fields, self.alu.fields(int(control))))
+        return sum(self.value_cost(field, values[field]) for field in self.fields)
+
+    def with_field (self, control, field, value):
+        (offset, width) = self.layout[field]
+        return (control & ~(((1 << width) - 1) << offset)) | (value << offset)
+
+    def canonical (self, control, matched):
+        """Set each field whose every value matches to its simplest value, until none changes."""
+        changed = True
+        while changed is True:
+            changed = False
+            for field in self.fields:
+                variants = [self.with_field(control, field, value) for value in range(1 << self.layout[field][1])]
+                if not all(variant in matched for variant in variants):
+                    continue
+                simplest = min(variants, key = lambda variant: (self.value_cost(field, dict(zip(self.fields, self.alu.fields(variant)))[field]), variant))
+                if simplest != control:
+                    control = simplest
+                    changed = True
+        return control
+
+    def distinct (self, controls):
+        """The matching control words, merged where they differ only in fields which do not change the result, simplest first."""
+        matched = set(controls)
+        merged  = set(self.canonical(control, matched) for control in controls)
+        return sorted(merged, key = lambda control: (self.complexity(control), control))
+
+    def search (self, expression, b_expression = None):
+        """Returns the matching control words, simplest first."""
+        controls = numpy.arange(self.control_count, dtype = numpy.uint64)
+        (A, B, R, S) = self.inputs(self.samples, b_expression)
+        target   = self.evaluate(expression, A, B)
+        # Prune with a few random samples first, then check the rest
+        prune    = slice(len(A) - 16, len(A))
+        controls = self.matches(controls, target[prune], A[prune], B[prune], R[prune], S[prune])
+        controls = self.matches(controls, target, A, B, R, S)
+        # Confirm on inputs not used in the search
+        (A, B, R, S) = self.inputs(4 * self.samples, b_expression, edges = False)
+        controls = self.matches(controls, self.evaluate(expression, A, B), A, B, R, S)
+        return sorted((int(control) for control in controls), key = lambda control: (self.complexity(control), control))
+
+    def definition (self, label, control):
+        """An opcode definition line, as in benchmarks/common/opcodes.asm."""
+        values = dict(zip(self.fields, self.alu.fields(control)))
+        names  = [self.names[field][values[field]] for field in self.fields]
+        return "{0:8}opcode  {1}".format(label, "  ".join(names))
+
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Find single opcodes computing an expression of the A and B operands, e.g. \"wrap(a+b)>>1\" or \"sra(a-b, 1)\". wrap() and sra() work on machine words.")
+    arguments.add_argument("expression")
+    arguments.add_argument("--b", dest = "b_expression", default = None, help = "B operand as an expression of a (e.g. \"a\"), instead of independent")
+    arguments.add_argument("--label",   default = "new")
+    arguments.add_argument("--limit",   type = int, default = 10, help = "opcode definitions to print")
+    arguments.add_argument("--samples", type = int, default = 256)
+    arguments.add_argument("--seed",    type = int, default = 0)
+    options = arguments.parse_args()
+
+    search   = Opcode_Search(Configuration(), Operators(), options.samples, options.seed)
+    controls = search.search(options.expression, options.b_expression)
+    distinct = search.distinct(controls)
+    print("# {0}: {1} matching opcode(s) out of {2}, {3} once merged where fields do not change the result".format(options.expression, len(controls), search.control_count, len(distinct)))
+    for control in distinct[:options.limit]:
+        print(search.definition(options.label, control))
@@ -0,0 +1,236 @@
+#! /usr/bin/python3
+
+"""Compact binary execution traces of the Simulator. Each issue slot becomes one
+   fixed-width record, written in chunks which may be zlib-compressed. A sidecar
+   index gives the cycle range, file location, and per-thread record count of
+   each chunk, so a reader only touches the chunks it needs. The reader
+   memory-maps the trace and returns NumPy arrays, which are views into the
+   file when the trace is not compressed."""
+
+import zlib
+import numpy
+from struct         import Struct
+from mmap           import mmap, ACCESS_READ
+from argparse       import ArgumentParser
+from Debug          import Debug
+
+# ---------------------------------------------------------------------------
+
+class Trace_Format (Debug):
+    """Layout of the trace file and of its index. Both are little-endian."""
+
+    magic       = b"OCTTRACE"
+    version     = 1
+    # magic, version, record size, compressed, thread count, chunk records
+    header      = Struct("<8sIIIII")
+    header_size = 64
+    # Unused write slot
+    no_write    = 0xFFFF
+    # Fields ordered widest first, so the record is 32 bytes without padding
+    record      = numpy.dtype([("cycle",        "<u8"),
+                               ("write_data",   "<u8", (2,)),
+                               ("pc",           "<u2"),
+                               ("write_addr",   "<u2", (2,)),
+                               ("thread",       "u1"),
+                               ("flags",        "u1")])
+
+    def __init__ (self, thread_count):
+        Debug.__init__(self)
+        self.thread_count = thread_count
+        self.index  = numpy.dtype([("first_cycle",  "<u8"),
+                                   ("last_cycle",   "<u8"),
+                                   ("first_record", "<u8"),
+                                   ("byte_offset",  "<u8"),
+                                   ("byte_length",  "<u8"),
+                                   ("records",      "<u4"),
+                                   ("threads",      "<u4", (thread_count,))])
+
+    def index_filename (self, filename):
+        return filename + ".idx"
+
+# ---------------------------------------------------------------------------
+
+class Trace_Writer (Debug):
+    """Simulator observer which buffers records and writes them out one chunk at a time."""
+
+    def __init__ (self, filename, configuration, compress = False, chunk_records = 65536, level = 1):
+        Debug.__init__(self)
+        self.filename       = filename
+        self.format         = Trace_Format(configuration.thread_count)
+        self.compress       = compress
+        self.chunk_records  = chunk_records
+        self.level          = level
+        self.buffer         = []
+        self.index          = []
+        self.records        = 0
+        self.file           = open(filename, 'wb')
+        header = self.format.header.pack(Trace_Format.magic, Trace_Format.version, Trace_Format.record.itemsize,
+                                         int(compress), configuration.thread_count, chunk_records)
+        self.file.write(header.ljust(Trace_Format.header_size, b"\0"))
+        self.offset         = Trace_Format.header_size
+
+    def observe (self, simulator, issue):
+        writes = issue.writes
+        no_write = Trace_Format.no_write
+        if len(writes) == 0:
+            addresses = (no_write, no_write)
+            data      = (0, 0)
+        elif len(writes) == 1:
+            addresses = (writes[0][0], no_write)
+            data      = (writes[0][1], 0)
+        else:
+            addresses = (writes[0][0], writes[1][0])
+            data      = (writes[0][1], writes[1][1])
+        self.buffer.append((issue.cycle, data, issue.pc, addresses, issue.thread, issue.flags))
+        if len(self.buffer) >= self.chunk_records:
+            self.flush()
+
+    def flush (self):
+        """Write out the buffered records as one chunk, and index it."""
+        if len(self.buffer) == 0:
+            return
+        chunk = numpy.array(self.buffer, dtype = Trace_Format.record)
+        data  = chunk.tobytes()
+        if self.compress is True:
+            data = zlib.compress(data, self.level)
+        entry = numpy.zeros(1, dtype = self.format.index)[0]
+        entry["first_cycle"]  = chunk["cycle"][0]
+        entry["last_cycle"]   = chunk["cycle"][-1]
+        entry["first_record"] = self.records
+        entry["byte_offset"]  = self.offset
+        entry["byte_length"]  = len(data)
+        entry["records"]      = len(chunk)
+        entry["threads"]      = numpy.bincount(chunk["thread"], minlength = self.format.thread_count)[:self.format.thread_count]
+        self.index.append(entry)
+        self.file.write(data)
+        self.offset  += len(data)
+        self.records += len(chunk)
+        self.buffer   = []
+
+    def close (self):
+        self.flush()
+        self.file.close()
+        index = numpy.array(self.index, dtype = self.format.index)
+        with open(self.format.index_filename(self.filename), 'wb') as f:
+            numpy.save(f, index)
+
+# ---------------------------------------------------------------------------
+
+class Trace_Reader (Debug):
+    """Memory-maps a trace and its index. Selections by cycle range return
+       views into the file for uncompressed traces. Selections of one thread
+       are strided views whenever the threads take turns, as in the barrel."""
+
+    def __init__ (self, filename):
+        Debug.__init__(self)
+        self.filename = filename
+        self.file     = open(filename, 'rb')
+        self.map      = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        (magic, version, record_size, compressed, thread_count, chunk_records) = Trace_Format.header.unpack_from(self.map, 0)
+        if magic != Trace_Format.magic or version != Trace_Format.version or record_size != Trace_Format.record.itemsize:
+            print("{0} is not a version {1} Octavo trace.".format(filename, Trace_Format.version))
+            self.ask_for_debugger()
+        self.compressed     = compressed == 1
+        self.thread_count   = thread_count
+        self.chunk_records  = chunk_records
+        self.format         = Trace_Format(thread_count)
+        self.index          = numpy.load(self.format.index_filename(filename), mmap_mode = 'r')
+
+    def __len__ (self):
+        if len(self.index) == 0:
+            return 0
+        return int(self.index["first_record"][-1] + self.index["records"][-1])
+
+    def close (self):
+        self.index = None
+        self.map.close()
+        self.file.close()
+
+    def chunk (self, number):
+        """The records of one chunk."""
+        entry = self.index[number]
+        if self.compressed is False:
+            return numpy.frombuffer(self.map, dtype = Trace_Format.record, count = int(entry["records"]), offset = int(entry["byte_offset"]))
+        start = int(entry["byte_offset"])
+        data  = zlib.decompress(self.map[start:start + int(entry["byte_length"])])
+        return numpy.frombuffer(data, dtype = Trace_Format.record)
+
+    def chunk_numbers (self, first_cycle = None, last_cycle = None, thread = None):
+        """Chunks which may hold records in the cycle range and thread."""
+        first = 0
+        last  = len(self.index)
+        if first_cycle is not None:
+            first = int(numpy.searchsorted(self.index["last_cycle"], first_cycle, side = 'left'))
+        if last_cycle is not None:
+            last  = int(numpy.searchsorted(self.index["first_cycle"], last_cycle, side = 'right'))
+        numbers = range(first, max(first, last))
+        if thread is not None:
+            numbers = [number for number in numbers if self.index["threads"][number][thread] > 0]
+        return numbers
+
+    def chunks (self, first_cycle = None, last_cycle = None, thread = None):
+        """Iterate over the selected records one chunk at a time, to process traces larger than memory."""
+        for number in self.chunk_numbers(first_cycle, last_cycle, thread):
+            yield self.narrow(self.chunk(number), first_cycle, last_cycle, thread)
+
+    def select (self, first_cycle = None, last_cycle = None, thread = None):
+        """All records in the inclusive cycle range, optionally for one thread only."""
+        numbers = self.chunk_numbers(first_cycle, last_cycle)
+        if len(numbers) == 0:
+            return numpy.zeros(0, dtype = Trace_Format.record)
+        if self.compressed is False:
+            first   = self.index[numbers[0]]
+            records = int(self.index["first_record"][numbers[-1]] + self.index["records"][numbers[-1]] - first["first_record"])
+            view    = numpy.frombuffer(self.map, dtype = Trace_Format.record, count = records, offset = int(first["byte_offset"]))
+        else:
+            view    = numpy.concatenate([self.chunk(number) for number in numbers])
+        return self.narrow(view, first_cycle, last_cycle, thread)
+
+    def narrow (self, records, first_cycle, last_cycle, thread):
+        """Slice records down to the cycle range (cycles are increasing), then to one thread."""
+        cycles = records["cycle"]
+        start  = 0
+        end    = len(records)
+        if first_cycle is not None:
+            start = int(numpy.searchsorted(cycles, first_cycle, side = 'left'))
+        if last_cycle is not None:
+            end   = int(numpy.searchsorted(cycles, last_cycle, side = 'right'))
+        records = records[start:end]
+        if thread is None or len(records) == 0:
+            return records
+        threads = records["thread"]
+        matches = numpy.flatnonzero(threads == thread)
+        if len(matches) == 0:
+            return records[0:0]
+        # Threads taking turns: a strided view avoids the copy of a boolean selection
+        strided = records[matches[0]::self.thread_count]
+        if len(strided) == len(matches) and numpy.all(strided["thread"] == thread):
+            return strided
+        return records[matches]
+
+    def column (self, name, first_cycle = None, last_cycle = None, thread = None):
+        return self.select(first_cycle, last_cycle, thread)[name]
+
+    def flags (self, flag, first_cycle = None, last_cycle = None, thread = None):
+        """Boolean array of one Issue flag bit over the selected records."""
+        return (self.column("flags", first_cycle, last_cycle, thread) & flag) != 0
+
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description = "Summarize an execution trace, or print some of its records.")
+    arguments.add_argument("trace")
+    arguments.add_argument("--first", type = int, default = None, help = "first cycle to print")
+    arguments.add_argument("--last",  type = int, default = None, help = "last cycle to print")
+    arguments.add_argument("--thread", type = int, default = None)
+    options = arguments.parse_args()
+
+    reader = Trace_Reader(options.trace)
+    print("{0}: {1} records in {2} chunks, compressed: {3}".format(options.trace, len(reader), len(reader.index), reader.compressed))
+    if len(reader.index) > 0:
+        print("Cycles {0} to {1}".format(reader.index["first_cycle"][0], reader.index["last_cycle"][-1]))
+        print("Records per thread: {0}".format([int(count) for count in reader.index["threads"].sum(axis = 0)]))
+    if options.first is not None or options.last is not None or options.thread is not None:
+        for record in reader.select(options.first, options.last, options.thread):
+            writes = ["{0}:{1:x}".format(address, data) for address, data in zip(record["write_addr"], record["write_data"]) if address != Trace_Format.no_write]
+            print("{0} {1} {2} {3} {4}".format(record["cycle"], record["thread"], record["pc"], record["flags"], " ".join(writes)))
@@ -1,5 +1,6 @@
 #! /usr/bin/python3
 
+from re        import fullmatch
 from bitstring import BitArray
 
 
@@ -9,6 +10,59 @@ class Utility:
     def __init__ (self):
         pass
 
+    def parse_packing (self, value, word_width = None):
+        """(lanes, width) of a packed literal "LANESxWIDTH:..." or array prefix "LANESxWIDTH:", else None.
+           Given the memory word width (Configuration.memory_width_bits), the lanes must fit in it."""
+        if type(value) is not str:
+            return None
+        match = fullmatch(r"(\d+)x(\d+):.*", value)
+        if match is None:
+            return None
+        lanes = int(match.group(1))
+        width = int(match.group(2))
+        if lanes < 1 or width < 2:
+            print("Packed literal {0}: needs at least 1 lane of at least 2 bits, not {1} of {2}.".format(value, lanes, width))
+            self.ask_for_debugger()
+        if word_width is not None and lanes * width > word_width:
+            print("Packed literal {0}: {1} lanes of {2} bits do not fit in a {3}-bit word.".format(value, lanes, width, word_width))
+            self.ask_for_debugger()
+        return (lanes, width)
+
+    def pack_lanes (self, values, packing, literal):
+        """Pack lane values into one word, lane 0 in the lowest bits. The top bit of each
+           lane is its guard bit, left clear so an addition carries into it, not into the
+           next lane. A single value goes into every lane."""
+        (lanes, width) = packing
+        if len(values) == 1:
+            values = values * lanes
+        if len(values) != lanes:
+            print("Packed literal {0}: {1} values for {2} lanes.".format(literal, len(values), lanes))
+            self.ask_for_debugger()
+        word = 0
+        for lane, value in enumerate(values):
+            if type(value) is not int or value < 0 or value >= 2**(width - 1):
+                print("Packed literal {0}: lane value {1} does not fit in the {2} bits below the guard bit of a {3}-bit lane.".format(literal, value, width - 1, width))
+                self.ask_for_debugger()
+            word |= value << (lane * width)
+        return word
+
+    def parse_packed (self, value):
+        """Value of a packed literal, e.g. 4x9:1,2,3,4 (lane 0 first), 4x9:1 (in every lane),
+           or 4x9:guards (only the guard bits set). None if not a packed literal."""
+        packing = self.parse_packing(value)
+        if packing is None:
+            return None
+        (lanes, width) = packing
+        values = value.split(":", 1)[1]
+        if values == "guards":
+            return sum(1 << (lane * width + width - 1) for lane in range(lanes))
+        try:
+            values = [int(entry, 0) for entry in values.split(",")]
+        except ValueError:
+            print("Packed literal {0}: lane values must be comma-separated integers, or guards.".format(value))
+            self.ask_for_debugger()
+        return self.pack_lanes(values, packing, value)
+
     def try_int (self, value):
         """Wrapper around int() to deal with non-numeric strings and provide debug info."""
         if value is None:
@@ -20,6 +74,9 @@ class Utility:
         try:
             value = int(value, 0)
         except ValueError:
+            packed = self.parse_packed(value)
+            if packed is not None:
+                return packed
             # Assume it's a label string. Leave it alone and pass it back out for later resolution.
             pass
         except TypeError:
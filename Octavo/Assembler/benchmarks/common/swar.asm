@@ -0,0 +1,11 @@
+
+# SWAR (SIMD Within A Register) opcodes, for words packed into lanes, e.g. 4x9:1,2,3,4
+# The top bit of each lane is its guard bit. Kept clear, it catches the carry of an
+# add in its lane, so plain add/sub work per lane. Masking before a shift keeps
+# each lane's bits from crossing into the next lane.
+#               split?      shift               d3              +/-                 dual?   d2              d1              Select
+
+and     opcode  split_no    shift_none          a               addsub_a_plus_b     simple  a_and_b         a_and_b         select_r # a&b, e.g. clear the guard bits with b = 4x9:255
+or      opcode  split_no    shift_none          a               addsub_a_plus_b     simple  a_or_b          a_or_b          select_r # a|b, e.g. set the guard bits before a per-lane sub with b = 4x9:guards
+and/2u  opcode  split_no    shift_right         a               addsub_a_plus_b     simple  a_and_b         a_and_b         select_r # (a&b) >> 1, per-lane shift right with b = 4x9:254 (no lane bit 0)
+and*2   opcode  split_no    shift_left          a               addsub_a_plus_b     simple  a_and_b         a_and_b         select_r # (a&b) << 1, per-lane shift left with b = 4x9:127 (no lane top data bit)
@@ -0,0 +1,38 @@
+
+# Output 0, 2, 4, ... The jmp to body is always taken, so given a profile of
+# a run, --profile copies the first body instruction into its origin slot.
+# Its origin starts the loop, so the loop jump must reach the copy, and the
+# branch on it, not skip them.
+
+# Common library of definitions
+include ../common/opcodes.asm
+include ../common/conditions.asm
+
+# Shared variables
+
+two         shared      2
+
+out         port        A 0
+
+# Thread-private variables
+
+threads 0 1 2 3 4 5 6 7
+
+x           private     0
+t           private     0
+
+# Code
+
+preload add
+
+start   init    body
+        init    loop
+loop    add     t           t           0
+        jmp     auto        body
+        add     out         0           two         # never runs
+body    add     out         x           0           # output x
+        add     x           x           two         # x += 2
+        jmp     unpredicted loop
+
+# Set starting point (PC) for each thread
+program_counter start start start start start start start start
@@ -13,8 +13,8 @@ include ../common/conditions.asm
 # N-1 for N loops
 seeds_len   shared  99
 lsb_mask    shared  0xFFFFFFFFE
-mult_A      port    A 0
-mult_B      port    B 0
+mult_A      port    A 0 16      # Product ready 16 cycles (2 thread instructions) after a write
+mult_B      port    B 0 16
 seed_out    port    A 3
 
 # Private Variables
@@ -0,0 +1,57 @@
+
+# Output each array element, and odd elements twice.
+# Five branches need the four Branch Detector entries at once, so this only
+# assembles with --allocate-liveness, which re-initializes a branch just before
+# its origin. The bsa branches test the result of the instruction before their
+# origin, so they must not be the ones re-initialized there.
+
+# Common library of definitions
+include ../common/opcodes.asm
+include ../common/conditions.asm
+
+# Shared variables
+
+# Each branch init load reads its mask from its own memory
+odd_mask    shared      0xFFFFFFFFE
+even_mask   shared      0xFFFFFFFFE
+lsb_set     shared      1
+# N-1 for N passes
+values_len  shared      7
+# Never reaches zero
+forever     shared      1000000
+
+out         port        A 0
+
+# Thread-private variables
+
+threads 0 1 2 3 4 5 6 7
+
+values      private     1 2 3 4 5 6 7 8
+values_rd   pointer     values      1       0
+x           private     0
+t           private     0
+
+# Code
+
+preload add
+
+start   init    next
+        init    odd
+        init    never
+restart init    values_rd
+        init    restart
+        add     t           t           0
+        ctz     unpredicted forever     never       # never taken
+never   add     t           t           0
+        jmp     unpredicted next
+odd     add     out         x           0           # odd x: output it again
+ev      add     t           t           0
+        ctz     unpredicted values_len  restart     # start over after the whole array
+next    init    ev
+        add     x           values_rd   0           # x = next element
+        add     out         x           0           # output x
+        bsa     unpredicted lsb_set odd_mask odd        # odd x
+        bsa     unpredicted 0 even_mask ev              # even x
+
+# Set starting point (PC) for each thread
+program_counter start start start start start start start start
@@ -0,0 +1,77 @@
+
+# Output each array element, and odd elements twice.
+# Seventeen opcodes are used in the loop, one more than the Opcode Decoder
+# slots, so this only assembles with --schedule-opcodes, which loads one of
+# them in the loop. The bsa branch at the zz instruction tests the result of
+# the instruction before it, so the load must not go in between.
+
+# Common library of definitions
+include ../common/opcodes.asm
+include ../common/conditions.asm
+
+# Filler opcodes, each used once per pass
+f1     opcode  split_no    shift_none          a_and_b         addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f2     opcode  split_no    shift_none          a_and_not_b     addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f3     opcode  split_no    shift_none          a               addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f4     opcode  split_no    shift_none          not_a_and_b     addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f5     opcode  split_no    shift_none          a_xor_b         addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f6     opcode  split_no    shift_none          a_nor_b         addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f7     opcode  split_no    shift_none          a_xnor_b        addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f8     opcode  split_no    shift_none          not_b           addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f9     opcode  split_no    shift_none          a_or_not_b      addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f10    opcode  split_no    shift_none          not_a           addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f11    opcode  split_no    shift_none          not_a_or_b      addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f12    opcode  split_no    shift_none          a_nand_b        addsub_a_plus_b     simple  always_zero     always_zero     select_r
+f13    opcode  split_no    shift_none          always_one      addsub_a_plus_b     simple  always_zero     always_zero     select_r
+# a+b, like add
+zz      opcode  split_no    shift_none          a_or_b          addsub_a_plus_b     simple  always_zero     always_zero     select_r
+
+# Shared variables
+
+lsb_mask    shared      0xFFFFFFFFE
+# N-1 for N passes
+values_len  shared      7
+
+out         port        A 0
+
+# Thread-private variables
+
+threads 0 1 2 3 4 5 6 7
+
+values      private     1 2 3 4 5 6 7 8
+values_rd   pointer     values      1       0
+x           private     0
+t           private     0
+
+# Code
+
+start   init    next
+        init    ev
+restart init    values_rd
+        init    restart
+next    add     t           t           0
+        f1      t           t           0
+        f2      t           t           0
+        f3      t           t           0
+        f4      t           t           0
+        f5      t           t           0
+        f6      t           t           0
+        f7      t           t           0
+        f8      t           t           0
+        f9      t           t           0
+        f10     t           t           0
+        f11     t           t           0
+        f12     t           t           0
+        f13     t           t           0
+        sub     t           t           0
+        add/2u  t           t           0
+        add     x           values_rd   0           # x = next element
+        zz      out         x           0           # output x
+        bsa     unpredicted 0 lsb_mask ev           # even x: output it once
+        add     out         x           0           # odd x: output it again
+ev      add     t           t           0
+        ctz     unpredicted values_len  restart     # start over after the whole array
+        jmp     unpredicted next
+
+# Set starting point (PC) for each thread
+program_counter start start start start start start start start